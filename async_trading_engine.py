@@ -0,0 +1,87 @@
+"""Single event loop alternative to running one TradingThread per ticker.
+
+Every (strategy, ticker) pair runs as a coroutine on the same loop that consumes
+the Alpaca stream, so new trades wake their traders without any thread handoff."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from trader import Trader
+from utilities import print_with_lock
+
+class AsyncTrader(Trader):
+    """Coroutine flavor of TradingThread. Order placement still blocks on the
+    RH api, so opening and closing positions runs on the engine's executor."""
+
+    async def run(self, executor):
+        self.init_time = self.market_time.now()
+        print_with_lock("trader {} began".format(self.ticker))
+        loop = asyncio.get_running_loop()
+
+        while self.market_time.is_time_left_to_trade():
+            await self.looking_to_buy(loop, executor)
+
+            # same as the threaded version, if we ran out of resources we're done
+            if self.position is None:
+                return
+
+            await self.looking_to_sell(loop, executor)
+
+        self.generate_report()
+
+    async def wait_for_new_trade(self):
+        """Suspends until a new trade comes in for this ticker. Returns False if
+        TICK_TIMEOUT passed first, so callers can recheck the time left."""
+        return self.record_trade_seen(await self.market_data.wait_for_trade_for_ticker_async(self.ticker, self.last_trade_seen, self.TICK_TIMEOUT))
+
+    async def looking_to_buy(self, loop, executor):
+        while self.wants_to_buy():
+            if not await self.wait_for_new_trade():
+                continue
+            if self.should_buy_on_tick():
+                await loop.run_in_executor(executor, self.open_position)
+
+    async def looking_to_sell(self, loop, executor):
+        while self.wants_to_sell():
+            if not await self.wait_for_new_trade():
+                continue
+            if self.should_close_position():
+                await loop.run_in_executor(executor, self.close_position)
+
+        if self.position is not None:
+            await loop.run_in_executor(executor, self.close_position)
+
+
+class AsyncTradingEngine:
+    """Runs the stream and every AsyncTrader on one event loop until the end of the day."""
+
+    def __init__(self, market_data, market_time, traders, order_workers=32):
+        self.market_data = market_data
+        self.market_time = market_time
+        self.traders = traders
+        self.order_workers = order_workers
+
+    async def keep_market_time_updated(self):
+        """Sleeps until the close, then updates the market time so everyone sees it.
+        Same as MarketTime.wait_until_close, but without blocking the event loop."""
+        while not self.market_time.closed.is_set():
+            seconds_left = self.market_time.get_seconds_until_close()
+            if seconds_left > 0:
+                await asyncio.sleep(min(seconds_left, self.market_time.MAX_SLEEP))
+            self.market_time.update()
+
+    async def run_async(self):
+        stream_task = asyncio.ensure_future(self.market_data.run_stream_async())
+        with ThreadPoolExecutor(max_workers=self.order_workers) as executor:
+            try:
+                await asyncio.gather(self.keep_market_time_updated(), *[trader.run(executor) for trader in self.traders])
+            finally:
+                stream_task.cancel()
+                try:
+                    await stream_task
+                except asyncio.CancelledError:
+                    pass
+
+    def run(self):
+        """Blocks until every trader has finished for the day."""
+        asyncio.run(self.run_async())
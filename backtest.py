@@ -0,0 +1,215 @@
+"""Deterministic backtesting for the traderbot.
+
+Replays recorded or synthetic trades through the same MarketData callback path the
+Alpaca stream uses, runs the real strategies and sell logic on a simulated clock,
+and prints the same EOD reports as a live day. Everything happens on one thread,
+one trade at a time, so the same trades and config always give the same results."""
+
+import sys
+import csv
+import time
+import random
+import asyncio
+import pathlib
+from datetime import datetime, timedelta
+from collections import namedtuple
+
+from trader import Trader
+from position import OpenBacktestPosition
+from singletons.market_data import MarketData
+from singletons.market_time import MarketTime
+from singletons.buying_power import BuyingPower
+from singletons.trade_capper import TradeCapper
+from singletons.reports import Reports
+from strategies.strategy_factory import strategy_factory, enforce_strategy_dict_legal
+from utilities import print_with_lock, enforce_keys_in_dict, read_config
+from traderbot_exception import ConfigException
+from tick_store import TickReader
+
+CONFIG_FILENAME = "config.json"
+
+# used when the config doesn't set a budget, there is no RH account to ask
+DEFAULT_BUDGET = 1000.0
+
+# just enough of an alpaca trade for TickerData.trade_update_callback
+BacktestTrade = namedtuple('BacktestTrade', ['price', 'timestamp'])
+
+class SimulatedClock:
+    """Stands in for datetime.now during a backtest. Each replayed trade moves it forward."""
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def set_ns(self, timestamp_ns):
+        self.current = datetime.fromtimestamp(timestamp_ns/1e9)
+
+
+class BacktestTrader(Trader):
+    """Steps the TradingThread state machine once per replayed trade instead of waiting on them."""
+
+    def make_position(self, budget):
+        return OpenBacktestPosition(self.ticker, budget, self.market_data)
+
+    def on_trade(self):
+        if self.position is None:
+            if self.wants_to_buy() and self.should_buy_on_tick():
+                self.open_position()
+        elif self.should_close_position():
+            self.close_position()
+
+    def finish(self):
+        """Closes out anything still open at the end of the replay and files our report."""
+        if self.position is not None:
+            self.close_position()
+        self.generate_report()
+
+
+def load_trades_csv(path):
+    """Returns a list of (timestamp_ns, ticker, price) from a csv file with the header
+    timestamp,ticker,price, sorted by timestamp."""
+    with open(path, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        if header != ['timestamp', 'ticker', 'price']:
+            raise ConfigException("{} must start with the header timestamp,ticker,price".format(path))
+        trades = [(int(timestamp), ticker, float(price)) for timestamp, ticker, price in reader]
+    trades.sort(key=lambda trade: trade[0])
+    return trades
+
+def load_trades_recording(path):
+    """Returns a TickReader over a day recorded with the "record-trades" config.
+    Iterating it yields (timestamp_ns, ticker, price) in the order the trades came
+    off the stream, a chunk of the memmapped columns at a time, so the day never
+    has to fit in RAM. Pass its get_first_prices() and get_time_range() to
+    run_backtest, stream order isn't quite time order across tickers."""
+    return TickReader(path)
+
+def generate_synthetic_trades(tickers, trades_per_ticker, seed=0, day=None):
+    """Returns a list of (timestamp_ns, ticker, price) with a random walk per ticker
+    spread across a 9:30-16:00 trading day, sorted by timestamp."""
+    rng = random.Random(seed)
+    if day is None:
+        day = datetime.now().date()
+    open_ns = int(datetime(day.year, day.month, day.day, 9, 30).timestamp()*1e9)
+    day_ns = int(timedelta(hours=6, minutes=30).total_seconds()*1e9)
+    trades = []
+    for ticker in tickers:
+        price = rng.uniform(10, 500)
+        timestamps = sorted(open_ns + rng.randrange(day_ns) for _ in range(trades_per_ticker))
+        for timestamp in timestamps:
+            price = max(0.01, price*(1 + rng.gauss(0, 0.0005)))
+            trades.append((timestamp, ticker, round(price, 4)))
+    trades.sort(key=lambda trade: trade[0])
+    return trades
+
+def run_backtest(config, trades, initial_prices=None, time_range=None):
+    """Replays trades (an iterable of (timestamp_ns, ticker, price), e.g. a list sorted
+    by timestamp) in order against the strategies in config, returning the filled in
+    Reports object. Pass initial_prices (the first price of every ticker, by ticker)
+    if you already have them to save a pass over the trades, and time_range (the
+    earliest and latest timestamp_ns) unless they're trades[0]'s and trades[-1]'s."""
+    history_len = config.get("history-len", 16)
+    trend_len = config.get("trend-len", 3)
+    budget = config.get("budget", DEFAULT_BUDGET)
+
+    # the first price seen for each ticker seeds its market data, like
+    # the latest price from RH does for a live day
+    if initial_prices is None:
+        initial_prices = {}
+        for _, ticker, price in trades:
+            if ticker not in initial_prices:
+                initial_prices[ticker] = price
+    tickers = list(initial_prices.keys())
+
+    market_data = MarketData(tickers, None, None, history_len, trend_len, initial_data=[initial_prices[ticker] for ticker in tickers])
+    if time_range is None:
+        time_range = (trades[0][0], trades[-1][0])
+    clock = SimulatedClock(datetime.fromtimestamp(time_range[0]/1e9))
+    market_time = MarketTime(datetime.fromtimestamp(time_range[1]/1e9), clock.now)
+    buying_power = BuyingPower(config["spend-percent"]/100.0, config.get("instant", False), budget, account_buying_power=budget)
+    trade_capper = TradeCapper(config.get("max-trades-per-day", None))
+    reports = Reports()
+
+    traders_for_ticker = { ticker: [] for ticker in tickers }
+    for st in config["strategies"]:
+        for ticker in st['tickers']:
+            if ticker not in traders_for_ticker:
+                print_with_lock("no trades to replay for {}, skipping it".format(ticker))
+                continue
+            strategy = strategy_factory(st['strategy'], market_data, ticker)
+            if not strategy.is_relevant():
+                strategy.release()
+                continue
+            traders_for_ticker[ticker].append(BacktestTrader(ticker, market_data, market_time, buying_power, trade_capper,
+                strategy, reports, config["take-profit-percent"]/100.0, config["max-loss-percent"]/100.0))
+
+    ticker_datas = { ticker: market_data.get_ticker_data_for_ticker(ticker) for ticker in tickers }
+    async def replay():
+        # the market time only needs refreshing once per simulated second, same as a live day
+        last_update_second = 0
+        for timestamp, ticker, price in trades:
+            clock.set_ns(timestamp)
+            if timestamp - last_update_second >= 1000000000:
+                market_time.update()
+                last_update_second = timestamp
+            await ticker_datas[ticker].trade_update_callback(BacktestTrade(price, timestamp))
+            for trader in traders_for_ticker[ticker]:
+                trader.on_trade()
+    asyncio.run(replay())
+    market_time.update()
+
+    for traders in traders_for_ticker.values():
+        for trader in traders:
+            trader.finish()
+    return reports
+
+def get_backtest_config():
+    """Return the json dictionary found in config.json, throwing otherwise.
+    Unlike a live run, no credentials are needed."""
+    config = read_config(CONFIG_FILENAME)
+    enforce_keys_in_dict(["max-loss-percent", "take-profit-percent", "spend-percent", "strategies"], config)
+    for st in config["strategies"]:
+        enforce_keys_in_dict(['strategy', 'tickers'], st)
+        enforce_strategy_dict_legal(st['strategy'])
+    return config
+
+def usage():
+    print("usage: python3 backtest.py <trades.csv>")
+    print("       python3 backtest.py <recording dir, e.g. recordings/2021-03-01>")
+    print("       python3 backtest.py --synthetic <trades per ticker> [seed]")
+    print("replays the trades against the strategies in config.json and prints the EOD reports")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or "--help" in sys.argv or "-h" in sys.argv:
+        usage()
+    config = get_backtest_config()
+
+    load_start = time.perf_counter()
+    initial_prices = None
+    time_range = None
+    if sys.argv[1] == "--synthetic":
+        if len(sys.argv) < 3:
+            usage()
+        tickers = list(set(ticker for st in config["strategies"] for ticker in st['tickers']))
+        seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        trades = generate_synthetic_trades(sorted(tickers), int(sys.argv[2]), seed)
+    elif pathlib.Path(sys.argv[1]).is_dir():
+        trades = load_trades_recording(sys.argv[1])
+        if len(trades) != 0:
+            initial_prices = trades.get_first_prices()
+            time_range = trades.get_time_range()
+    else:
+        trades = load_trades_csv(sys.argv[1])
+    if len(trades) == 0:
+        raise ConfigException("no trades to replay")
+    replay_start = time.perf_counter()
+
+    reports = run_backtest(config, trades, initial_prices, time_range)
+    replay_end = time.perf_counter()
+
+    reports.print_eod_reports()
+    print_with_lock("loaded {} trades in {:0.2f}s, replayed them in {:0.2f}s".format(
+        len(trades), replay_start - load_start, replay_end - replay_start))
@@ -0,0 +1,120 @@
+"""Structured, asynchronous logging for the traderbot.
+
+log.info("opened position", ticker="AAPL", price=123.4) costs the caller a level
+check and an append to a deque: no lock, no formatting, no I/O. A background
+thread wakes every FLUSH_INTERVAL seconds, formats whatever has been logged and
+writes it out in one go, either as plain text (the message, then any fields as
+key=value) or as JSON lines.
+
+Per tick messages go at DEBUG, which is off by default. Hot paths check
+log.debug_enabled before logging, so a disabled message doesn't even build its
+arguments."""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = { DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error" }
+LEVELS = { name: level for level, name in LEVEL_NAMES.items() }
+
+class Logger:
+    """Threadsafe logger, see the module docstring. Should be a singleton (log, below)."""
+    # how often the writer thread wakes up to write, in seconds
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(self, level=INFO, json_lines=False, path=None):
+        # appending to a deque is threadsafe without a lock
+        self.pending = deque()
+        # only held by whoever is writing, never by a caller of log()
+        self.write_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.writer_thread = None
+        self.file = None
+        self.configure(level, json_lines, path)
+        # a forked child gets our deque but not our writer thread
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    def configure(self, level=INFO, json_lines=False, path=None):
+        """Sets the lowest level that gets logged, whether to write JSON lines instead of
+        plain text, and a file to append to instead of stdout."""
+        self.flush()
+        with self.write_lock:
+            self.level = level
+            self.debug_enabled = level <= DEBUG
+            self.json_lines = json_lines
+            if self.file is not None:
+                self.file.close()
+            self.file = open(path, 'a') if path is not None else None
+
+    def reset_after_fork(self):
+        self.pending = deque()
+        self.write_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.writer_thread = None
+
+    def start_writer(self):
+        with self.start_lock:
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.write_forever, daemon=True)
+                self.writer_thread.start()
+
+    def write_forever(self):
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            self.flush()
+
+    def log(self, level, msg, **fields):
+        if level < self.level:
+            return
+        self.pending.append((time.time(), level, threading.current_thread().name, msg, fields))
+        if self.writer_thread is None:
+            self.start_writer()
+
+    def debug(self, msg, **fields):
+        self.log(DEBUG, msg, **fields)
+
+    def info(self, msg, **fields):
+        self.log(INFO, msg, **fields)
+
+    def warning(self, msg, **fields):
+        self.log(WARNING, msg, **fields)
+
+    def error(self, msg, **fields):
+        self.log(ERROR, msg, **fields)
+
+    def format(self, timestamp, level, thread, msg, fields):
+        if self.json_lines:
+            record = { "ts": timestamp, "level": LEVEL_NAMES[level], "thread": thread, "msg": msg }
+            record.update(fields)
+            return json.dumps(record, default=str) + "\n"
+        if len(fields) == 0:
+            return msg + "\n"
+        return "{} {}\n".format(msg, " ".join("{}={}".format(key, value) for key, value in fields.items()))
+
+    def flush(self):
+        """Writes everything logged so far. Called by the writer thread, at exit, and by
+        anyone who needs the output to be out before going on."""
+        with self.write_lock:
+            pending = self.pending
+            # only what's there now, so a busy logger can't keep us here forever
+            count = len(pending)
+            if count == 0:
+                return
+            lines = [self.format(*pending.popleft()) for _ in range(count)]
+            # looked up every time so redirect_stdout works
+            out = self.file if self.file is not None else sys.stdout
+            out.write("".join(lines))
+            out.flush()
+
+
+log = Logger()
+atexit.register(log.flush)
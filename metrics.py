@@ -0,0 +1,195 @@
+"""Low overhead latency metrics for the hot paths, served as Prometheus text.
+
+Every metric is a set of LatencyHistograms, one per label (usually a ticker),
+with log-linear buckets in the style of HDR histograms: 16 buckets per power of
+two, so a recorded value is known to within about 6%, from 1ns up to MAX_VALUE.
+Recording one is a bit_length, a shift and a list increment.
+
+Metrics are off unless enabled (the bot enables them when "metrics-port" is set),
+and hot paths check metrics.enabled, or whether they were handed a histogram,
+before timing anything, so when they're off they cost one attribute read. When
+they're on, only one in sample_every trades (and the decision made on it) is
+timed, since a pair of clock reads and two recordings cost about as much as the
+rest of the trade callback. Rarer things, like orders and lock waits, are all timed."""
+
+import time
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from utilities import print_with_lock
+
+# every bucket below 2**SMALL_BITS is exactly one ns wide, every power of two
+# above that is split into 2**(SMALL_BITS-1) buckets
+SMALL_BITS = 5
+SUB_BUCKETS = 1 << (SMALL_BITS-1)
+
+# anything longer than ~18 minutes is recorded as ~18 minutes
+MAX_VALUE = (1 << 40) - 1
+NUM_BUCKETS = ((MAX_VALUE.bit_length() - SMALL_BITS) + 1)*SUB_BUCKETS + SUB_BUCKETS
+
+def get_bucket_index(value):
+    shift = value.bit_length() - SMALL_BITS
+    if shift <= 0:
+        return value
+    return shift*SUB_BUCKETS + (value >> shift)
+
+def get_bucket_bounds(index):
+    """Returns (lowest, highest) value that lands in bucket index."""
+    if index < 2*SUB_BUCKETS:
+        return index, index
+    shift = index//SUB_BUCKETS - 1
+    mantissa = index - shift*SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+class LatencyHistogram:
+    """Counts of durations in ns, see the module docstring. Meant to have one
+    writer; concurrent writers can very occasionally lose a count."""
+    def __init__(self):
+        self.counts = [0]*NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        if value > MAX_VALUE:
+            value = MAX_VALUE
+        elif value < 0:
+            value = 0
+        shift = value.bit_length() - SMALL_BITS
+        self.counts[value if shift <= 0 else shift*SUB_BUCKETS + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+
+    def get_percentiles(self, quantiles):
+        """Returns the value at each of quantiles (sorted, each in [0, 1]) as the middle
+        of the bucket it lands in, or 0 for every one if nothing was recorded."""
+        counts = list(self.counts)
+        count = sum(counts)
+        if count == 0:
+            return [0]*len(quantiles)
+        results = []
+        seen = 0
+        index = 0
+        for quantile in quantiles:
+            target = max(1, quantile*count)
+            while seen + counts[index] < target:
+                seen += counts[index]
+                index += 1
+            low, high = get_bucket_bounds(index)
+            results.append((low + high)//2)
+        return results
+
+
+class Metrics:
+    """Threadsafe registry of every LatencyHistogram, by (metric name, label).
+    Should be a singleton (metrics, below)."""
+    # described in the prometheus output, add any new metric here
+    DESCRIPTIONS = {
+        "trade_callback": "time spent handling a trade in the stream callback, by ticker (sampled)",
+        "trade_age": "time from a trade's exchange timestamp to its stream callback, by ticker (sampled)",
+        "decision": "time spent in Strategy.should_buy_on_tick, by ticker (sampled)",
+        "tick_to_decision": "time from a trade's stream callback to the strategy deciding on it, by ticker (sampled)",
+        "order_fill": "time from placing an order to it filling (or being given up on), by ticker",
+        "lock_wait": "time spent waiting to acquire a shared lock, by lock",
+    }
+    QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = 1
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.server = None
+
+    def enable(self, sample_every=32):
+        """Turns metrics on, timing one in sample_every trades on the tick path."""
+        self.sample_every = sample_every
+        self.enabled = True
+
+    def get_histogram(self, name, label):
+        histogram = self.histograms.get((name, label), None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault((name, label), LatencyHistogram())
+        return histogram
+
+    def record(self, name, label, value):
+        self.get_histogram(name, label).record(value)
+
+    @contextmanager
+    def timed(self, name, label):
+        """Records how long the with block takes under (name, label), if metrics are on."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, label, time.perf_counter_ns() - start)
+
+    @contextmanager
+    def locked(self, lock, label):
+        """Same as with lock:, but records how long acquiring it took as the lock_wait
+        of label, if metrics are on."""
+        if self.enabled:
+            start = time.perf_counter_ns()
+            lock.acquire()
+            self.record("lock_wait", label, time.perf_counter_ns() - start)
+        else:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text format, as summaries in seconds."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        lines = []
+        described = set()
+        for (name, label), histogram in histograms:
+            metric = "traderbot_{}_seconds".format(name)
+            label_name = "lock" if name == "lock_wait" else "ticker"
+            if name not in described:
+                described.add(name)
+                lines.append("# HELP {} {}".format(metric, self.DESCRIPTIONS.get(name, name)))
+                lines.append("# TYPE {} summary".format(metric))
+            for quantile, value in zip(self.QUANTILES, histogram.get_percentiles(self.QUANTILES)):
+                lines.append('{}{{{}="{}",quantile="{}"}} {:.9f}'.format(metric, label_name, label, quantile, value/1e9))
+            lines.append('{}_sum{{{}="{}"}} {:.9f}'.format(metric, label_name, label, histogram.total/1e9))
+            lines.append('{}_count{{{}="{}"}} {}'.format(metric, label_name, label, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serves render_prometheus at http://host:port/metrics from a daemon thread."""
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # every scrape would be a line in our log otherwise
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print_with_lock("serving metrics at http://{}:{}/metrics".format(host, self.server.server_address[1]))
+
+    def stop_serving(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+metrics = Metrics()
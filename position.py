@@ -1,10 +1,15 @@
-import time
-
-import robin_stocks.robinhood as r
+import threading
+from concurrent.futures import TimeoutError, CancelledError
 
 from singletons.market_data import MarketData
-from utilities import print_with_lock
-from traderbot_exception import TraderbotException
+from singletons.order_tracker import OrderTracker
+from singletons.quote_book import QuoteBook
+from metrics import metrics
+from utilities import print_with_lock, LazyModule
+from traderbot_exception import TraderbotException, PartialFillException, PartialCloseException
+
+# paper trading and backtests never touch robinhood
+r = LazyModule("robin_stocks.robinhood")
 
 class Position:
     """Base class for minor data handling and shared printing functionality."""
@@ -14,6 +19,8 @@ class Position:
         self.ticker = ticker
         self.open_price = open_price
         self.quantity = quantity
+        # dollars of the budget that weren't spent (a partial fill), for the caller to refund
+        self.unspent = 0.0
 
     def _fnum(self, num):
         return "{:0.{}f}".format(num, self._precision)
@@ -44,81 +51,159 @@ class OpenStockPosition(Position):
     # time out in 10s if order not filled
     TIMEOUT = 10
     THRESHOLD = 0.0001
+
+    # how many orders to place trying to sell everything before giving up
+    MAX_SELL_ATTEMPTS = 3
+
+    # every open position waits on its orders through the same tracker
+    ctor_lock = threading.Lock()
+    order_tracker = None
+
     def __init__(self, ticker, budget):
         """Blocks until the order is filled, 
-        or the timeout passes (in which case the order is cancelled and retried)."""
+        or the timeout passes (in which case the order is cancelled)."""
+        with self.ctor_lock:
+            if OpenStockPosition.order_tracker is None:
+                OpenStockPosition.order_tracker = OrderTracker()
+
         # open the position given the allocated budget
         resp = r.orders.order_buy_fractional_by_price(
             ticker, budget, timeInForce='gfd', extendedHours=False, jsonify=True)
-        resp = self.monitor_order(resp, ticker)
-        quantity = float(resp['cumulative_quantity'])
-        open_price = float(resp['average_price'])
+        try:
+            with metrics.timed("order_fill", ticker):
+                resp = self.order_tracker.wait_for_order(resp, ticker, self.TIMEOUT)
+            quantity = float(resp['cumulative_quantity'])
+            open_price = float(resp['average_price'])
+        except PartialFillException as pfe:
+            # we own what did fill, so hold a smaller position
+            print_with_lock(str(pfe))
+            quantity = pfe.filled_quantity
+            open_price = pfe.average_price
         super().__init__(ticker, quantity, open_price)
+        self.unspent = max(budget - quantity*open_price, 0.0)
         self.print_open()
 
     def close(self):
-        """Returns the close price. Blocks until the order is filled, 
-        or the timeout passes (in which case the order is cancelled and retried)."""
-        resp = r.order_sell_fractional_by_quantity(
-            self.ticker, self.quantity, timeInForce='gfd', priceType='bid_price', extendedHours=False, jsonify=True)
-        resp = self.monitor_order(resp, self.ticker)
-        if abs(float(resp['cumulative_quantity']) - self.quantity) > self.THRESHOLD:
-            raise TraderbotException(
-                "sold {} shares but wanted to sell {} shares of {}. response dict {}".format(
-                    resp['cumulative_quantity'], self.quantity, self.ticker, resp))
-        close_price = float(resp['average_price'])
-        self.print_close(close_price)
-        return close_price
-    
-    def monitor_order(self, resp, ticker):
-        """Monitors the order with the given ID until it is filled or TIMEOUT is exceeded, in which case the order is cancelled.
-        Returns the response dictionary or throws, depending on whether or not the order succeeded or failed.
-        Checks for fill status twice every second."""
-        order_id = resp.get('id', None)
-        if order_id is None:
-            raise TraderbotException("initial order for {} failed".format(ticker))
-        
-        # before waiting check if we already filled it
-        if resp['state'] == 'filled':
-            return resp
-
-        # then check every half second
-        for _ in range(2*self.TIMEOUT):
-            resp = r.orders.get_stock_order_info(order_id)
-            if resp['state'] == 'filled': # TODO orders are being cancelled unexpectedly
-                return resp
-            if resp['state'] == 'cancelled':
-                raise TraderbotException("order for {} was cancelled unexpectedly: {}".format(ticker, resp))
-            time.sleep(0.5)
-        # TODO if partially filled here need to tell the caller as much
-        # what the actual qty and price are so they can sell accordingly
-        # same for when they actually sell. maybe return remaining position
-        # so it works for both
-        print_with_lock("TIMING OUT BUT DEBUG IN CASE PARTIAL FILL: ", resp)
-        resp = r.cancel_stock_order(order_id)
-        print_with_lock("debug: response from cancelling stock order: ", resp)
-        raise TraderbotException("order for {} timed out".format(ticker))
+        """Returns the close price (averaged over every fill). Blocks until the order is filled, 
+        or the timeout passes (in which case the order is cancelled and the rest retried)."""
+        sold = 0.0
+        proceeds = 0.0
+        for _ in range(self.MAX_SELL_ATTEMPTS):
+            remaining = self.quantity - sold
+            resp = r.order_sell_fractional_by_quantity(
+                self.ticker, remaining, timeInForce='gfd', priceType='bid_price', extendedHours=False, jsonify=True)
+            try:
+                with metrics.timed("order_fill", self.ticker):
+                    resp = self.order_tracker.wait_for_order(resp, self.ticker, self.TIMEOUT)
+            except PartialFillException as pfe:
+                print_with_lock(str(pfe))
+                sold += pfe.filled_quantity
+                proceeds += pfe.filled_quantity*pfe.average_price
+                continue
+            except TraderbotException as te:
+                self.stop_selling(sold, proceeds, str(te))
+            filled = float(resp['cumulative_quantity'])
+            if abs(filled - remaining) > self.THRESHOLD:
+                message = "sold {} shares but wanted to sell {} shares of {}. response dict {}".format(
+                    resp['cumulative_quantity'], remaining, self.ticker, resp)
+                filled = min(filled, remaining)
+                if filled > 0.0:
+                    sold += filled
+                    proceeds += filled*float(resp['average_price'])
+                self.stop_selling(sold, proceeds, message)
+            sold += remaining
+            proceeds += remaining*float(resp['average_price'])
+            close_price = proceeds/sold
+            self.print_close(close_price)
+            return close_price
+        self.stop_selling(sold, proceeds, "could only sell {} shares of {} in {} orders, holding the remaining {}".format(
+            sold, self.ticker, self.MAX_SELL_ATTEMPTS, self.quantity - sold))
+
+    def stop_selling(self, sold, proceeds, message):
+        """Gives up on close, keeping whatever didn't sell as our position so we try again
+        later. Raises a PartialCloseException if some of it sold, so the caller can book
+        the proceeds, or a TraderbotException if none of it did."""
+        self.quantity -= sold
+        if sold > 0.0:
+            raise PartialCloseException(message, sold, proceeds)
+        raise TraderbotException(message)
 
 class OpenPaperPosition(Position):
     """Class used for paper trading."""
+    # give up on an unfilled paper order after this many seconds, like a real one
+    TIMEOUT = 10
 
     def __init__(self, ticker, budget, market_data):
         """Not using a "shared" market data ref here,
         too slow with the ctor_lock that would be needed.
         Just have each paper position control one market data ref."""
         # open the position given the allocated budget
-        # instead of buying here, just get next price and assume that's what we bought at
+        # instead of buying here, wait for the next trade and assume we bought then,
+        # at the ask if we have quotes since that's what a market buy would pay
         self.market_data = market_data
-        open_price = market_data.get_next_data_for_ticker(ticker)
+        open_price = self.wait_for_fill(ticker)
+        if open_price is None:
+            raise TraderbotException("paper buy of {} not filled within {}s (or before the close), cancelled".format(ticker, self.TIMEOUT))
+        open_price = self.get_quoted_price(ticker, QuoteBook.ASK, open_price)
         ticker = ticker
         quantity = budget/open_price
         super().__init__(ticker, quantity, open_price)
         self.print_open()
 
+    def wait_for_fill(self, ticker):
+        """Returns the price of the next trade on ticker, or None if there isn't one
+        within TIMEOUT seconds or the market closes first. Blocks without spinning,
+        the trade callback fills the order."""
+        fill = self.market_data.request_fill_for_ticker(ticker)
+        try:
+            with metrics.timed("order_fill", ticker):
+                return fill.result(self.TIMEOUT)
+        except TimeoutError:
+            # a trade can land between timing out and cancelling
+            if self.market_data.cancel_fill_for_ticker(ticker, fill):
+                return None
+            return fill.result()
+        except CancelledError:
+            return None
+
+    def get_quoted_price(self, ticker, side, trade_price):
+        """Returns the given side (QuoteBook.BID or ASK) of the latest quote
+        for ticker, or trade_price if there's no usable quote."""
+        quote = self.market_data.get_quote_for_ticker(ticker)
+        if quote is None:
+            return trade_price
+        price = quote[side]
+        # nan fails this too. a one sided or crossed quote is no better than the trade
+        if not (price > 0.0) or not (quote[QuoteBook.BID] <= quote[QuoteBook.ASK]):
+            return trade_price
+        return price
+
     def close(self):
         """Returns the close price."""
-        # get price right now to see what we would've sold at
-        close_price = self.market_data.get_next_data_for_ticker(self.ticker)
+        # the next trade's price is what we would've sold at, real
+        # sells go at the bid (see OpenStockPosition) so paper ones do too
+        close_price = self.wait_for_fill(self.ticker)
+        if close_price is None:
+            # a market sell on a quiet ticker still fills, at about the last price
+            close_price = self.market_data.get_data_for_ticker(self.ticker)
+        close_price = self.get_quoted_price(self.ticker, QuoteBook.BID, close_price)
         self.print_close(close_price)
 
         return close_price
+
+
+class OpenBacktestPosition(Position):
+    """Class used for backtesting. Fills instantly at the latest price, since
+    a backtest replays one trade at a time and there is no next price to wait on."""
+
+    def __init__(self, ticker, budget, market_data):
+        self.market_data = market_data
+        open_price = market_data.get_data_for_ticker(ticker)
+        super().__init__(ticker, budget/open_price, open_price)
+        self.print_open()
+
+    def close(self):
+        """Returns the close price."""
+        close_price = self.market_data.get_data_for_ticker(self.ticker)
+        self.print_close(close_price)
+        return close_price
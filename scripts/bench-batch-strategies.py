@@ -0,0 +1,55 @@
+#!env/bin/python3
+"""Benchmarks evaluating a strategy one ticker at a time against BatchStrategy.
+
+Fills MarketData with random trades for every ticker, then times how long
+one pass over the whole universe takes each way, and checks both agree."""
+import sys
+import time
+import pathlib
+from random import random, seed
+
+import numpy as np
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from strategies.strategy_factory import strategy_factory, batch_strategy_factory
+
+HISTORY_LEN = 16
+TREND_LEN = 3
+TRADES_PER_TICKER = 40
+PASSES = 20
+STRATEGIES = [{ "name": "StrictMomentum", "percent": 0.1 }, { "name": "MeanReversion", "percent": 0.1 }]
+
+def run(num_tickers):
+    tickers = ["T{}".format(i) for i in range(num_tickers)]
+    market_data = MarketData(tickers, None, None, HISTORY_LEN, TREND_LEN, initial_data=[100.0]*num_tickers)
+    seed(0)
+    for _ in range(TRADES_PER_TICKER):
+        for td in market_data.data:
+            td.on_trade(td.last_price + random() - 0.5, time.time_ns())
+
+    for strategy_dict in STRATEGIES:
+        strategies = [strategy_factory(strategy_dict, market_data, ticker) for ticker in tickers]
+        start = time.perf_counter()
+        for _ in range(PASSES):
+            one_at_a_time = [strategy.should_buy_on_tick() for strategy in strategies]
+        per_ticker = (time.perf_counter() - start)/PASSES
+
+        batch_strategy = batch_strategy_factory(strategy_dict, market_data, tickers)
+        start = time.perf_counter()
+        for _ in range(PASSES):
+            batched = batch_strategy.should_buy_batch(batch_strategy.get_stats())
+        batch = (time.perf_counter() - start)/PASSES
+
+        # float summation order differs, so allow the odd borderline disagreement
+        mismatches = int(np.sum(np.array(one_at_a_time) != batched))
+        print("{:>6} tickers, {:>14}: one at a time {:8.2f}ms, batched {:6.2f}ms ({:5.1f}x), {} of {} buys, {} mismatches".format(
+            num_tickers, strategy_dict["name"], 1e3*per_ticker, 1e3*batch, per_ticker/batch, int(np.sum(batched)), num_tickers, mismatches))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-batch-strategies.py")
+    sys.exit(0)
+
+for num_tickers in [100, 1000, 5000]:
+    run(num_tickers)
@@ -0,0 +1,126 @@
+#!env/bin/python3
+"""Benchmarks the streaming indicators in strategies/indicators.
+
+Checks each one against a from-scratch numpy computation, times an update at a
+few window lengths (it should not grow with them), and compares the per-trade
+cost of strategies sharing indicators through the registry against every
+strategy keeping its own copy."""
+import sys
+import time
+import pathlib
+from random import random, randint, seed
+
+import numpy as np
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from strategies.indicators.registry import acquire_indicator
+from strategies.indicators.ema import EMA
+from strategies.indicators.rolling_extremes import RollingMin, RollingMax
+from strategies.indicators.vwap import VWAP
+from strategies.indicators.rsi import RSI
+from strategies.indicators.bollinger import Bollinger
+from strategies.indicators.volatility import Volatility
+
+NUM_TRADES = 20000
+WINDOW = 20
+STRATEGIES_PER_TICKER = [1, 4, 16]
+# what each of those strategies asks for
+INDICATORS = [(EMA, WINDOW), (RollingMax, WINDOW), (RSI, 14), (Bollinger, WINDOW, 2.0)]
+
+def make_trades(num_trades):
+    seed(0)
+    price = 100.0
+    trades = []
+    for i in range(num_trades):
+        price = max(0.01, price + random() - 0.5)
+        trades.append((price, i, randint(1, 500)))
+    return trades
+
+def check(trades):
+    """Returns the relative error of each indicator's final value against numpy."""
+    prices = np.array([price for price, _, _ in trades])
+    sizes = np.array([size for _, _, size in trades])
+    window = prices[-WINDOW:]
+    ema = prices[0]
+    for price in prices[1:]:
+        ema += 2.0/(WINDOW+1)*(price - ema)
+    returns = np.diff(np.log(prices))[-WINDOW:]
+    expected = {
+        EMA: ema,
+        RollingMin: window.min(),
+        RollingMax: window.max(),
+        VWAP: np.dot(prices, sizes)/sizes.sum(),
+        Bollinger: window.mean() + 2.0*window.std(),
+        Volatility: returns.std(),
+    }
+    errors = {}
+    for indicator_class, want in expected.items():
+        indicator = indicator_class(WINDOW) if indicator_class is not VWAP else VWAP()
+        for trade in trades:
+            indicator.update(*trade)
+        got = indicator.get_value()
+        if indicator_class is Bollinger:
+            got = got.upper
+        errors[indicator_class.__name__] = abs(got - want)/abs(want)
+
+    # rsi by its textbook definition, one Wilder step at a time
+    moves = np.diff(prices)
+    gains, losses = np.maximum(moves, 0), np.maximum(-moves, 0)
+    avg_gain, avg_loss = gains[:14].mean(), losses[:14].mean()
+    for gain, loss in zip(gains[14:], losses[14:]):
+        avg_gain = (avg_gain*13 + gain)/14
+        avg_loss = (avg_loss*13 + loss)/14
+    rsi = RSI(14)
+    for trade in trades:
+        rsi.update(*trade)
+    want = 100 - 100/(1 + avg_gain/avg_loss)
+    errors['RSI'] = abs(rsi.get_value() - want)/want
+    return errors
+
+def time_updates(indicator, trades):
+    start = time.perf_counter()
+    for trade in trades:
+        indicator.update(*trade)
+    return 1e9*(time.perf_counter() - start)/len(trades)
+
+def time_on_trade(num_strategies, shared, trades):
+    """ns per TickerData.on_trade with num_strategies strategies each reading INDICATORS."""
+    market_data = MarketData(["T"], None, None, 16, 3, initial_data=[100.0])
+    ticker_data = market_data.get_ticker_data_for_ticker("T")
+    for _ in range(num_strategies):
+        for indicator_class, *params in INDICATORS:
+            if shared:
+                acquire_indicator(market_data, "T", indicator_class, *params)
+            else:
+                # what every strategy building its own would cost
+                ticker_data.indicator_updates += (indicator_class(*params).update,)
+    start = time.perf_counter()
+    for price, timestamp, size in trades:
+        ticker_data.on_trade(price, timestamp, size)
+    return 1e9*(time.perf_counter() - start)/len(trades), len(ticker_data.indicator_updates)
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-indicators.py")
+    sys.exit(0)
+
+trades = make_trades(NUM_TRADES)
+print("relative error against numpy after {} trades:".format(NUM_TRADES))
+for name, error in check(trades).items():
+    print("{:>12}: {:.2e}".format(name, error))
+
+print("\nns per update by window length:")
+print("{:>12} {:>8} {:>8} {:>8}".format("", 16, 256, 4096))
+for indicator_class in [EMA, RollingMin, RSI, Bollinger, Volatility]:
+    print("{:>12} {:>8.0f} {:>8.0f} {:>8.0f}".format(indicator_class.__name__,
+        *[time_updates(indicator_class(n), trades) for n in [16, 256, 4096]]))
+print("{:>12} {:>8.0f}".format("VWAP", time_updates(VWAP(), trades)))
+
+print("\nns per trade for strategies each reading {} indicators:".format(len(INDICATORS)))
+print("{:>18}: {:6.0f}".format("no indicators", time_on_trade(0, True, trades)[0]))
+for num_strategies in STRATEGIES_PER_TICKER:
+    own, own_count = time_on_trade(num_strategies, False, trades)
+    shared, shared_count = time_on_trade(num_strategies, True, trades)
+    print("{:>4} strategies: each their own {:6.0f} ({:>2} updates), shared {:6.0f} ({} updates), {:4.1f}x".format(
+        num_strategies, own, own_count, shared, shared_count, own/shared))
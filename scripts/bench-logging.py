@@ -0,0 +1,78 @@
+#!env/bin/python3
+"""Benchmarks per tick logging: the old print_with_lock against the async logger.
+
+Runs SimpleMovingAverages.should_buy_on_tick, which logs both averages every
+tick, as fast as possible from several threads at once, and reports how many
+ticks per second they get through with each kind of logging. Output goes to
+/dev/null so the terminal isn't what's measured."""
+import os
+import sys
+import time
+import pathlib
+import threading
+import contextlib
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from strategies.simple_moving_averages import SimpleMovingAverages
+from logger import log, DEBUG, INFO
+
+NUM_THREADS = 8
+DURATION = 2.0
+
+_print_lock = threading.Lock()
+
+def old_print_with_lock(*args):
+    """print_with_lock as it was before logger.py."""
+    with _print_lock:
+        for arg in args:
+            print(arg, end=' ')
+        print()
+
+class OldSimpleMovingAverages(SimpleMovingAverages):
+    def should_buy_on_tick(self):
+        if not self.long_moving_avg.is_ready():
+            return False
+        old_print_with_lock("MA for {}: short={} long={}".format(self.ticker, self.short_moving_avg.get_moving_average(), self.long_moving_avg.get_moving_average()))
+        return self.short_moving_avg.get_moving_average() > self.long_moving_avg.get_moving_average()
+
+def run(strategy_class, level):
+    tickers = ["T{}".format(i) for i in range(NUM_THREADS)]
+    market_data = MarketData(tickers, None, None, 16, 3, initial_data=[100.0]*NUM_THREADS)
+    for ticker in tickers:
+        for i in range(32):
+            market_data.get_ticker_data_for_ticker(ticker).on_trade(100.0 + i % 3, time.time_ns())
+    log.configure(level)
+    counts = [0]*NUM_THREADS
+    stop = threading.Event()
+
+    def tick(i, strategy):
+        n = 0
+        while not stop.is_set():
+            strategy.should_buy_on_tick()
+            n += 1
+        counts[i] = n
+
+    strategies = [strategy_class(market_data, ticker, 4, 8) for ticker in tickers]
+    threads = [threading.Thread(target=tick, args=(i, strategy)) for i, strategy in enumerate(strategies)]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        time.sleep(DURATION)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        log.flush()
+    return sum(counts)/DURATION
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-logging.py")
+    sys.exit(0)
+
+print("{} threads ticking SimpleMovingAverages for {}s each:".format(NUM_THREADS, DURATION))
+for name, strategy_class, level in [
+        ("print_with_lock (before)", OldSimpleMovingAverages, INFO),
+        ("log.debug, enabled", SimpleMovingAverages, DEBUG),
+        ("log.debug, disabled", SimpleMovingAverages, INFO)]:
+    print("{:>26}: {:10.0f} ticks/s".format(name, run(strategy_class, level)))
@@ -0,0 +1,92 @@
+#!env/bin/python3
+"""Benchmarks answering market hours questions, pandas_market_calendars against MarketCalendar.
+
+Before, every lookup built the NYSE schedule for the next week with
+pandas_market_calendars. MarketCalendar builds a year of it once, caches it on
+disk, and binary searches it after that. Reports the first lookup in a fresh
+process (imports included) for both, then each lookup after the first.
+
+Also checks MarketCalendar agrees with pandas_market_calendars on every day of
+the next year, early closes included."""
+import sys
+import time
+import pathlib
+import tempfile
+import subprocess
+from datetime import date, timedelta
+
+# let this run from the traderbot/ dir like the other scripts
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from singletons.market_calendar import MarketCalendar
+
+NUM_QUERIES = 100000
+NUM_MCAL_QUERIES = 20
+
+# run in a fresh interpreter each, so the imports are part of the cost
+FIRST_LOOKUP_MCAL = """
+import time
+start = time.perf_counter()
+from datetime import date, timedelta
+import pandas_market_calendars as mcal
+sched = mcal.get_calendar('NYSE').schedule(start_date=date.today(), end_date=date.today() + timedelta(days=7))
+sched['market_open'].iloc[0]
+print("elapsed", time.perf_counter() - start)
+"""
+FIRST_LOOKUP_CALENDAR = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from singletons.market_calendar import MarketCalendar
+MarketCalendar({cache_dir!r}).get_next_open()
+print("elapsed", time.perf_counter() - start)
+"""
+
+def first_lookup(code):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    # anything else it prints (the logger flushes last) is ignored
+    return next(float(line.split()[1]) for line in out.splitlines() if line.startswith("elapsed "))
+
+def mcal_lookup(nyse):
+    today = date.today()
+    sched = nyse.schedule(start_date=today, end_date=today + timedelta(days=7))
+    return sched['market_open'].iloc[0], sched['market_close'].iloc[0]
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-market-calendar.py")
+    sys.exit(0)
+
+cache_dir = tempfile.mkdtemp()
+print("first lookup in a fresh process:")
+print("  {:>34}: {:7.1f}ms".format("pandas_market_calendars (before)", 1e3*first_lookup(FIRST_LOOKUP_MCAL)))
+print("  {:>34}: {:7.1f}ms".format("MarketCalendar, building the cache", 1e3*first_lookup(FIRST_LOOKUP_CALENDAR.format(root=str(ROOT), cache_dir=cache_dir))))
+print("  {:>34}: {:7.1f}ms".format("MarketCalendar, cached", 1e3*first_lookup(FIRST_LOOKUP_CALENDAR.format(root=str(ROOT), cache_dir=cache_dir))))
+
+import pandas_market_calendars as mcal
+nyse = mcal.get_calendar('NYSE')
+calendar = MarketCalendar(cache_dir)
+start = time.perf_counter()
+for _ in range(NUM_MCAL_QUERIES):
+    mcal_lookup(nyse)
+mcal_each = (time.perf_counter() - start)/NUM_MCAL_QUERIES
+print("every lookup after that:")
+print("  {:>34}: {:9.2f}us".format("pandas_market_calendars (before)", 1e6*mcal_each))
+now = time.time()
+for name, query in [("next open", calendar.get_next_open), ("today's close", calendar.get_close), ("is open now", calendar.is_open)]:
+    start = time.perf_counter()
+    for i in range(NUM_QUERIES):
+        query(now + i)
+    print("  {:>34}: {:9.2f}us".format("MarketCalendar " + name, 1e6*(time.perf_counter() - start)/NUM_QUERIES))
+
+# every session pandas_market_calendars has, against what we'd answer the second after it opens
+sched = nyse.schedule(start_date=date.today(), end_date=date.today() + timedelta(days=MarketCalendar.NUM_DAYS))
+mismatches = 0
+early_closes = 0
+for market_open, market_close in zip(sched['market_open'], sched['market_close']):
+    session = calendar.get_session(market_open.timestamp() + 1)
+    if session != (market_open.timestamp(), market_close.timestamp()):
+        mismatches += 1
+    if market_close - market_open < timedelta(hours=6, minutes=30):
+        early_closes += 1
+print("{} sessions checked ({} early closes), {} disagree with pandas_market_calendars".format(len(sched), early_closes, mismatches))
+sys.exit(1 if mismatches != 0 else 0)
@@ -0,0 +1,87 @@
+#!env/bin/python3
+"""Benchmarks TickerData's lock-free readers against the old RWLockWrite scheme.
+
+N reader threads hammer get_price/get_trend while one writer pushes trades
+through the stream callback as fast as it can. Reports how many trades the
+writer managed, how long each callback took (including any lock waits), and
+total reader throughput."""
+import sys
+import time
+import asyncio
+import pathlib
+import threading
+from types import SimpleNamespace
+from random import random
+
+from readerwriterlock import rwlock
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import TickerData
+
+DURATION = 3.0
+
+class LockedTickerData(TickerData):
+    """Reproduces the old locking: every read takes the rlock, writes the wlock."""
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.lock = rwlock.RWLockWrite()
+
+    async def trade_update_callback(self, t):
+        with self.lock.gen_wlock():
+            await super().trade_update_callback(t)
+
+    def get_price(self):
+        with self.lock.gen_rlock():
+            return super().get_price()
+
+    def get_trend(self):
+        with self.lock.gen_rlock():
+            return super().get_trend()
+
+def reader(td, counts, i, stop):
+    n = 0
+    while not stop.is_set():
+        td.get_price()
+        td.get_trend()
+        n += 1
+    counts[i] = n
+
+def writer(td, latencies, stop):
+    async def run():
+        price = 100.0
+        while not stop.is_set():
+            price += random() - 0.5
+            start = time.perf_counter()
+            await td.trade_update_callback(SimpleNamespace(price=price))
+            latencies.append(time.perf_counter() - start)
+            # give the loop a turn now and again, like a real socket would
+            await asyncio.sleep(0)
+    asyncio.run(run())
+
+def bench(cls, num_readers):
+    td = cls(100.0, 16, 3)
+    stop = threading.Event()
+    counts = [0]*num_readers
+    latencies = []
+    threads = [threading.Thread(target=reader, args=(td, counts, i, stop)) for i in range(num_readers)]
+    threads.append(threading.Thread(target=writer, args=(td, latencies, stop)))
+    for t in threads:
+        t.start()
+    time.sleep(DURATION)
+    stop.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    def pct(p):
+        return 1e6*latencies[min(len(latencies)-1, int(p*len(latencies)))]
+    print("{:>16} {:>3} readers: {:>6} trades, writer p50={:0.0f}us p99={:0.0f}us max={:0.0f}us, {:>9.0f} reads/s".format(
+        cls.__name__, num_readers, len(latencies), pct(0.5), pct(0.99), pct(1.0), sum(counts)/DURATION))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-market-data-contention.py [num_readers ...]")
+    sys.exit(0)
+
+for num_readers in [int(arg) for arg in sys.argv[1:]] or [1, 4, 16]:
+    bench(LockedTickerData, num_readers)
+    bench(TickerData, num_readers)
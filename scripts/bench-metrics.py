@@ -0,0 +1,75 @@
+#!env/bin/python3
+"""Benchmarks what the latency metrics cost on the tick path.
+
+Feeds synthetic trades through TickerData.on_trade, each followed by a strategy
+decision the way a trading thread makes one, with metrics off and then on, and
+reports the cost per tick of each and the overhead of turning metrics on.
+Prints the resulting Prometheus text for one ticker at the end."""
+import sys
+import time
+import pathlib
+from datetime import datetime, timedelta
+from random import random, seed
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from metrics import metrics
+from trader import Trader
+from singletons.market_data import MarketData
+from singletons.market_time import MarketTime
+from strategies.simple_moving_averages import SimpleMovingAverages
+
+NUM_TICKERS = 10
+NUM_TICKS = 200000
+NUM_RUNS = 10
+
+def make_trades():
+    seed(0)
+    price = 100.0
+    trades = []
+    for i in range(NUM_TICKS):
+        price += random() - 0.5
+        trades.append((i % NUM_TICKERS, price))
+    return trades
+
+def make_setup(enabled):
+    """Returns (each ticker's TickerData, each ticker's Trader), timed into metrics if enabled."""
+    tickers = ["T{}".format(i) for i in range(NUM_TICKERS)]
+    market_data = MarketData(tickers, None, None, 64, 3, initial_data=[100.0]*NUM_TICKERS)
+    if enabled:
+        market_data.enable_metrics(metrics)
+    market_time = MarketTime(datetime.now() + timedelta(hours=1))
+    traders = [Trader(ticker, market_data, market_time, None, None, SimpleMovingAverages(market_data, ticker, 4, 16), None, 0.01, 0.01)
+        for ticker in tickers]
+    return [market_data.get_ticker_data_for_ticker(ticker) for ticker in tickers], traders
+
+def run(trades, setup):
+    """Returns the seconds it takes to pass trades through setup."""
+    ticker_data, traders = setup
+    now = time.time_ns()
+    start = time.perf_counter()
+    for i, price in trades:
+        ticker_data[i].on_trade(price, now)
+        traders[i].should_buy_on_tick()
+    return time.perf_counter() - start
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-metrics.py")
+    sys.exit(0)
+
+trades = make_trades()
+metrics.enable()
+setups = { False: make_setup(False), True: make_setup(True) }
+best = { False: float('inf'), True: float('inf') }
+# alternate, keeping the best of each, so both see the same noise
+for _ in range(NUM_RUNS):
+    for enabled, setup in setups.items():
+        metrics.enabled = enabled
+        best[enabled] = min(best[enabled], run(trades, setup))
+off = best[False]
+on = best[True]
+print("{} ticks across {} tickers, trade callback plus strategy decision:".format(NUM_TICKS, NUM_TICKERS))
+print("{:>12}: {:6.2f}us per tick".format("metrics off", 1e6*off/NUM_TICKS))
+print("{:>12}: {:6.2f}us per tick, {:+.1f}%".format("metrics on", 1e6*on/NUM_TICKS, 100*(on - off)/off))
+print()
+print("\n".join(line for line in metrics.render_prometheus().splitlines() if "T0" in line or line.startswith("#")))
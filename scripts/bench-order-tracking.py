@@ -0,0 +1,114 @@
+#!env/bin/python3
+"""Benchmarks the shared OrderTracker against polling each order on its own.
+
+Runs against a local stand-in broker that fills orders after a random delay,
+so no RH account is needed. Reports how late fills are noticed and how many
+requests per minute each approach makes of the broker."""
+import sys
+import time
+import random
+import pathlib
+import threading
+from datetime import datetime
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.order_tracker import OrderTracker
+
+NUM_TRADERS = 50
+DURATION = 10.0
+MEAN_FILL_DELAY = 1.0
+
+def iso(t):
+    return datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+class StandInBroker:
+    """Fills every order MEAN_FILL_DELAY seconds after it's placed, on average."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.fill_times = {}
+        # everything but placing orders, which both approaches do the same
+        self.num_requests = 0
+        self.next_id = 0
+
+    def refresh(self, resp):
+        fill_time = self.fill_times[resp['id']]
+        if resp['state'] == 'queued' and time.time() >= fill_time:
+            resp['state'] = 'filled'
+            resp['cumulative_quantity'] = resp['quantity']
+            resp['average_price'] = '100.0'
+            resp['updated_at'] = iso(fill_time)
+
+    def place_order(self):
+        with self.lock:
+            self.next_id += 1
+            now = time.time()
+            resp = { 'id': str(self.next_id), 'state': 'queued', 'quantity': '1.0', 'cumulative_quantity': '0.0',
+                'average_price': None, 'created_at': iso(now), 'updated_at': iso(now) }
+            self.orders[resp['id']] = resp
+            self.fill_times[resp['id']] = now + random.expovariate(1/MEAN_FILL_DELAY)
+            return dict(resp)
+
+    def get_stock_order_info(self, order_id):
+        with self.lock:
+            self.num_requests += 1
+            self.refresh(self.orders[order_id])
+            return dict(self.orders[order_id])
+
+    def get_orders_updated_since(self, since):
+        with self.lock:
+            self.num_requests += 1
+            updates = []
+            for resp in self.orders.values():
+                self.refresh(resp)
+                if resp['updated_at'] >= since:
+                    updates.append(dict(resp))
+            return updates
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            self.num_requests += 1
+
+def polling_wait(broker, resp):
+    """What OpenStockPosition used to do: ask about its own order twice a second."""
+    while resp['state'] != 'filled':
+        time.sleep(0.5)
+        resp = broker.get_stock_order_info(resp['id'])
+    return resp
+
+def run(name):
+    broker = StandInBroker()
+    tracker = OrderTracker(broker) if name == "tracker" else None
+    latencies = []
+    stop = threading.Event()
+
+    def trader():
+        while not stop.is_set():
+            resp = broker.place_order()
+            if tracker is not None:
+                resp = tracker.wait_for_order(resp, "FAKE", timeout=60)
+            else:
+                resp = polling_wait(broker, resp)
+            latencies.append(time.time() - broker.fill_times[resp['id']])
+
+    threads = [threading.Thread(target=trader) for _ in range(NUM_TRADERS)]
+    for t in threads:
+        t.start()
+    time.sleep(DURATION)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    print("{:>8}: {} fills, noticed after p50={:0.0f}ms p99={:0.0f}ms, {:0.0f} order status requests/minute".format(
+        name, len(latencies), 1e3*latencies[len(latencies)//2], 1e3*latencies[int(0.99*len(latencies))],
+        60*broker.num_requests/DURATION))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-order-tracking.py")
+    sys.exit(0)
+
+print("{} traders placing orders back to back for {}s, fills take {}s on average".format(NUM_TRADERS, DURATION, MEAN_FILL_DELAY))
+run("polling")
+run("tracker")
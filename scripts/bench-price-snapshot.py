@@ -0,0 +1,135 @@
+#!env/bin/python3
+"""Benchmarks setting up MarketData for 1000 tickers, r.stocks.get_latest_price against PriceSnapshot.
+
+Runs against a local stand-in for Robinhood's quotes endpoint (nothing is sent
+to Robinhood) that takes REQUEST_DELAY per request plus SYMBOL_DELAY per symbol
+asked for. Reports the time from asking for the prices to having every
+TickerData built, with the stand-in healthy, with the one response that has
+STALLED_TICKER in it stalling for STALL_DELAY, and with the endpoint down,
+where PriceSnapshot falls back to prices recorded the day before."""
+import os
+import sys
+import json
+import time
+import pathlib
+import tempfile
+import threading
+import contextlib
+from datetime import date, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from robin_stocks.robinhood import helper, stocks
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from singletons.price_snapshot import PriceSnapshot
+from tick_store import TickRecorder
+from logger import log
+
+NUM_TICKERS = 1000
+REQUEST_DELAY = 0.05
+SYMBOL_DELAY = 0.0005
+STALLED_TICKER = "T0500"
+STALL_DELAY = 10.0
+
+class StandIn:
+    """RH's quotes endpoint, healthy, with one stalled response, or down."""
+    def __init__(self):
+        self.mode = "healthy"
+        self.stalled = False
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                symbols = parse_qs(urlparse(self.path).query)['symbols'][0].split(",")
+                if stand_in.mode == "down":
+                    self.reply(503, {})
+                    return
+                time.sleep(REQUEST_DELAY + SYMBOL_DELAY*len(symbols))
+                if stand_in.should_stall(symbols):
+                    time.sleep(STALL_DELAY)
+                self.reply(200, { "results": [{ "symbol": symbol, "last_trade_price": "100.0000",
+                    "last_extended_hours_trade_price": None } for symbol in symbols] })
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/quotes/".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def should_stall(self, symbols):
+        """Only the first response with STALLED_TICKER in it stalls, a retry doesn't."""
+        with self.lock:
+            if self.mode != "stall" or self.stalled or STALLED_TICKER not in symbols:
+                return False
+            self.stalled = True
+            return True
+
+    def set_mode(self, mode):
+        with self.lock:
+            self.mode = mode
+            self.stalled = False
+
+@contextlib.contextmanager
+def quiet():
+    """Keeps what robin_stocks and PriceSnapshot print out of the results."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        helper.set_output(devnull)
+        yield
+        log.flush()
+        helper.set_output(sys.stdout)
+
+def before(tickers, fallback_dir):
+    # what MarketData.__init__ did
+    initial_data = stocks.get_latest_price(tickers, priceType=None, includeExtendedHours=True)
+    return MarketData(tickers, None, None, 16, 3, [float(price) for price in initial_data])
+
+def after(tickers, fallback_dir):
+    return MarketData(tickers, None, None, 16, 3, price_snapshot=PriceSnapshot(fallback_dir, quotes_url=stand_in.url))
+
+def record_yesterday(root, tickers):
+    recorder = TickRecorder(root, date.today() - timedelta(days=1))
+    for ticker in tickers:
+        recorder.record(recorder.get_ticker_id(ticker), time.time_ns(), 99.0)
+    recorder.close()
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-price-snapshot.py")
+    sys.exit(0)
+
+stand_in = StandIn()
+stocks.quotes_url = lambda: stand_in.url
+tickers = ["T{:04d}".format(i) for i in range(NUM_TICKERS)]
+fallback_dir = tempfile.mkdtemp()
+with quiet():
+    record_yesterday(fallback_dir, tickers)
+
+print("stand-in takes {:0.0f}ms per request plus {:0.1f}ms per symbol, a stall is {:0.0f}s".format(1e3*REQUEST_DELAY, 1e3*SYMBOL_DELAY, STALL_DELAY))
+print("setting up market data for {} tickers:".format(NUM_TICKERS))
+for mode in ["healthy", "stall", "down"]:
+    results = []
+    for name, set_up in [("get_latest_price (before)", before), ("PriceSnapshot", after)]:
+        stand_in.set_mode(mode)
+        with quiet():
+            start = time.perf_counter()
+            try:
+                market_data = set_up(tickers, fallback_dir)
+                results.append("{}: {:7.0f}ms".format(name, 1e3*(time.perf_counter() - start)))
+            except Exception as e:
+                results.append("{}: failed ({})".format(name, type(e).__name__))
+    print("  {:>8}: {}".format(mode, ", ".join(results)))
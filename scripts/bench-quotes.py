@@ -0,0 +1,88 @@
+#!env/bin/python3
+"""Benchmarks the cost of subscribing to quotes on top of trades.
+
+Pushes messages shaped like the Alpaca stream's (ten quotes per trade by
+default) through the Stream's own dispatch, the same path a live day takes
+minus the socket and decoding, with quotes off, with quotes conflated into the
+QuoteBook, and with every quote kept like a trade would be."""
+import sys
+import time
+import asyncio
+import pathlib
+from random import random, choice, seed
+
+import msgpack
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData, TickerData, _raw_timestamp_ns
+
+NUM_TICKERS = 100
+NUM_FRAMES = 2000
+MESSAGES_PER_FRAME = 50
+
+def make_frames(quotes_per_trade):
+    """Returns packed frames of trades and quotes, as the stream receives them."""
+    seed(0)
+    tickers = ["T{}".format(i) for i in range(NUM_TICKERS)]
+    frames = []
+    num_quotes = 0
+    price = 100.0
+    for _ in range(NUM_FRAMES):
+        batch = []
+        for _ in range(MESSAGES_PER_FRAME):
+            price += random() - 0.5
+            stamp = msgpack.Timestamp.from_unix_nano(time.time_ns())
+            if random() < 1.0/(quotes_per_trade + 1):
+                batch.append({ 'T': 't', 'S': choice(tickers), 'i': 0, 'x': 'V', 'p': price, 's': 100, 't': stamp, 'c': ['@'], 'z': 'C' })
+            else:
+                batch.append({ 'T': 'q', 'S': choice(tickers), 'bx': 'V', 'bp': price - 0.01, 'bs': 1, 'ax': 'V', 'ap': price + 0.01,
+                    'as': 2, 't': stamp, 'c': ['R'], 'z': 'C' })
+                num_quotes += 1
+        frames.append(msgpack.packb(batch))
+    return tickers, frames, num_quotes
+
+def run(tickers, frames, mode):
+    """Returns (seconds to dispatch every message in frames, the MarketData they went to)."""
+    market_data = MarketData(tickers, "key", "secret", 16, 3, [100.0]*len(tickers), subscribe_quotes=(mode == "conflated"))
+    stream = market_data.stream
+    if mode == "every quote":
+        # what handling quotes like trades would cost: a TickerData per ticker, fed the mid price
+        quote_data = { ticker: TickerData(100.0, 16, 3) for ticker in tickers }
+        async def keep_every_quote(msg):
+            quote_data[msg['S']].on_trade((msg['bp'] + msg['ap'])/2, _raw_timestamp_ns(msg))
+        stream.subscribe_quotes(keep_every_quote, *tickers)
+
+    # decoding is the same whatever we subscribe to (and, with msgpack's pure python
+    # fallback, slow enough to drown everything else out), so do it up front
+    messages = [msg for frame in frames for msg in msgpack.unpackb(frame)]
+    data_ws = stream._data_ws
+    async def consume():
+        # Stream._consume minus the socket and the decoding
+        for msg in messages:
+            await data_ws._dispatch(msg)
+    start = time.perf_counter()
+    asyncio.run(consume())
+    return time.perf_counter() - start, market_data
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-quotes.py [quotes per trade]")
+    sys.exit(0)
+
+quotes_per_trade = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+tickers, frames, num_quotes = make_frames(quotes_per_trade)
+num_messages = NUM_FRAMES*MESSAGES_PER_FRAME
+print("{} messages for {} tickers, {} of them quotes".format(num_messages, NUM_TICKERS, num_quotes))
+
+baseline, _ = run(tickers, frames, "off")
+print("{:>12}: {:8.0f} messages/s".format("quotes off", num_messages/baseline))
+for mode in ["conflated", "every quote"]:
+    elapsed, market_data = run(tickers, frames, mode)
+    print("{:>12}: {:8.0f} messages/s, {:5.2f}us more per quote than ignoring it".format(
+        mode, num_messages/elapsed, 1e6*(elapsed - baseline)/num_quotes))
+
+start = time.perf_counter()
+for _ in range(100):
+    for ticker in tickers:
+        market_data.get_quote_for_ticker(ticker)
+print("reading a quote: {:0.0f}ns".format(1e9*(time.perf_counter() - start)/(100*len(tickers))))
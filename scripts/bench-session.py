@@ -0,0 +1,190 @@
+#!env/bin/python3
+"""Benchmarks logging in and making requests, with plain r.login against RobinhoodSession.
+
+Runs against a local stand-in for Robinhood's API (nothing is sent to Robinhood)
+that takes CONNECT_DELAY to accept a new connection, standing in for the TCP and
+TLS handshakes, and LOGIN_DELAY more to check a password and MFA code. Tokens
+it hands out expire when told to, like a cached token a day later.
+
+Reports the time from starting up to having made the first authenticated
+request, with no token cached, a valid one and an expired one, then the
+latency of requests made from many threads at once."""
+import os
+import sys
+import json
+import time
+import shutil
+import pathlib
+import tempfile
+import threading
+import contextlib
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# robin_stocks caches its token in ~/.tokens, keep ours out of the way
+os.environ["HOME"] = tempfile.mkdtemp()
+
+import requests
+import robin_stocks.robinhood as r
+from robin_stocks.robinhood import authentication, helper
+from robin_stocks.robinhood.globals import SESSION
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from session import RobinhoodSession
+from logger import log
+
+CONNECT_DELAY = 0.03
+LOGIN_DELAY = 0.3
+NUM_THREADS = 16
+REQUESTS_PER_THREAD = 50
+
+class StandIn:
+    """The handful of Robinhood endpoints logging in touches, plus one to make requests to."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valid_tokens = set()
+        self.num_tokens = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep connections open like the real api does, and don't let nagle's
+            # algorithm hold the body back waiting for the headers to be acked
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                time.sleep(CONNECT_DELAY)
+                super().setup()
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+                if self.path != "/oauth2/token/":
+                    self.reply(404, {})
+                elif form.get("grant_type") == ["password"]:
+                    time.sleep(LOGIN_DELAY)
+                    self.reply(200, stand_in.new_token())
+                elif form.get("grant_type") == ["refresh_token"]:
+                    self.reply(200, stand_in.new_token())
+                else:
+                    self.reply(400, {})
+
+            def do_GET(self):
+                token = self.headers.get("Authorization", "").split(" ")[-1]
+                with stand_in.lock:
+                    valid = token in stand_in.valid_tokens
+                if not valid:
+                    self.reply(401, { "detail": "Incorrect authentication credentials." })
+                else:
+                    self.reply(200, { "results": [], "next": None })
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def new_token(self):
+        with self.lock:
+            self.num_tokens += 1
+            token = "token{}".format(self.num_tokens)
+            self.valid_tokens.add(token)
+        return { "access_token": token, "token_type": "Bearer", "refresh_token": "refresh" + token, "expires_in": 86400, "scope": "internal" }
+
+    def expire_tokens(self):
+        with self.lock:
+            self.valid_tokens.clear()
+
+def new_process():
+    """Forgets every open connection and logs robin_stocks out, like a fresh run."""
+    SESSION.close()
+    helper.set_login_state(False)
+    helper.update_session("Authorization", None)
+
+@contextlib.contextmanager
+def quiet():
+    """Keeps what logging in prints out of the results."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        helper.set_output(devnull)
+        yield
+        log.flush()
+        helper.set_output(sys.stdout)
+
+def time_to_ready(stand_in, log_in):
+    """Returns seconds from a fresh start to the first authenticated request."""
+    new_process()
+    with quiet():
+        start = time.perf_counter()
+        log_in()
+        helper.request_get(stand_in.url + "accounts/", jsonify_data=False).raise_for_status()
+        elapsed = time.perf_counter() - start
+    return elapsed
+
+def request_latencies(stand_in):
+    """Returns every request's latency in seconds, NUM_THREADS making requests at once."""
+    latencies = []
+    def make_requests():
+        for _ in range(REQUESTS_PER_THREAD):
+            start = time.perf_counter()
+            helper.request_get(stand_in.url + "quotes/", jsonify_data=False).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    threads = [threading.Thread(target=make_requests) for _ in range(NUM_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-session.py")
+    sys.exit(0)
+
+stand_in = StandIn()
+authentication.login_url = lambda: stand_in.url + "oauth2/token/"
+authentication.positions_url = lambda: stand_in.url + "positions/"
+cache_dir = tempfile.mkdtemp()
+def plain_login():
+    r.login("user", "password")
+def make_session():
+    return RobinhoodSession("user", "password", cache_dir=cache_dir, api_url=stand_in.url)
+def session_login():
+    make_session().log_in()
+
+print("stand-in takes {:0.0f}ms per new connection and {:0.0f}ms more per password login".format(1e3*CONNECT_DELAY, 1e3*LOGIN_DELAY))
+print("startup to first authenticated request:")
+for name, log_in in [("r.login (before)", plain_login), ("RobinhoodSession", session_login)]:
+    # a default adapter, like robin_stocks has until a RobinhoodSession mounts its own
+    SESSION.mount("http://", requests.adapters.HTTPAdapter())
+    shutil.rmtree(pathlib.Path("~/.tokens").expanduser(), ignore_errors=True)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    none_cached = time_to_ready(stand_in, log_in)
+    cached = time_to_ready(stand_in, log_in)
+    stand_in.expire_tokens()
+    if name == "RobinhoodSession":
+        # what a day old cache looks like to us: expired, as far as we know too
+        token = make_session().load_cached_token()
+        token["expires_at"] = time.time() - 1
+        make_session().save_token(token)
+    expired = time_to_ready(stand_in, log_in)
+    print("{:>18}: {:6.1f}ms with no token cached, {:6.1f}ms with a valid one, {:6.1f}ms with an expired one".format(
+        name, 1e3*none_cached, 1e3*cached, 1e3*expired))
+
+print("{} threads making {} requests each:".format(NUM_THREADS, REQUESTS_PER_THREAD))
+for name, adapter in [("default pool (before)", requests.adapters.HTTPAdapter()),
+        ("RobinhoodSession pool", requests.adapters.HTTPAdapter(pool_connections=RobinhoodSession.POOL_SIZE, pool_maxsize=RobinhoodSession.POOL_SIZE))]:
+    SESSION.mount("http://", adapter)
+    new_process()
+    with quiet():
+        session_login()
+    latencies = request_latencies(stand_in)
+    print("{:>22}: mean {:5.2f}ms, p50 {:5.2f}ms, p99 {:6.2f}ms".format(name, 1e3*sum(latencies)/len(latencies),
+        1e3*latencies[len(latencies)//2], 1e3*latencies[int(0.99*len(latencies))]))
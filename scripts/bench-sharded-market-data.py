@@ -0,0 +1,128 @@
+#!env/bin/python3
+"""Benchmarks MarketData's single stream against ShardedMarketData.
+
+Starts a local stand-in for the Alpaca data stream (same websocket and msgpack
+protocol) that sends trades at a configurable rate, with one hot ticker getting
+a big share of them, and reports how long trades for the other tickers take to
+reach their TickerData."""
+import sys
+import time
+import socket
+import asyncio
+import pathlib
+import multiprocessing
+from random import random, choices
+
+import msgpack
+import websockets
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from singletons.sharded_market_data import ShardedMarketData
+
+DURATION = 5.0
+# share of all trades that go to the first ticker
+HOT_SHARE = 0.5
+# how often the stand-in sends a batch of trades, in seconds
+BATCH_INTERVAL = 0.001
+
+def serve_fake_stream(port, tickers, trades_per_second):
+    """Runs a stand-in for Alpaca's data stream on localhost:port until killed."""
+    weights = { ticker: (HOT_SHARE if i == 0 else (1-HOT_SHARE)/(len(tickers)-1)) for i, ticker in enumerate(tickers) }
+
+    async def handle(ws, path=None):
+        await ws.send(msgpack.packb([{ 'T': 'success', 'msg': 'connected' }]))
+        await ws.recv()
+        await ws.send(msgpack.packb([{ 'T': 'success', 'msg': 'authenticated' }]))
+        subscribed = msgpack.unpackb(await ws.recv())['trades']
+        await ws.send(msgpack.packb([{ 'T': 'subscription', 'trades': subscribed }]))
+
+        # only send this connection its own tickers' share of the trades
+        rate = trades_per_second*sum(weights[ticker] for ticker in subscribed)
+        subscribed_weights = [weights[ticker] for ticker in subscribed]
+        owed = 0.0
+        last = time.perf_counter()
+        price = 100.0
+        while True:
+            await asyncio.sleep(BATCH_INTERVAL)
+            now = time.perf_counter()
+            owed += rate*(now - last)
+            last = now
+            num_trades = int(owed)
+            owed -= num_trades
+            if num_trades == 0:
+                continue
+            price += random() - 0.5
+            stamp = msgpack.Timestamp.from_unix_nano(time.time_ns())
+            batch = [{ 'T': 't', 'S': ticker, 'i': 0, 'x': 'V', 'p': price, 's': 100, 't': stamp, 'c': ['@'], 'z': 'C' }
+                for ticker in choices(subscribed, subscribed_weights, k=num_trades)]
+            try:
+                await ws.send(msgpack.packb(batch))
+            except websockets.ConnectionClosed:
+                return
+
+    async def run():
+        async with websockets.serve(handle, 'localhost', port):
+            await asyncio.get_running_loop().create_future()
+    asyncio.run(run())
+
+class LatencyRecorder:
+    """Stands in for a TickRecorder, but just keeps how late each trade was."""
+    def __init__(self):
+        self.latencies = []
+        self.hot_latencies = []
+
+    def get_ticker_id(self, ticker):
+        return 0 if ticker == "T0" else 1
+
+    def record(self, ticker_id, timestamp, price):
+        (self.hot_latencies if ticker_id == 0 else self.latencies).append(time.time_ns() - timestamp)
+
+def percentile(sorted_vals, p):
+    if len(sorted_vals) == 0:
+        return float('nan')
+    return sorted_vals[min(len(sorted_vals)-1, int(p*len(sorted_vals)))]
+
+def run(tickers, trades_per_second, num_shards):
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    server = multiprocessing.Process(target=serve_fake_stream, args=(port, tickers, trades_per_second), daemon=True)
+    server.start()
+    time.sleep(0.5)
+
+    url = "http://localhost:{}".format(port)
+    initial_data = [100.0]*len(tickers)
+    if num_shards == 1:
+        market_data = MarketData(tickers, "key", "secret", 16, 3, initial_data, data_stream_url=url)
+    else:
+        market_data = ShardedMarketData(tickers, "key", "secret", 16, 3, num_shards, initial_data, data_stream_url=url)
+    recorder = LatencyRecorder()
+    market_data.attach_recorder(recorder)
+
+    cpu_start = time.process_time()
+    market_data.start_stream()
+    time.sleep(DURATION)
+    market_data.stop_stream()
+    cpu = time.process_time() - cpu_start
+    server.terminate()
+    server.join()
+
+    cold = sorted(recorder.latencies)
+    hot = sorted(recorder.hot_latencies)
+    print("{:>2} shard(s): {} trades, other tickers' latency p50={:0.2f}ms p99={:0.2f}ms, hot ticker's p99={:0.2f}ms, main process used {:0.0f}% of a core".format(
+        num_shards, len(cold) + len(hot), percentile(cold, 0.5)/1e6, percentile(cold, 0.99)/1e6, percentile(hot, 0.99)/1e6, 100*cpu/DURATION))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-sharded-market-data.py [trades per second] [tickers] [shards]")
+    sys.exit(0)
+
+trades_per_second = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+num_tickers = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+num_shards = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+tickers = ["T{}".format(i) for i in range(num_tickers)]
+
+print("{} tickers, {} trades/s with {:0.0f}% going to one ticker, for {}s".format(num_tickers, trades_per_second, 100*HOT_SHARE, DURATION))
+run(tickers, trades_per_second, 1)
+run(tickers, trades_per_second, num_shards)
@@ -0,0 +1,105 @@
+#!env/bin/python3
+"""Benchmarks busy-spinning tick consumers against event-driven ones.
+
+Feeds a synthetic trade stream into TickerData objects through the same
+async callback the alpaca stream uses, and reports cpu usage and
+tick-to-decision latency for both consumer styles."""
+import sys
+import time
+import asyncio
+import pathlib
+import threading
+from types import SimpleNamespace
+from random import random
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import TickerData
+
+NUM_TICKERS = 40
+TRADES_PER_SECOND = 2000
+DURATION = 5.0
+
+def percentile(sorted_vals, p):
+    if len(sorted_vals) == 0:
+        return float('nan')
+    return sorted_vals[min(len(sorted_vals)-1, int(p*len(sorted_vals)))]
+
+def feed(ticker_datas, publish_times, stop):
+    """Round robins trades across every ticker at TRADES_PER_SECOND."""
+    async def run():
+        interval = 1.0/TRADES_PER_SECOND
+        price = 100.0
+        n = 0
+        next_send = time.perf_counter()
+        while not stop.is_set():
+            price += random() - 0.5
+            td = ticker_datas[n % len(ticker_datas)]
+            # stamp before the callback so latency includes the notify
+            publish_times[id(td)].append(time.perf_counter())
+            await td.trade_update_callback(SimpleNamespace(price=price))
+            n += 1
+            next_send += interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    asyncio.run(run())
+
+def spin_consumer(td, publish_times, latencies, stop):
+    """The old TradingThread loop: evaluate as fast as possible."""
+    seen = 0
+    while not stop.is_set():
+        td.get_trend()
+        trades = td.num_trades
+        if trades != seen:
+            latencies.append(time.perf_counter() - publish_times[trades-1])
+            seen = trades
+
+def event_consumer(td, publish_times, latencies, stop):
+    """The new TradingThread loop: evaluate once per new trade."""
+    seen = 0
+    while not stop.is_set():
+        trades = td.wait_for_trade(seen, 0.1)
+        if trades == seen:
+            continue
+        td.get_trend()
+        latencies.append(time.perf_counter() - publish_times[trades-1])
+        seen = trades
+
+def run(consumer):
+    ticker_datas = [TickerData(100.0, 16, 3) for _ in range(NUM_TICKERS)]
+    publish_times = { id(td): [] for td in ticker_datas }
+    latencies = []
+    stop = threading.Event()
+
+    threads = [threading.Thread(target=consumer, args=(td, publish_times[id(td)], latencies, stop)) for td in ticker_datas]
+    threads.append(threading.Thread(target=feed, args=(ticker_datas, publish_times, stop)))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(DURATION)
+    stop.set()
+    for td in ticker_datas:
+        with td.tick_cv:
+            td.tick_cv.notify_all()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    published = sum(len(times) for times in publish_times.values())
+    latencies.sort()
+    print("{:>6}: {} trades published, {:0.1f}% of one core, "
+        "latency p50={:0.1f}us p99={:0.1f}us max={:0.1f}us".format(
+        consumer.__name__.split('_')[0], published, 100*cpu/wall,
+        1e6*percentile(latencies, 0.5), 1e6*percentile(latencies, 0.99), 1e6*percentile(latencies, 1.0)))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-tick-dispatch.py")
+    sys.exit(0)
+
+print("{} tickers, {} trades/s for {}s".format(NUM_TICKERS, TRADES_PER_SECOND, DURATION))
+run(spin_consumer)
+run(event_consumer)
@@ -0,0 +1,54 @@
+#!env/bin/python3
+"""Microbenchmarks TickerData.get_trend against recomputing the window
+statistics from scratch on every call, for a range of history lengths."""
+import sys
+import time
+import asyncio
+import pathlib
+from types import SimpleNamespace
+from random import random, seed
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import TickerData
+from utilities import get_mean_stddev
+
+CALLS = 20000
+
+def recompute_trend(td):
+    """What get_trend used to do: a full pass over the window per call."""
+    _, prices = td.copy_ordered_prices()
+    mean, stddev = get_mean_stddev(prices.tolist())
+    last_k = prices[:-td.trend_len-1:-1].tolist()
+    up = all(last_k[i] > last_k[i+1] for i in range(len(last_k)-1))
+    down = all(last_k[i] < last_k[i+1] for i in range(len(last_k)-1))
+    return mean, stddev, "up" if up else "down" if down else "none"
+
+def time_per_call(fn, td):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        fn(td)
+    return 1e6*(time.perf_counter() - start)/CALLS
+
+async def fill(td, n):
+    price = 3000.0
+    for _ in range(n):
+        price += random() - 0.5
+        await td.trade_update_callback(SimpleNamespace(price=price))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-ticker-stats.py")
+    sys.exit(0)
+
+seed(0)
+print("{:>12} {:>14} {:>14} {:>12}".format("history-len", "recompute(us)", "get_trend(us)", "max error"))
+history_len = 16
+while history_len <= 4096:
+    td = TickerData(3000.0, history_len, 3)
+    asyncio.run(fill(td, 3*history_len + 12345))
+    mean, stddev, _ = td.get_trend()
+    exact_mean, exact_stddev, _ = recompute_trend(td)
+    error = max(abs(mean-exact_mean), abs(stddev-exact_stddev))
+    print("{:>12} {:>14.2f} {:>14.2f} {:>12.2e}".format(
+        history_len, time_per_call(recompute_trend, td), time_per_call(TickerData.get_trend, td), error))
+    history_len *= 4
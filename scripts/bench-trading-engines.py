@@ -0,0 +1,120 @@
+#!env/bin/python3
+"""Benchmarks the threaded trading engine against the asyncio one.
+
+Feeds a synthetic trade stream through MarketData into real traders (with a
+strategy that never buys) and reports ticks evaluated and tick-to-decision
+latency for a range of ticker counts."""
+import io
+import sys
+import contextlib
+import time
+import asyncio
+import pathlib
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from random import random
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.market_data import MarketData
+from singletons.market_time import MarketTime
+from singletons.trade_capper import TradeCapper
+from singletons.reports import Reports
+from strategies.strategy import Strategy
+from trading_thread import TradingThread
+from async_trading_engine import AsyncTrader, AsyncTradingEngine
+
+TRADES_PER_SECOND = 5000
+DURATION = 5.0
+
+class LatencyStrategy(Strategy):
+    """Never buys, just records how long each trade took to reach it."""
+    def __init__(self, market_data, ticker, publish_times, latencies):
+        super().__init__(market_data, ticker)
+        self.publish_times = publish_times
+        self.latencies = latencies
+        self.td = market_data.get_ticker_data_for_ticker(ticker)
+
+    def should_buy_on_tick(self):
+        self.latencies.append(time.perf_counter() - self.publish_times[self.td.num_trades-1])
+        return False
+
+async def feed(market_data, tickers, publish_times, end_time):
+    interval = 1.0/TRADES_PER_SECOND
+    price = 100.0
+    n = 0
+    next_send = time.perf_counter()
+    while time.perf_counter() < end_time:
+        price += random() - 0.5
+        ticker = tickers[n % len(tickers)]
+        publish_times[ticker].append(time.perf_counter())
+        await market_data.get_ticker_data_for_ticker(ticker).trade_update_callback(SimpleNamespace(price=price))
+        n += 1
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif n % 64 == 0:
+            # falling behind, still let the traders run
+            await asyncio.sleep(0)
+
+def make_traders(trader_class, num_tickers, publish_times, latencies):
+    tickers = ["T{}".format(i) for i in range(num_tickers)]
+    market_data = MarketData(tickers, None, None, 16, 3, initial_data=[100.0]*num_tickers)
+    market_time = MarketTime(datetime.now() + timedelta(seconds=DURATION))
+    for ticker in tickers:
+        publish_times[ticker] = []
+    traders = [trader_class(ticker, market_data, market_time, None, TradeCapper(None),
+        LatencyStrategy(market_data, ticker, publish_times[ticker], latencies), Reports(), 0.01, 0.01)
+        for ticker in tickers]
+    return tickers, market_data, market_time, traders
+
+def run_threads(num_tickers, publish_times, latencies):
+    tickers, market_data, market_time, traders = make_traders(TradingThread, num_tickers, publish_times, latencies)
+    end_time = time.perf_counter() + DURATION
+    feeder = threading.Thread(target=asyncio.run, args=(feed(market_data, tickers, publish_times, end_time),))
+    for t in traders:
+        t.start()
+    feeder.start()
+    while market_time.is_time_left_to_trade():
+        market_time.update()
+        time.sleep(0.1)
+    feeder.join()
+    for t in traders:
+        t.join()
+
+def run_asyncio(num_tickers, publish_times, latencies):
+    tickers, market_data, market_time, traders = make_traders(AsyncTrader, num_tickers, publish_times, latencies)
+    async def main():
+        end_time = time.perf_counter() + DURATION
+        feed_task = asyncio.ensure_future(feed(market_data, tickers, publish_times, end_time))
+        await AsyncTradingEngine(market_data, market_time, traders).run_async()
+        await feed_task
+    asyncio.run(main())
+
+def bench(runner, num_tickers):
+    publish_times = {}
+    latencies = []
+    cpu_start = time.process_time()
+    runner(num_tickers, publish_times, latencies)
+    cpu = time.process_time() - cpu_start
+    published = sum(len(times) for times in publish_times.values())
+    latencies.sort()
+    def pct(p):
+        return 1e6*latencies[min(len(latencies)-1, int(p*len(latencies)))] if latencies else float('nan')
+    return ("{:>8} {:>5} tickers: {:>6} published {:>6} evaluated, cpu {:0.1f}s, latency p50={:0.0f}us p99={:0.0f}us".format(
+        runner.__name__[4:], num_tickers, published, len(latencies), cpu, pct(0.5), pct(0.99)))
+
+if "--help" in sys.argv or "-h" in sys.argv:
+    print("usage: ./scripts/bench-trading-engines.py [num_tickers ...]")
+    sys.exit(0)
+
+counts = [int(arg) for arg in sys.argv[1:]] or [50, 200, 500]
+print("{} trades/s for {}s".format(TRADES_PER_SECOND, DURATION))
+for num_tickers in counts:
+    for runner in [run_threads, run_asyncio]:
+        # keep the "thread began" spam out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = bench(runner, num_tickers)
+        print(result)
@@ -1,10 +1,14 @@
 #!env/bin/python3
 """Run this script once as you're setting up the traderbot, if you want your RH account to be MFA enabled."""
 import sys
-import json
+import pathlib
 
 import pyotp
 
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from utilities import read_config
+
 def help():
     print("usage: ./scripts/mfa-setup.py <YOUR_TWO_FACTOR_AUTH_SETUP_CODE_HERE>")
     print("(take a look at the README for how to get this code)")
@@ -24,12 +28,10 @@ if "--help" in sys.argv or "-h" in sys.argv:
 
 # try to get the code from the config file
 try:
-    with open("config.json", 'r') as conf:
-        data = json.load(conf)
-        setup = data['mfa-setup-code']
-        totp = pyotp.TOTP(setup).now()
-        print_code(totp)
-        sys.exit(0)
+    setup = read_config()['mfa-setup-code']
+    totp = pyotp.TOTP(setup).now()
+    print_code(totp)
+    sys.exit(0)
 except:
     print("tried to parse config.json and failed, using command line arg instead")
 
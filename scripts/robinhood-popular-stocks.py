@@ -3,45 +3,31 @@
 
 import sys
 import pathlib
-import json
-import pyotp
 import pprint
 
 import robin_stocks.robinhood as r
 
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from session import RobinhoodSession
+from utilities import read_config, enforce_keys_in_dict
+from traderbot_exception import ConfigException
+
 if "--help" in sys.argv or "-h" in sys.argv:
     print("usage: ./scripts/robinhood-popular-stocks.py")
     sys.exit(0)
 
-# get data
+# log in, with the same cached token as the bot if there is one
 try:
-    path_to_conf = pathlib.Path("config.json")
-    with open(str(path_to_conf)) as json_file:
-        try:
-            data = json.load(json_file)
-        except json.JSONDecodeError:
-            print("config.json file malformed -- see the following")
-            raise 
-except:
-    print("config.json file not found. make sure you're running this script from the traderbot/ dir, not the traderbot/scripts/ dir")
-    sys.exit(1)
-
-if 'username' not in data.keys() or 'password' not in data.keys():
-    print("\"username\" and \"password\" must have key-value pairs in config.json")
+    data = read_config()
+    enforce_keys_in_dict(["username", "password"], data)
+except ConfigException as ce:
+    print(ce)
     sys.exit(1)
 
-username = data['username']
-password = data['password']
-
-# log in
-mfa_code=None
-if 'mfa-setup-code' in data.keys():
-    # gets current mfa code
-    totp = pyotp.TOTP(data["mfa-setup-code"]).now()
-    print("current mfa code (this may be requested momentarily):", totp)
-
 print("data is being fetched...")
-login = r.login(username, password, mfa_code=mfa_code)
+session = RobinhoodSession.from_config(data)
+session.log_in()
 
 # get and print data
 pp = pprint.PrettyPrinter(indent=4)
@@ -62,3 +48,5 @@ top_upward_movers_sp500 = [d['symbol'] for d in top_upward_movers_sp500]
 print("----------- TOP UPWARD MOVERS (S&P 500) ------------")
 pp.pprint(top_movers_any)
 print("----------------------------------------------------")
+
+session.close()
@@ -0,0 +1,126 @@
+#!env/bin/python3
+"""Stress tests BuyingPower and TradeCapper shared between many processes.
+
+Every worker process reserves a trade and spends from the shared budget as fast
+as it can, handing a share of both back at random like an order that didn't
+fill, until the cap or the budget runs out. Then it checks that the books
+balance: nothing was overspent, the cap was never exceeded, and what's left in
+shared memory is exactly what the workers say they left. Pass --unsafe to run
+the same thing with the compare and swap replaced by a plain read and write, to
+see the invariants break without it."""
+import sys
+import time
+import random
+import pathlib
+import multiprocessing
+
+# let this run from the traderbot/ dir like the other scripts
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from singletons.buying_power import BuyingPower
+from singletons.trade_capper import TradeCapper
+from singletons.shared_value import SharedValue
+
+NUM_PROCESSES = 16
+# powers of two so every sum is exact in a float
+BUDGET = float(2**22)
+PERCENT_PER_BUY = 1/2**16
+# runs out before the budget's 65536 buys. the other run has no cap
+MAX_TRADES = 2*40000
+REFUND_CHANCE = 0.3
+
+def unsafe_update(self, function):
+    """SharedValue.update without the compare and swap."""
+    old = self.value.value
+    # give other processes the chance to get in between, like a preemption would
+    time.sleep(0)
+    new = function(old)
+    self.value.value = new
+    return old, new
+
+def reserve_until_exhausted(worker, buying_power, trade_capper, unsafe, start, results):
+    if unsafe:
+        SharedValue.update = unsafe_update
+    rng = random.Random(worker)
+    spent = refunded = 0.0
+    trades = cancelled = 0
+    bad_amounts = 0
+    lowest_seen = BUDGET
+    start.wait()
+    while trade_capper.make_trade():
+        trades += 1
+        amount = buying_power.spend_and_get_amount()
+        if amount == 0.0:
+            trade_capper.cancel_trade()
+            cancelled += 1
+            break
+        if amount > buying_power.amount_per_buy:
+            bad_amounts += 1
+        spent += amount
+        lowest_seen = min(lowest_seen, buying_power.get_available_buying_power())
+        if rng.random() < REFUND_CHANCE:
+            buying_power.refund(amount)
+            refunded += amount
+            trade_capper.cancel_trade()
+            cancelled += 1
+    results.put((spent, refunded, trades, cancelled, bad_amounts, lowest_seen))
+
+def run(max_trades, unsafe):
+    """Returns a list of the invariants that didn't hold."""
+    buying_power = BuyingPower(PERCENT_PER_BUY, budget=BUDGET, account_buying_power=BUDGET)
+    trade_capper = TradeCapper(max_trades)
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=reserve_until_exhausted, args=(i, buying_power, trade_capper, unsafe, start, results))
+        for i in range(NUM_PROCESSES)]
+    for worker in workers:
+        worker.start()
+    begin = time.perf_counter()
+    start.set()
+    totals = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - begin
+    for worker in workers:
+        worker.join()
+
+    spent = sum(total[0] for total in totals)
+    refunded = sum(total[1] for total in totals)
+    trades = sum(total[2] for total in totals)
+    cancelled = sum(total[3] for total in totals)
+    bad_amounts = sum(total[4] for total in totals)
+    lowest_seen = min(total[5] for total in totals)
+    left = buying_power.get_available_buying_power()
+    trades_left = trade_capper.num_trades_left_today.get()
+    print("  {} processes made {} reservations ({} given back) in {:0.2f}s, spending ${:0.0f} of ${:0.0f}".format(
+        NUM_PROCESSES, trades, cancelled, elapsed, spent - refunded, BUDGET))
+
+    failures = []
+    if spent - refunded > BUDGET:
+        failures.append("overspent: ${} spent out of ${}".format(spent - refunded, BUDGET))
+    if left != BUDGET - (spent - refunded):
+        failures.append("budget doesn't balance: ${} left, workers say ${}".format(left, BUDGET - (spent - refunded)))
+    if lowest_seen < 0.0:
+        failures.append("buying power went negative: ${}".format(lowest_seen))
+    if bad_amounts != 0:
+        failures.append("{} spends were for more than the amount per buy".format(bad_amounts))
+    if max_trades is not None:
+        if 2*(trades - cancelled) > max_trades:
+            failures.append("over the cap: {} trades out of {}".format(2*(trades - cancelled), max_trades))
+        if trades_left != max_trades - 2*(trades - cancelled):
+            failures.append("cap doesn't balance: {} trades left, workers say {}".format(trades_left, max_trades - 2*(trades - cancelled)))
+    return failures
+
+if __name__ == "__main__":
+    if "--help" in sys.argv or "-h" in sys.argv:
+        print("usage: ./scripts/stress-shared-budget.py [--unsafe]")
+        sys.exit(0)
+
+    unsafe = "--unsafe" in sys.argv
+    failed = False
+    for name, max_trades in [("trade cap runs out first", MAX_TRADES), ("budget runs out first", None)]:
+        print("{}, {} compare and swap:".format(name, "without" if unsafe else "with"))
+        failures = run(max_trades, unsafe)
+        for failure in failures:
+            print("  FAILED:", failure)
+        if len(failures) == 0:
+            print("  every invariant held")
+        failed = failed or len(failures) != 0
+    sys.exit(1 if failed and not unsafe else 0)
@@ -0,0 +1,189 @@
+"""One Robinhood login, shared by the bot and the scripts.
+
+r.login on its own posts the username, password and MFA code whenever it has no
+token less than a day old, and every run pays for a round trip validating the
+one it has. RobinhoodSession keeps the token (and when it expires) in a cache
+file, reuses it while it has plenty of life left, trades the refresh token for
+a new one when it doesn't, and only falls back to a full login when both fail.
+While the bot runs, a background thread refreshes the token an hour before it
+expires, so it never expires mid-trade.
+
+Every robin_stocks call goes through robin_stocks' one requests.Session. We
+give it a connection pool big enough for all of our threads, so none of them
+has to open (and TLS handshake) a connection of its own and throw it away."""
+
+import os
+import json
+import time
+import threading
+import pathlib
+
+import pyotp
+import requests
+import robin_stocks.robinhood as r
+from robin_stocks.robinhood import helper
+from robin_stocks.robinhood.globals import SESSION
+
+from utilities import print_with_lock
+from traderbot_exception import APIException
+
+DEFAULT_API_URL = "https://api.robinhood.com/"
+
+class RobinhoodSession:
+    """Threadsafe owner of the Robinhood token, see the module docstring. Use one per process."""
+    # what robin_stocks logs in as
+    CLIENT_ID = "c82SH0WZOsabOXGP2sxqcj34FxkvfnWRZBKlBjFS"
+    # seconds a token lasts, what robin_stocks asks for
+    TOKEN_LIFETIME = 86400
+    # refresh a token this many seconds before it expires
+    REFRESH_MARGIN = 3600
+    # seconds to wait before trying a failed background refresh again
+    RETRY_INTERVAL = 60
+    # connections kept open per host. more than the startup workers and
+    # trading engine executor use at once, so nobody waits on a handshake
+    POOL_SIZE = 32
+    DEFAULT_CACHE_DIR = "~/.tokens"
+
+    def __init__(self, username, password, mfa_setup_code=None, cache_dir=DEFAULT_CACHE_DIR, api_url=DEFAULT_API_URL, pool_size=POOL_SIZE):
+        self.username = username
+        self.password = password
+        self.mfa_setup_code = mfa_setup_code
+        self.cache_path = pathlib.Path(cache_dir).expanduser() / "traderbot-{}.json".format(username)
+        self.token_url = api_url + "oauth2/token/"
+        self.validate_url = api_url + "positions/"
+
+        # the current token, a dict of access_token, token_type, refresh_token and expires_at
+        self.lock = threading.Lock()
+        self.token = None
+        self.stopped = threading.Event()
+        self.refresh_thread = None
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        SESSION.mount("https://", adapter)
+        SESSION.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        """Makes a session from a parsed config.json."""
+        return cls(config["username"], config["password"], config.get("mfa-setup-code", None),
+            config.get("session-cache", cls.DEFAULT_CACHE_DIR))
+
+    def log_in(self):
+        """Logs robin_stocks in, as cheaply as it can, and keeps it logged in in the background
+        until close is called. Returns how: "cached token", "refreshed token" or "password"."""
+        token = self.load_cached_token()
+        how = "password"
+        if token is not None and token["expires_at"] - time.time() > self.REFRESH_MARGIN and self.validate(token):
+            how = "cached token"
+        elif token is not None and self.refresh(token):
+            how = "refreshed token"
+        else:
+            self.log_in_with_password()
+        print_with_lock("logged in as user {} (with a {})".format(self.username, how))
+        self.start_refreshing()
+        return how
+
+    def load_cached_token(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def save_token(self, token):
+        # the refresh token is as good as the password, so only we can read it
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump(token, cache_file)
+
+    def use_token(self, token):
+        """Makes every robin_stocks call from now on use token."""
+        with self.lock:
+            self.token = token
+            helper.update_session("Authorization", "{} {}".format(token["token_type"], token["access_token"]))
+            helper.set_login_state(True)
+
+    def validate(self, token):
+        """Uses token if Robinhood still accepts it. Returns whether it did. The request
+        that checks opens the connection the next call will reuse, so it costs little."""
+        self.use_token(token)
+        try:
+            SESSION.get(self.validate_url, params={ "nonzero": "true" }, timeout=16).raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def refresh(self, token):
+        """Swaps token's refresh token for a new token, and uses it. Returns whether it could."""
+        payload = {
+            "grant_type": "refresh_token",
+            "refresh_token": token["refresh_token"],
+            "scope": "internal",
+            "client_id": self.CLIENT_ID,
+            "expires_in": self.TOKEN_LIFETIME,
+        }
+        try:
+            resp = SESSION.post(self.token_url, data=payload, timeout=16)
+            resp.raise_for_status()
+            data = resp.json()
+        except (requests.RequestException, ValueError):
+            return False
+        if "access_token" not in data:
+            return False
+        self.got_token(data)
+        return True
+
+    def log_in_with_password(self):
+        """The full login, with MFA if it's set up. Raises an APIException if it fails."""
+        mfa_code = None
+        if self.mfa_setup_code is not None:
+            mfa_code = pyotp.TOTP(self.mfa_setup_code).now()
+        data = r.login(self.username, self.password, expiresIn=self.TOKEN_LIFETIME, mfa_code=mfa_code)
+        if not data or "access_token" not in data:
+            raise APIException("could not log in to robinhood as user {}".format(self.username))
+        self.got_token(data)
+
+    def got_token(self, data):
+        """Uses and caches the token in a response from the token endpoint."""
+        token = {
+            "access_token": data["access_token"],
+            "token_type": data["token_type"],
+            "refresh_token": data["refresh_token"],
+            "expires_at": time.time() + float(data.get("expires_in", self.TOKEN_LIFETIME)),
+        }
+        self.use_token(token)
+        self.save_token(token)
+
+    def start_refreshing(self):
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.refresh_forever, daemon=True)
+            self.refresh_thread.start()
+
+    def refresh_forever(self):
+        while True:
+            with self.lock:
+                token = self.token
+            wait = token["expires_at"] - self.REFRESH_MARGIN - time.time()
+            if self.stopped.wait(max(wait, 0)):
+                return
+            if self.refresh(token):
+                continue
+            if time.time() >= token["expires_at"]:
+                # too late to refresh, log in again before anything else fails
+                try:
+                    self.log_in_with_password()
+                    continue
+                except APIException as ae:
+                    print_with_lock(str(ae))
+            print_with_lock("could not refresh the robinhood token, trying again in {}s".format(self.RETRY_INTERVAL))
+            if self.stopped.wait(self.RETRY_INTERVAL):
+                return
+
+    def close(self):
+        """Stops refreshing and logs robin_stocks out. The cached token is kept for next time."""
+        self.stopped.set()
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+            self.refresh_thread = None
+        r.logout()
@@ -1,38 +1,45 @@
-from readerwriterlock import rwlock
-import robin_stocks.robinhood as r
+from singletons.shared_value import SharedValue
+from utilities import print_with_lock, LazyModule
 
-from utilities import print_with_lock
+# backtests never touch robinhood
+r = LazyModule("robin_stocks.robinhood")
 
 class BuyingPower:
-    """Threadsafe class for shared access/updating of budget/buying power."""
-    def __init__(self, percent_to_spend, instant=False, budget=None):
-        self.lock = rwlock.RWLockWrite()
-        self.buying_power = 0.0
+    """Thread and process safe class for shared access/updating of budget/buying power.
+    The balance lives in shared memory (see SharedValue), so trading processes
+    handed this object all spend from the same budget without ever overspending it."""
+    def __init__(self, percent_to_spend, instant=False, budget=None, account_buying_power=None):
+        """Pass account_buying_power to skip loading it from the RH account (backtests)."""
         self.instant = instant
+        if account_buying_power is None:
+            account_buying_power = float(r.profiles.load_account_profile(info='buying_power'))
         if budget is None:
-            self.buying_power = float(r.profiles.load_account_profile(info='buying_power'))
+            buying_power = account_buying_power
         else:
-            self.buying_power = min(float(r.profiles.load_account_profile(info='buying_power')), budget)
-        self.amount_per_buy = self.buying_power * percent_to_spend
+            buying_power = min(account_buying_power, budget)
+        self.amount_per_buy = buying_power * percent_to_spend
+        self.buying_power = SharedValue(buying_power, "buying_power")
 
     def spend_and_get_amount(self):
         """Spend the previously denoted amount (a constant percent of our 
         buying power at market open). If not enough, spend all."""
-        with self.lock.gen_wlock():
-            spent = min(self.buying_power, self.amount_per_buy)
-            self.buying_power -= spent
-        return spent
+        amount_per_buy = self.amount_per_buy
+        old, new = self.buying_power.update(lambda buying_power: buying_power - min(buying_power, amount_per_buy))
+        return old - new
 
     def get_available_buying_power(self):
-        with self.lock.gen_rlock():
-            return self.buying_power
+        return self.buying_power.get()
+
+    def refund(self, amount):
+        """Use this to give back an amount from spend_and_get_amount that never got
+        spent, e.g. the order didn't fill. Unlike add_funds there's nothing to settle."""
+        self.buying_power.update(lambda buying_power: buying_power + amount)
 
     def add_funds(self, amount):
         """Use this when you close a position to add back the funds earned."""
-        if not instant:
+        if not self.instant:
             # cannot add funds until 2 days later to non instant accounts
             return
 
-        with self.lock.gen_wlock():
-            self.buying_power += amount
-            print_with_lock("your account now has ${}".format(self.buying_power))
+        _, new = self.buying_power.update(lambda buying_power: buying_power + amount)
+        print_with_lock("your account now has ${}".format(new))
@@ -0,0 +1,137 @@
+import json
+import pathlib
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+from utilities import print_with_lock, LazyModule
+from traderbot_exception import APIException, ConfigException
+
+# only imported if something isn't cached
+r = LazyModule("robin_stocks.robinhood")
+
+class HistoricalData:
+    """Threadsafe cache of historical close prices from RH. Should be a singleton.
+
+    Bars are kept in memory and on disk, one json file per (ticker, interval) mapping
+    each bar's date to its close price. A ticker with no bars on disk (or none from
+    the last year) gets a year downloaded; one that's already cached only needs the
+    shortest span reaching back to when it was last caught up, and nothing at all
+    if that was today. Downloads ask for
+    BATCH_SIZE tickers per request, with up to max_workers requests at once."""
+    # most symbols RH will take in one historicals request
+    BATCH_SIZE = 75
+
+    # bars older than this many intervals are dropped from the cache
+    MAX_BARS = 400
+
+    # spans RH downloads and how many days back each reaches, shortest first
+    SPANS = [('week', 7), ('month', 30), ('3month', 91), ('year', 365)]
+
+    def __init__(self, cache_dir, max_workers=8):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        # (ticker, interval) -> { 'updated': <iso date>, 'bars': { <begins_at>: <close price> } }
+        self.cache = {}
+
+    def get_cache_path(self, ticker, interval):
+        return self.cache_dir / "{}-{}.json".format(ticker, interval)
+
+    def load_from_disk(self, ticker, interval):
+        path = self.get_cache_path(ticker, interval)
+        if not path.exists():
+            return None
+        try:
+            with open(str(path)) as cache_file:
+                return json.load(cache_file)
+        except ValueError:
+            print_with_lock("ignoring corrupt historical data cache file {}".format(path))
+            return None
+
+    def save_to_disk(self, ticker, interval, entry):
+        path = self.get_cache_path(ticker, interval)
+        # write then rename so a crash never leaves half a file behind
+        tmp_path = path.with_suffix(".tmp")
+        with open(str(tmp_path), 'w') as cache_file:
+            json.dump(entry, cache_file)
+        tmp_path.replace(path)
+
+    def download(self, tickers, interval, span):
+        """Returns { ticker: { begins_at: close price } } for every ticker RH had bars for."""
+        bars = { ticker: {} for ticker in tickers }
+        batches = [tickers[i:i+self.BATCH_SIZE] for i in range(0, len(tickers), self.BATCH_SIZE)]
+        def download_batch(batch):
+            return r.stocks.get_stock_historicals(batch, interval=interval, span=span)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for data in executor.map(download_batch, batches):
+                for bar in data or []:
+                    if bar is None or bar.get('symbol', None) not in bars:
+                        continue
+                    bars[bar['symbol']][bar['begins_at']] = float(bar['close_price'])
+        return bars
+
+    def get_catch_up_span(self, updated, today):
+        """Returns the shortest span that reaches back to updated (an iso date), so
+        catching up leaves no gap in the bars, or None if even a year doesn't."""
+        age = (today - date.fromisoformat(updated)).days
+        for span, days in self.SPANS:
+            if age < days:
+                return span
+        return None
+
+    def prefetch(self, tickers, interval='day'):
+        """Makes sure every ticker's bars are cached and up to date as of today,
+        downloading whatever's missing in as few requests as possible."""
+        today = date.today().isoformat()
+        # span -> tickers to catch up with it
+        stale = {}
+        missing = []
+        with self.lock:
+            for ticker in set(tickers):
+                key = (ticker, interval)
+                if key not in self.cache:
+                    entry = self.load_from_disk(ticker, interval)
+                    if entry is not None:
+                        self.cache[key] = entry
+                if key not in self.cache:
+                    missing.append(ticker)
+                elif self.cache[key]['updated'] != today:
+                    span = self.get_catch_up_span(self.cache[key]['updated'], date.today())
+                    if span is None:
+                        # too old to catch up without a gap, start over
+                        del self.cache[key]
+                        missing.append(ticker)
+                    else:
+                        stale.setdefault(span, []).append(ticker)
+
+        for tickers_to_fetch, span in [(missing, 'year')] + [(stale[span], span) for span, _ in self.SPANS if span in stale]:
+            if len(tickers_to_fetch) == 0:
+                continue
+            print_with_lock("downloading {} of {} bars for {} tickers".format(span, interval, len(tickers_to_fetch)))
+            downloaded = self.download(sorted(tickers_to_fetch), interval, span)
+            with self.lock:
+                for ticker, bars in downloaded.items():
+                    key = (ticker, interval)
+                    entry = self.cache.get(key, { 'updated': today, 'bars': {} })
+                    entry['bars'].update(bars)
+                    # iso timestamps sort chronologically
+                    entry['bars'] = dict(sorted(entry['bars'].items())[-self.MAX_BARS:])
+                    entry['updated'] = today
+                    self.cache[key] = entry
+                    self.save_to_disk(ticker, interval, entry)
+
+    def get_closes(self, ticker, n, interval='day'):
+        """Returns the last n close prices for ticker, oldest first. Downloads them
+        if they weren't prefetched. Raises if RH doesn't have n of them."""
+        if n > self.MAX_BARS:
+            raise ConfigException("a {} {} moving average needs more than the {} bars kept".format(n, interval, self.MAX_BARS))
+        self.prefetch([ticker], interval)
+        with self.lock:
+            bars = self.cache[(ticker, interval)]['bars']
+            closes = list(bars.values())[-n:]
+        if len(closes) < n:
+            raise APIException("only {} {} bars of {} are available, a {} {} moving average needs {}".format(
+                len(closes), interval, ticker, n, interval, n))
+        return closes
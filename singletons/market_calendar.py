@@ -0,0 +1,96 @@
+import json
+import time
+import pathlib
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from utilities import print_with_lock
+
+class MarketCalendar:
+    """Every trading session (open and close, early closes included) for about a year,
+    as sorted lists of epoch seconds. Should be a singleton, and never changes once
+    built, so it's threadsafe.
+
+    Building the sessions with pandas_market_calendars takes about a second (most of
+    it importing pandas), so they're cached in a json file and only rebuilt once
+    fewer than MIN_DAYS_LEFT days are left in it. Every question after that is a
+    binary search: microseconds, and no pandas."""
+    # days of sessions to build at once
+    NUM_DAYS = 366
+
+    # rebuild when the cached sessions run out within this many days
+    MIN_DAYS_LEFT = 14
+
+    def __init__(self, cache_dir, name="NYSE", today=None):
+        """today defaults to date.today(), pass it to build for some other day."""
+        self.name = name
+        self.path = pathlib.Path(cache_dir) / "calendar-{}.json".format(name)
+        if today is None:
+            today = date.today()
+        sessions = self.load_from_disk()
+        if sessions is None or not self.covers(sessions, today):
+            sessions = self.build(today)
+            self.save_to_disk(sessions)
+        self.opens = sessions['opens']
+        self.closes = sessions['closes']
+
+    def covers(self, sessions, today):
+        return date.fromisoformat(sessions['first']) <= today and \
+            date.fromisoformat(sessions['last']) - today >= timedelta(days=self.MIN_DAYS_LEFT)
+
+    def build(self, today):
+        # only imported when the cache runs out, it's most of the cost
+        import pandas_market_calendars as mcal
+        last = today + timedelta(days=self.NUM_DAYS)
+        schedule = mcal.get_calendar(self.name).schedule(start_date=today, end_date=last)
+        print_with_lock("built the {} calendar from {} to {}".format(self.name, today, last))
+        return {
+            'first': today.isoformat(),
+            'last': last.isoformat(),
+            'opens': [ts.timestamp() for ts in schedule['market_open']],
+            'closes': [ts.timestamp() for ts in schedule['market_close']],
+        }
+
+    def load_from_disk(self):
+        if not self.path.exists():
+            return None
+        try:
+            with open(str(self.path)) as cache_file:
+                return json.load(cache_file)
+        except ValueError:
+            print_with_lock("ignoring corrupt calendar cache file {}".format(self.path))
+            return None
+
+    def save_to_disk(self, sessions):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename so a crash never leaves half a file behind
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(str(tmp_path), 'w') as cache_file:
+            json.dump(sessions, cache_file)
+        tmp_path.replace(self.path)
+
+    def get_session(self, now=None):
+        """Returns (open, close) in epoch seconds of the session we're in at now (epoch
+        seconds, default the current time), or the next one if the market's closed."""
+        if now is None:
+            now = time.time()
+        index = bisect_right(self.closes, now)
+        if index == len(self.closes):
+            raise IndexError("no {} sessions cached after {}".format(self.name, now))
+        return self.opens[index], self.closes[index]
+
+    def get_next_open(self, now=None):
+        """Epoch seconds of today's open if the market opens (or opened) today and
+        hasn't closed yet, otherwise of the next open."""
+        return self.get_session(now)[0]
+
+    def get_close(self, now=None):
+        """Epoch seconds of today's close, early or not, if the market opens (or opened)
+        today and hasn't closed yet, otherwise of the next session's close."""
+        return self.get_session(now)[1]
+
+    def is_open(self, now=None):
+        if now is None:
+            now = time.time()
+        market_open, _ = self.get_session(now)
+        return market_open <= now
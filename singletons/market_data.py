@@ -1,188 +1,571 @@
+import time
+import asyncio
 import threading
+from collections import namedtuple
+from concurrent.futures import Future
 
-import robin_stocks.robinhood as r
-from readerwriterlock import rwlock
-from alpaca_trade_api.stream import Stream
+import numpy as np
 
-from utilities import print_with_lock, get_mean_stddev
+from singletons.quote_book import QuoteBook
+from utilities import print_with_lock
+
+def _timestamp_ns(t):
+    """Alpaca trades carry a pandas Timestamp, anything else (synthetic trades) may
+    carry an int in ns or nothing at all, in which case we stamp it ourselves."""
+    timestamp = getattr(t, 'timestamp', None)
+    if timestamp is None:
+        return time.time_ns()
+    return int(getattr(timestamp, 'value', timestamp))
+
+def _size(t):
+    """Shares traded, 1 for synthetic trades that don't say."""
+    return int(getattr(t, 'size', 1) or 1)
+
+def _raw_timestamp_ns(msg):
+    """Same as _timestamp_ns, for a raw stream message."""
+    timestamp = msg.get('t', None)
+    if timestamp is None:
+        return time.time_ns()
+    return timestamp.to_unix_nano()
+
+def make_stream(alpaca_key, alpaca_secret_key, data_stream_url=None):
+    """Returns an Alpaca Stream on the iex feed, from data_stream_url if given.
+
+    The stream hands callbacks the raw decoded messages (dicts keyed by alpaca's one
+    letter field names) instead of building a Trade or Quote object, with a pandas
+    Timestamp, for every message. That's most of the per message cost otherwise."""
+    # alpaca_trade_api takes half a second to import, backtests never need it
+    from alpaca_trade_api.stream import Stream
+    if data_stream_url is None:
+        return Stream(alpaca_key, alpaca_secret_key, data_feed='iex', raw_data=True)
+    return Stream(alpaca_key, alpaca_secret_key, data_feed='iex', data_stream_url=data_stream_url, raw_data=True)
+
+def _resolve_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+# immutable view of a ticker as of its latest trade. the stream callback builds a
+# fresh one per trade and swaps it in with a single reference assignment, which is
+# atomic, so readers never need a lock to get a consistent set of values
+TickSnapshot = namedtuple('TickSnapshot', ['price', 'mean', 'stddev', 'trend', 'first_price', 'num_trades'])
 
 class TickerData:
-    """POD class that stores the data for a given ticker and fine-grained 
-    locks the reading and writing of it. Data is an array of the last
-    N prices of the stock."""
+    """POD class that stores the data for a given ticker. Data is a ring buffer 
+    of the last N prices of the stock (and their timestamps, in ns since the epoch).
+    
+    There is exactly one writer per ticker (the stream callback), and readers never
+    block it: scalar getters read the latest TickSnapshot, and copies of the window
+    are taken with a sequence counter and retried if a trade lands mid-copy."""
+    # recompute the running sums from scratch this often (in trades, at least
+    # history_len) so floating point error can't build up over the day
+    RENORMALIZE_INTERVAL = 4096
 
-    def __init__(self, curr_price, history_len, trend_len):
-        """n MUST be a power of 2 >= 8 for the circular buffer to work, which is crucial
-        for this class' operations to be O(1)"""
+    def __init__(self, curr_price, history_len, trend_len, price_buffer=None, timestamp_buffer=None, seqs=None, seq_index=0):
+        """Memory is fixed up front: 2 * history_len * (8 + 8) bytes of price and timestamp buffers.
+        Pass the buffers in (e.g. rows of one big matrix) to have them live somewhere else, and
+        seqs to have seq mirrored to seqs[seq_index] (MarketData keeps one array for every ticker)."""
         assert(trend_len >= 2 and trend_len <= history_len) # k must be at least 2
-        self.lock = rwlock.RWLockWrite()
 
-        # important: do not modify these two names, they are used by
-        # strategies/simple_moving_average. unfortunate breach
-        # of privacy but was necessary for speed gains
-        self.prices = [float(curr_price)]
-        self.ind = 1
+        # every price is written twice, at ind and ind+history_len, so that the window
+        # in chronological order is always one contiguous slice of the buffer. that lets
+        # get_ordered_prices hand out a view instead of copying
+        self.price_buffer = price_buffer if price_buffer is not None else np.empty(2*history_len, dtype=np.float64)
+        self.timestamp_buffer = timestamp_buffer if timestamp_buffer is not None else np.empty(2*history_len, dtype=np.int64)
+        self.ind = 0 # slot of the newest price
+        self.count = 1 # number of prices in the window
+        self.price_buffer[0] = self.price_buffer[history_len] = float(curr_price)
+        self.timestamp_buffer[0] = self.timestamp_buffer[history_len] = time.time_ns()
+        self.last_price = float(curr_price)
+
+        # odd while the callback is writing the buffers, bumped twice per trade
+        self.seq = 0
+        self.seqs = seqs if seqs is not None else np.zeros(1, dtype=np.int64)
+        self.seq_index = seq_index
 
         self.history_len = history_len
         self.trend_len = trend_len
-        self.mask = history_len-1 # 0b01111 if n is 16
-        self.has_price_update_occurred = False
+
+        # running sums over the window so get_trend is O(1) regardless of history_len.
+        # prices are shifted by a reference price first, otherwise the sum of squares
+        # dwarfs the variance for expensive stocks and we lose all our precision
+        self.shift = float(curr_price)
+        self.shifted_sum = 0.0
+        self.shifted_square_sum = 0.0
+        self.writes_until_renormalize = max(self.RENORMALIZE_INTERVAL, history_len)
+
+        # number of consecutive trades the price has gone up (positive) or down (negative)
+        self.streak = 0
 
         # track the first price of the day for EOD report
         self.first_price_seen = -1
 
+        # trading threads sleep on this cv until a new trade comes in,
+        # num_trades lets them tell whether they've already seen the newest one
+        self.tick_cv = threading.Condition()
+        self.num_trades = 0
+        self.num_waiting = 0
+        self.stopped = False
+
+        # futures for coroutines waiting on the next trade. only touched
+        # from the stream's event loop, so no locking needed
+        self.async_waiters = []
+
+        # futures for paper orders, each filled at the price of the next trade. the
+        # writer swaps the list out under fills_lock, but only when it's non-empty
+        self.pending_fills = []
+        self.fills_lock = threading.Lock()
+
+        # optional TickRecorder every trade is handed to, see MarketData.attach_recorder
+        self.recorder = None
+        self.recorder_id = 0
+
+        # optional LatencyHistograms for the time spent in on_trade and how old trades are
+        # when they get here, see MarketData.enable_metrics. only one in sample_every trades
+        # is timed, and last_trade_ns is the perf_counter_ns it came in at if the latest
+        # trade was one of them (0 if not), so what follows it can be timed too
+        self.callback_histogram = None
+        self.age_histogram = None
+        self.sample_every = 1
+        self.trades_until_sample = 1
+        self.last_trade_ns = 0
+
+        # streaming indicators fed every trade, keyed by (indicator class, params) so
+        # strategies asking for the same one share it, see strategies/indicators/registry.py.
+        # the writer only loops over the tuple of their update methods
+        self.indicators = {}
+        self.indicator_updates = ()
+
+        self.snapshot = self.build_snapshot()
+
     async def trade_update_callback(self, t):
-        with self.lock.gen_wlock():
-            if len(self.prices) == self.history_len:
-                # circular buffer with bitmasking
-                if self.ind == self.history_len:
-                    self.ind = 0
-                self.prices[self.ind & self.mask] = float(t.price)
-                self.ind += 1
+        self.on_trade(float(t.price), _timestamp_ns(t), _size(t))
+
+    async def raw_trade_update_callback(self, msg):
+        """trade_update_callback for a raw stream message, see make_stream."""
+        self.on_trade(float(msg['p']), _raw_timestamp_ns(msg), int(msg.get('s', 1) or 1))
+
+    def on_trade(self, price, timestamp, size=1):
+        """Records a trade of size shares at price (a float) and timestamp (int ns since
+        the epoch). Only ever call this from one thread (or event loop) per ticker."""
+        timed = False
+        if self.callback_histogram is not None:
+            self.trades_until_sample -= 1
+            if self.trades_until_sample == 0:
+                self.trades_until_sample = self.sample_every
+                timed = True
+                start = time.perf_counter_ns()
+                self.last_trade_ns = start
             else:
-                self.prices.append(float(t.price))
-                self.ind += 1
-                if self.first_price_seen == -1:
-                    self.first_price_seen = float(t.price)
-            self.has_price_update_occurred = True
+                self.last_trade_ns = 0
+        prev = self.last_price
+
+        seq = self.seq + 1
+        self.seq = seq
+        self.seqs[self.seq_index] = seq
+        # locals, this is the hottest function in the bot
+        history_len = self.history_len
+        ind = self.ind + 1
+        if ind == history_len:
+            ind = 0
+        self.ind = ind
+        if self.count == history_len:
+            # evict the oldest price from the running sums. item() skips boxing a numpy float
+            old = self.price_buffer.item(ind) - self.shift
+            self.shifted_sum -= old
+            self.shifted_square_sum -= old*old
+        else:
+            self.count += 1
+            if self.first_price_seen == -1:
+                self.first_price_seen = price
+        self.price_buffer[ind] = self.price_buffer[ind+history_len] = price
+        self.timestamp_buffer[ind] = self.timestamp_buffer[ind+history_len] = timestamp
+        self.last_price = price
+
+        new = price - self.shift
+        self.shifted_sum += new
+        self.shifted_square_sum += new*new
+
+        self.writes_until_renormalize -= 1
+        if self.writes_until_renormalize == 0:
+            self.renormalize()
+        self.seq = seq + 1
+        self.seqs[self.seq_index] = seq + 1
+
+        if price > prev:
+            self.streak = self.streak+1 if self.streak > 0 else 1
+        elif price < prev:
+            self.streak = self.streak-1 if self.streak < 0 else -1
+        else:
+            self.streak = 0
+
+        # only an append to a deque, the writes to disk happen on the recorder's thread
+        if self.recorder is not None:
+            self.recorder.record(self.recorder_id, timestamp, price)
+
+        for update in self.indicator_updates:
+            update(price, timestamp, size)
+
+        # publish before waking anyone so they see this trade
+        self.num_trades += 1
+        self.snapshot = self.build_snapshot()
+
+        if self.pending_fills:
+            self.fill_pending(price)
+
+        # wake everyone waiting on this ticker, exactly once per trade. skipping the cv
+        # when nobody waits is safe, a waiter that registers after this check will
+        # see the num_trades we already bumped before it goes to sleep
+        if self.num_waiting:
+            with self.tick_cv:
+                self.tick_cv.notify_all()
+        if self.async_waiters:
+            for waiter in self.async_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self.async_waiters = []
+
+        if timed:
+            self.callback_histogram.record(time.perf_counter_ns() - start)
+            self.age_histogram.record(time.time_ns() - timestamp)
         
+    def renormalize(self):
+        """Recomputes the running sums exactly, shifted by the current mean.
+        Only called by the writer."""
+        diffs = self.get_ordered_prices()
+        self.shift = float(diffs.mean())
+        diffs = diffs - self.shift
+        self.shifted_sum = float(diffs.sum())
+        self.shifted_square_sum = float(np.dot(diffs, diffs))
+        self.writes_until_renormalize = max(self.RENORMALIZE_INTERVAL, self.history_len)
+
+    def build_snapshot(self):
+        """Only called by the writer."""
+        n = self.count
+        shifted_mean = self.shifted_sum/n
+        # clamp, rounding can push a flat window's variance slightly negative
+        variance = max(0.0, self.shifted_square_sum/n - shifted_mean*shifted_mean)
+
+        # if less than K prices there is no trend. K prices means K-1 moves between them
+        trend = "none"
+        if n >= self.trend_len:
+            if self.streak >= self.trend_len-1:
+                trend = "up"
+            elif self.streak <= -(self.trend_len-1):
+                trend = "down"
+        return TickSnapshot(self.last_price, self.shift + shifted_mean, variance**0.5, trend, self.first_price_seen, self.num_trades)
+
+    def get_ordered_prices(self):
+        """Returns a read-only view of the window's prices, oldest first. No copy is made,
+        so the view changes under you as trades come in. Use copy_ordered_prices
+        for a consistent copy from any thread other than the writer."""
+        end = self.ind+1+self.history_len
+        view = self.price_buffer[end-self.count:end]
+        view.flags.writeable = False
+        return view
+
+    def get_ordered_timestamps(self):
+        """Same as get_ordered_prices, but for the timestamps of those prices."""
+        end = self.ind+1+self.history_len
+        view = self.timestamp_buffer[end-self.count:end]
+        view.flags.writeable = False
+        return view
+
+    def copy_ordered_prices(self):
+        """Returns (num_trades, a copy of the window's prices, oldest first), consistent 
+        with each other. Never blocks the writer, just retries if it moved the window mid-copy."""
+        while True:
+            seq = self.seq
+            num_trades = self.num_trades
+            if seq & 1 == 0:
+                prices = self.get_ordered_prices().copy()
+                if self.seq == seq:
+                    return num_trades, prices
+
+    def get_snapshot(self):
+        return self.snapshot
+
     def get_price(self):
-        with self.lock.gen_rlock():
-            return self.prices[self.ind-1]
+        return self.snapshot.price
         
-    def get_next_price(self):
-        """Blocks until the next price comes in from the callback."""
-        with self.lock.gen_wlock():
-            self.has_price_update_occurred = False
-        
-        # now block until it switches back
-        # not using cvs here because we only use
-        # this function for paper trading and id rather not
-        # stuff up the callback function just for that
-        lock = self.lock.gen_rlock()
-        lock.acquire()
-        while not self.has_price_update_occurred:
-            lock.release()
-            lock.acquire()
+    def request_fill(self):
+        """Returns a Future that resolves to the price of the next trade, for filling a
+        paper order the way a market order would be. Nothing spins or polls: the trade
+        callback resolves it. Cancel it with cancel_fill if you stop waiting, it's
+        cancelled for you by stop_waiting."""
+        fill = Future()
+        with self.fills_lock:
+            if self.stopped:
+                fill.cancel()
+            else:
+                self.pending_fills.append(fill)
+        return fill
+
+    def cancel_fill(self, fill):
+        """Stops fill from being filled, unless it already was. Returns True if it was cancelled."""
+        with self.fills_lock:
+            if fill in self.pending_fills:
+                self.pending_fills.remove(fill)
+        return fill.cancel()
+
+    def fill_pending(self, price):
+        """Only called by the writer."""
+        with self.fills_lock:
+            fills = self.pending_fills
+            self.pending_fills = []
+        for fill in fills:
+            if fill.set_running_or_notify_cancel():
+                fill.set_result(price)
+
+    def wait_for_trade(self, last_seen, timeout=None):
+        """Blocks until a trade newer than last_seen (a previous return value
+        of this function, or 0) comes in, or the timeout passes.
         
-        # now return recent price
-        lock.release()
-        return self.get_price()
+        Returns the number of trades seen so far, which will equal last_seen on timeout
+        or once stop_waiting has been called."""
+        with self.tick_cv:
+            self.num_waiting += 1
+            self.tick_cv.wait_for(lambda: self.num_trades != last_seen or self.stopped, timeout)
+            self.num_waiting -= 1
+            return self.num_trades
+
+    async def wait_for_trade_async(self, last_seen, timeout=None):
+        """Coroutine version of wait_for_trade. Must be awaited on the event loop
+        that runs the stream, as the trade callback resolves the waiters directly."""
+        if self.num_trades != last_seen or self.stopped:
+            return self.num_trades
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self.async_waiters.append(waiter)
+        timeout_handle = None
+        if timeout is not None:
+            timeout_handle = loop.call_later(timeout, _resolve_waiter, waiter)
+        await waiter
+        if timeout_handle is not None:
+            timeout_handle.cancel()
+        return self.num_trades
+
+    def stop_waiting(self):
+        """Wakes everyone waiting on a trade now, and makes every later wait return
+        straight away. Pending paper fills are cancelled. Async waiters are only
+        woken if this is called from the stream's event loop (or there is none)."""
+        with self.tick_cv:
+            self.stopped = True
+            self.tick_cv.notify_all()
+        for waiter in self.async_waiters:
+            _resolve_waiter(waiter)
+        self.async_waiters = []
+        with self.fills_lock:
+            fills = self.pending_fills
+            self.pending_fills = []
+        for fill in fills:
+            fill.cancel()
 
     def get_last_k_prices_in_order(self):
-        """This function assumes you have the rlock already."""
-        # first get the indices (will add n to the negative ones later)
-        last_k_in_order = []
-        i = self.ind-1
-        for _ in range(self.trend_len):
-            last_k_in_order.append(i)
-            i -= 1
-
-        return list(map((lambda x: self.prices[x] if x in range(len(self.prices)) else self.prices[x+len(self.prices)]), last_k_in_order))
+        """Newest price first."""
+        _, prices = self.copy_ordered_prices()
+        return prices[:-self.trend_len-1:-1].tolist()
     
     def get_trend(self):
-        """Return mean, stddev, and whether or not the last K trades went up in price."""
-        with self.lock.gen_rlock():
-            mean, stddev = get_mean_stddev(self.prices)
-            # if less than 3 prices, return none
-            if len(self.prices) < self.trend_len:
-                return mean, stddev, "none"
-            last_k_in_order = self.get_last_k_prices_in_order()
-
-            # could probably release the rlock here
-
-            # if all k went up from prev, good sign
-            # if all k went down, bad sign
-            # if inconclusive, neutral
-
-            # legal because k must be >= 2
-            if last_k_in_order[0] == last_k_in_order[1]:
-                return mean, stddev, "none"
-            up = last_k_in_order[0] > last_k_in_order[1]
-            prev = last_k_in_order[1]
-            for i in range(2, len(last_k_in_order)):
-                if up:
-                    if last_k_in_order[i] <= prev:
-                        return mean, stddev, "none"
-                    prev = last_k_in_order[i]
-                else:
-                    if last_k_in_order[i] >= prev:
-                        return mean, stddev, "none"
-                    prev = last_k_in_order[i]
-            
-            # otherwise all k passed the trend
-            return mean, stddev, "up" if up else "down"
+        """Return mean, stddev, and whether or not the last K trades went up in price.
+        
+        A trend is "up" or "down" only if each of the last K prices strictly rose
+        (or fell) from the one before, otherwise "none"."""
+        snapshot = self.snapshot
+        return snapshot.mean, snapshot.stddev, snapshot.trend
 
     def get_first_price_of_day(self):
-        with self.lock.gen_rlock():
-            return self.first_price_seen
+        return self.snapshot.first_price
 
     def print(self):
-        with self.lock.gen_rlock():
-            print_with_lock("TICKERDATA: ind={}, prices={}".format(self.ind, self.prices))
+        _, prices = self.copy_ordered_prices()
+        print_with_lock("TICKERDATA: ind={}, prices={}".format(self.ind, prices.tolist()))
 
 
 class MarketData:
     """Threadsafe class that handles the concurrent reading and writing of the market data
-    for the relevant tickers. Should really be a singleton."""
+    for the relevant tickers. Should really be a singleton.
+    
+    None of the getters take a lock, see TickerData."""
 
-    def __init__(self, tickers, alpaca_key, alpaca_secret_key, history_len, trend_len):
+    def __init__(self, tickers, alpaca_key, alpaca_secret_key, history_len, trend_len, initial_data=None, data_stream_url=None, subscribe_quotes=False, price_snapshot=None):
+        """Pass None for the alpaca keys to skip the stream entirely, initial_data
+        (a price per ticker, in order) to skip fetching the latest prices from RH,
+        price_snapshot (a PriceSnapshot) to fetch them with other than the defaults,
+        data_stream_url to stream from somewhere other than Alpaca, and subscribe_quotes
+        to keep the latest bid and ask for every ticker too (see get_quote_for_ticker)."""
         # all for hashless O(1) access of our sweet sweet data
         self.tickers = tickers
         self.tickers_to_indices = {}
         for i in range(len(tickers)):
             self.tickers_to_indices[tickers[i]] = i
-        self.stream = Stream(alpaca_key, alpaca_secret_key, data_feed='iex')
+        self.stream = None
+        self.stream_thread = None
+        if alpaca_key is not None:
+            self.stream = make_stream(alpaca_key, alpaca_secret_key, data_stream_url)
 
-        initial_data = r.stocks.get_latest_price(self.tickers, priceType=None, includeExtendedHours=True)
+        if initial_data is None:
+            if price_snapshot is None:
+                # imports robin_stocks, backtests always pass initial_data
+                from singletons.price_snapshot import PriceSnapshot
+                price_snapshot = PriceSnapshot()
+            initial_data = price_snapshot.get_prices(self.tickers)
+        # every ticker's buffers are a row of these, so a batch of tickers'
+        # windows can be gathered in one numpy operation, see copy_price_windows
+        self.history_len = history_len
+        self.trend_len = trend_len
+        self.price_matrix = np.empty((len(tickers), 2*history_len), dtype=np.float64)
+        self.timestamp_matrix = np.empty((len(tickers), 2*history_len), dtype=np.int64)
+        self.seqs = np.zeros(len(tickers), dtype=np.int64)
         self.data = []
-        for ticker in tickers:
+        for i, ticker in enumerate(tickers):
             # for each ticker, we need:
             # - most recent price
-            # - rwlock
+            # - ring buffer rows
             # - callback function for stream that updates most recent price
-            ticker_data = TickerData(initial_data[self.tickers_to_indices[ticker]], history_len, trend_len)
-            self.stream.subscribe_trades(ticker_data.trade_update_callback, ticker)
+            ticker_data = TickerData(initial_data[i], history_len, trend_len, self.price_matrix[i], self.timestamp_matrix[i], self.seqs, i)
+            if self.stream is not None:
+                self.stream.subscribe_trades(ticker_data.raw_trade_update_callback, ticker)
             self.data.append(ticker_data)
 
+        self.quote_book = None
+        if subscribe_quotes:
+            self.quote_book = self.make_quote_book()
+            if self.stream is not None:
+                self.stream.subscribe_quotes(self.quote_update_callback, *tickers)
+
         # only start stream when the market is open
+
+    def make_quote_book(self):
+        return QuoteBook(len(self.tickers))
+
+    async def quote_update_callback(self, msg):
+        # a raw stream message, see make_stream
+        self.quote_book.on_quote(self.tickers_to_indices[msg['S']], float(msg['bp']), float(msg['ap']))
     
     def get_ticker_data_for_ticker(self, ticker):
         return self.data[self.tickers_to_indices[ticker]]
 
+    def copy_price_windows(self, ticker_indices):
+        """Returns (windows, counts, num_trades) for the tickers at ticker_indices (an int
+        array of indices into self.tickers). windows is a len(ticker_indices) x history_len
+        copy of each ticker's prices, oldest first, padded on the left with NaN where a
+        ticker has fewer than history_len prices so far. counts is how many prices each
+        ticker has, and num_trades the trade count each window is as of.
+
+        Everything is vectorised over the tickers, no python loop over them. Like
+        copy_ordered_prices, any ticker a trade lands on mid-copy is copied again."""
+        history_len = self.history_len
+        ticker_indices = np.asarray(ticker_indices)
+        seqs = self.seqs[ticker_indices]
+
+        # every trade moves ind forward one slot from 0 and bumps seq by two,
+        # so seq says where each window is without touching the TickerData objects
+        num_trades = seqs >> 1
+        inds = num_trades % history_len
+        counts = np.minimum(num_trades + 1, history_len)
+
+        # a full window for a ticker is slots ind+1 .. ind+history_len of its row
+        offsets = np.arange(history_len)
+        windows = self.price_matrix[ticker_indices[:, None], inds[:, None] + 1 + offsets]
+        if counts.min(initial=history_len) < history_len:
+            windows[offsets[None, :] < (history_len - counts)[:, None]] = np.nan
+
+        torn = (self.seqs[ticker_indices] != seqs) | (seqs & 1 == 1)
+        for row in np.flatnonzero(torn).tolist():
+            num_trades[row], prices = self.data[ticker_indices[row]].copy_ordered_prices()
+            counts[row] = len(prices)
+            windows[row, :history_len-len(prices)] = np.nan
+            windows[row, history_len-len(prices):] = prices
+        return windows, counts, num_trades
+
+    def attach_recorder(self, recorder):
+        """Hands every trade for every ticker to recorder (a tick_store.TickRecorder)
+        from now on. Call this before starting the stream."""
+        for ticker, ticker_data in zip(self.tickers, self.data):
+            ticker_data.recorder_id = recorder.get_ticker_id(ticker)
+            ticker_data.recorder = recorder
+
+    def enable_metrics(self, metrics):
+        """Times every ticker's trades (one in metrics.sample_every of them) into metrics
+        (a metrics.Metrics) from now on. Call this before starting the stream."""
+        for ticker, ticker_data in zip(self.tickers, self.data):
+            ticker_data.sample_every = ticker_data.trades_until_sample = metrics.sample_every
+            ticker_data.age_histogram = metrics.get_histogram("trade_age", ticker)
+            ticker_data.callback_histogram = metrics.get_histogram("trade_callback", ticker)
+
     def start_stream(self):
         """Call this function when the market is open.
         
         Starts a daemon thread which consumes new ticker updates
         from the Alpaca stream and updates the relevant data in this object."""
+        if self.stream is None:
+            return
         self.stream_thread = threading.Thread(target=self.stream.run, daemon=True)
         self.stream_thread.start()
 
+    async def run_stream_async(self):
+        """Alternative to start_stream for the asyncio engine: consumes the
+        Alpaca stream on the caller's event loop until cancelled."""
+        if self.stream is None:
+            return
+        try:
+            await self.stream._run_forever()
+        finally:
+            await self.stream.stop_ws()
+
+    def stop_stream(self):
+        """Call this once the day is over to disconnect from the stream."""
+        # the asyncio engine's stream already stopped itself in run_stream_async
+        if self.stream_thread is not None:
+            self.stream.stop()
+            self.stream_thread.join()
+
+    def stop_waiting(self):
+        """Wakes everything waiting on a trade for any ticker, see TickerData.stop_waiting.
+        Register this as a MarketTime close callback so nobody sleeps through the close."""
+        for ticker_data in self.data:
+            ticker_data.stop_waiting()
+
     def get_data_for_ticker(self, ticker):
         # can be called by any thread
         return self.get_ticker_data_for_ticker(ticker).get_price()
 
-    def get_next_data_for_ticker(self, ticker):
-        return self.get_ticker_data_for_ticker(ticker).get_next_price()
+    def request_fill_for_ticker(self, ticker):
+        return self.get_ticker_data_for_ticker(ticker).request_fill()
+
+    def cancel_fill_for_ticker(self, ticker, fill):
+        return self.get_ticker_data_for_ticker(ticker).cancel_fill(fill)
+
+    def wait_for_trade_for_ticker(self, ticker, last_seen, timeout=None):
+        return self.get_ticker_data_for_ticker(ticker).wait_for_trade(last_seen, timeout)
+
+    async def wait_for_trade_for_ticker_async(self, ticker, last_seen, timeout=None):
+        return await self.get_ticker_data_for_ticker(ticker).wait_for_trade_async(last_seen, timeout)
 
     def get_trend_for_ticker(self, ticker):
         return self.get_ticker_data_for_ticker(ticker).get_trend()
     
+    def get_snapshot_for_ticker(self, ticker):
+        return self.get_ticker_data_for_ticker(ticker).get_snapshot()
+
     def get_first_price_of_day_for_ticker(self, ticker):
         return self.get_ticker_data_for_ticker(ticker).get_first_price_of_day()
 
+    def get_quote_for_ticker(self, ticker):
+        """Returns (bid, ask) from the latest quote for ticker, or None if we
+        aren't subscribed to quotes or there hasn't been one yet. Never blocks."""
+        if self.quote_book is None:
+            return None
+        return self.quote_book.get_quote(self.tickers_to_indices[ticker])
+
     def print_data(self):
         """Pretty printing for the internal data of this object."""
         print_with_lock("---- MARKET DATA ----")
         for ticker, index in self.tickers_to_indices.items():
             ticker_data = self.data[index]
-            with ticker_data.lock.gen_rlock():
-                if len(ticker_data.prices) < ticker_data.trend_len:
-                    # make a reversed copy of the list
-                    data_snippet = ticker_data.prices[::-1]
-                else:
-                    data_snippet = ticker_data.get_last_k_prices_in_order()
-                
-                # data will always be nonempty for a ticker
-                print_with_lock("{}: {} {}".format(ticker, data_snippet[0], data_snippet))
+            # newest first, at most trend-len of them
+            data_snippet = ticker_data.get_last_k_prices_in_order()
+            
+            # data will always be nonempty for a ticker
+            print_with_lock("{}: {} {}".format(ticker, data_snippet[0], data_snippet))
         print_with_lock("---------------------")
@@ -1,3 +1,4 @@
+import threading
 from datetime import timedelta, datetime
 
 from readerwriterlock import rwlock
@@ -7,26 +8,70 @@ from utilities import print_with_lock
 class MarketTime:
     """Threadsafe class for concurrent reads and writes to the 
     time left in market day for trading. Should be a singleton."""
-    
-    def __init__(self, end_of_day):
+    # longest we sleep at a time waiting for the close, in seconds
+    MAX_SLEEP = 60.0
+
+    def __init__(self, end_of_day, clock=datetime.now):
+        """clock is any callable returning the current naive datetime. Backtests
+        pass a simulated one so the whole day doesn't take a whole day."""
         self.lock = rwlock.RWLockWrite()
+        self.clock = clock
         self.END_OF_DAY = end_of_day
         self.ZERO_TIME = timedelta()
         self.time_until_close = 0
+
+        # set once the end of the day has passed, so threads can wait on it instead of polling
+        self.closed = threading.Event()
+        self.close_callbacks = []
         self.update()
 
+    @classmethod
+    def from_calendar(cls, calendar, end_of_day=None, clock=datetime.now):
+        """Returns a MarketTime that ends at today's actual close according to calendar (a
+        MarketCalendar), early closes included, or at end_of_day (a time today) if that's
+        earlier. Today means the session we're in, or the next one if the market's closed."""
+        close = datetime.fromtimestamp(calendar.get_close())
+        if end_of_day is not None:
+            close = min(close, datetime.combine(close.date(), end_of_day))
+        return cls(close, clock)
+
     def update(self):
         """Update time left to trade for this and all tradingthread objects."""
         with self.lock.gen_wlock():
-            self.time_until_close = self.END_OF_DAY - datetime.now()
+            self.time_until_close = self.END_OF_DAY - self.clock()
+        if self.time_until_close <= self.ZERO_TIME and not self.closed.is_set():
+            self.closed.set()
+            for callback in self.close_callbacks:
+                callback()
         
         # for debugging purposes only
         # self.print_time()
     
+    def add_close_callback(self, callback):
+        """callback is called once, by whichever thread calls the update() that notices the close."""
+        self.close_callbacks.append(callback)
+
+    def get_seconds_until_close(self):
+        """Seconds left in the day according to the clock right now, not as of the last update()."""
+        return (self.END_OF_DAY - self.clock()).total_seconds()
+
+    def wait_until_close(self):
+        """Sleeps until the end of the day, then updates. Only makes sense with a real clock.
+        Wakes at least every MAX_SLEEP seconds in case the system clock was changed."""
+        while not self.closed.is_set():
+            seconds_left = self.get_seconds_until_close()
+            if seconds_left > 0:
+                self.closed.wait(min(seconds_left, self.MAX_SLEEP))
+            self.update()
+
+    def now(self):
+        """The current time according to this market's clock. Use this instead of datetime.now()."""
+        return self.clock()
+
     def is_time_left_to_trade(self):
-        # not too shabby python RAII
-        with self.lock.gen_rlock():
-            return self.time_until_close > self.ZERO_TIME
+        # no rlock needed, reading one attribute is atomic and every trading
+        # thread calls this once per trade
+        return self.time_until_close > self.ZERO_TIME
 
     def print_time(self):
         print_with_lock("---- MARKET TIME ----")
@@ -0,0 +1,204 @@
+import time
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from utilities import print_with_lock, LazyModule
+from traderbot_exception import TraderbotException, PartialFillException, OrderStateUnknownException
+
+# only real trading needs robinhood
+r = LazyModule("robin_stocks.robinhood")
+
+# an order in one of these states will never change again
+TERMINAL_STATES = ['filled', 'cancelled', 'rejected', 'failed']
+
+class RobinhoodOrders:
+    """The RH calls OrderTracker needs. Pass something else with the same
+    methods to OrderTracker to run it without a RH account."""
+
+    def get_orders_updated_since(self, since):
+        """Returns every order (as RH's response dicts) updated at or after the
+        ISO 8601 timestamp since, in a single paginated request."""
+        return r.helper.request_get(r.urls.orders_url(), 'pagination', { 'updated_at[gte]': since })
+
+    def get_stock_order_info(self, order_id):
+        return r.orders.get_stock_order_info(order_id)
+
+    def cancel_order(self, order_id):
+        return r.orders.cancel_stock_order(order_id)
+
+
+class TrackedOrder:
+    """POD class for an order the tracker is waiting on."""
+    def __init__(self, resp, ticker, deadline):
+        self.id = resp['id']
+        self.ticker = ticker
+        self.resp = resp
+        self.deadline = deadline
+        self.cancelled_at = None
+        self.future = Future()
+
+
+class OrderTracker:
+    """Threadsafe class that waits on every outstanding order at once. Should be a singleton.
+
+    One background thread asks the broker for all orders updated since the oldest
+    outstanding one, so the number of requests doesn't grow with the number of open
+    orders. It polls every MAX_POLL_INTERVAL seconds with one order open (what
+    polling that order on its own used to cost) and faster the more are open, down
+    to MIN_POLL_INTERVAL. Each order resolves a future as soon as the
+    poll sees it finish. Orders still open at their deadline are cancelled, and if
+    part of one filled before the cancel went through the future raises a
+    PartialFillException saying how much. One whose cancel never confirms is asked
+    about once more, and if it's still open its future raises an
+    OrderStateUnknownException, since it may yet fill."""
+    MIN_POLL_INTERVAL = 0.1
+    MAX_POLL_INTERVAL = 0.5
+    TIMEOUT = 10
+
+    # give up on an order this many seconds after cancelling it
+    CANCEL_TIMEOUT = 5
+
+    def __init__(self, broker=None):
+        self.broker = broker if broker is not None else RobinhoodOrders()
+        self.lock = threading.Lock()
+        self.orders_changed = threading.Condition(self.lock)
+        self.orders = {}
+        self.num_requests = 0
+        self.poll_thread = threading.Thread(target=self.poll_until_stopped, daemon=True)
+        self.poll_thread.start()
+
+    def track(self, resp, ticker, timeout=TIMEOUT):
+        """Starts tracking the order described by resp (the response from placing it).
+        Returns a Future that resolves to the final response dict once the order fills."""
+        if resp is None or resp.get('id', None) is None:
+            raise TraderbotException("initial order for {} failed: {}".format(ticker, resp))
+        order = TrackedOrder(resp, ticker, time.monotonic() + timeout)
+        if resp.get('state', None) in TERMINAL_STATES:
+            self.resolve(order)
+            return order.future
+        with self.lock:
+            self.orders[order.id] = order
+            self.orders_changed.notify()
+        return order.future
+
+    def wait_for_order(self, resp, ticker, timeout=TIMEOUT):
+        """Blocks until the order described by resp fills, returning the final
+        response dict. Throws if it doesn't fill within timeout seconds."""
+        future = self.track(resp, ticker, timeout)
+        try:
+            # the poller gives up on the order before this, unless the poller itself is stuck
+            return future.result(timeout + self.CANCEL_TIMEOUT + self.MAX_POLL_INTERVAL)
+        except TimeoutError:
+            with self.lock:
+                order = self.orders.pop(resp['id'], None)
+            if order is not None:
+                self.settle(order)
+        try:
+            # if the poller already took the order, it's settling it now
+            return future.result(self.CANCEL_TIMEOUT)
+        except TimeoutError:
+            raise OrderStateUnknownException(ticker, resp)
+
+    def get_num_outstanding(self):
+        with self.lock:
+            return len(self.orders)
+
+    def resolve(self, order):
+        """Completes the order's future according to its (terminal) state."""
+        resp = order.resp
+        if resp['state'] == 'filled':
+            order.future.set_result(resp)
+            return
+        filled = float(resp.get('cumulative_quantity', None) or 0.0)
+        if filled > 0:
+            order.future.set_exception(PartialFillException(order.ticker, resp))
+        elif order.cancelled_at is not None:
+            order.future.set_exception(TraderbotException("order for {} timed out".format(order.ticker)))
+        else:
+            order.future.set_exception(TraderbotException("order for {} was {} unexpectedly: {}".format(order.ticker, resp['state'], resp)))
+
+    def get_poll_interval(self):
+        """Seconds until the next poll, shorter the more orders are open."""
+        with self.lock:
+            num_orders = len(self.orders)
+        return max(self.MIN_POLL_INTERVAL, self.MAX_POLL_INTERVAL / max(num_orders, 1))
+
+    def poll_until_stopped(self):
+        while True:
+            with self.lock:
+                while len(self.orders) == 0:
+                    self.orders_changed.wait()
+            # anything going wrong here must not kill the thread, every open order waits on it
+            try:
+                self.poll_once()
+            except Exception as e:
+                print_with_lock("order tracker couldn't poll for order updates:", str(e))
+            time.sleep(self.get_poll_interval())
+
+    def poll_once(self):
+        with self.lock:
+            if len(self.orders) == 0:
+                return
+            # the oldest update we know of, anything that changed since then comes back
+            since = min(order.resp.get('updated_at', None) or order.resp.get('created_at') for order in self.orders.values())
+        try:
+            self.num_requests += 1
+            updates = self.broker.get_orders_updated_since(since)
+        except Exception as e:
+            print_with_lock("order tracker couldn't get order updates:", str(e))
+            updates = []
+        self.apply_updates(updates or [])
+        self.cancel_expired_orders()
+
+    def apply_updates(self, updates):
+        finished = []
+        with self.lock:
+            for resp in updates:
+                # skip anything malformed rather than lose the rest of the updates
+                if not isinstance(resp, dict) or 'state' not in resp:
+                    continue
+                order = self.orders.get(resp.get('id', None), None)
+                if order is None:
+                    continue
+                order.resp = resp
+                if resp['state'] in TERMINAL_STATES:
+                    finished.append(self.orders.pop(order.id))
+        # resolve outside the lock, callbacks on the futures run here
+        for order in finished:
+            self.resolve(order)
+
+    def cancel_expired_orders(self):
+        now = time.monotonic()
+        to_cancel = []
+        abandoned = []
+        with self.lock:
+            for order in list(self.orders.values()):
+                if order.cancelled_at is None and now >= order.deadline:
+                    order.cancelled_at = now
+                    to_cancel.append(order)
+                elif order.cancelled_at is not None and now >= order.cancelled_at + self.CANCEL_TIMEOUT:
+                    abandoned.append(self.orders.pop(order.id))
+        for order in to_cancel:
+            try:
+                self.num_requests += 1
+                self.broker.cancel_order(order.id)
+            except Exception as e:
+                print_with_lock("order tracker couldn't cancel order for {}:".format(order.ticker), str(e))
+        for order in abandoned:
+            self.settle(order)
+
+    def settle(self, order):
+        """Resolves an order we've stopped tracking by asking RH about it one last time.
+        If it still isn't finished nobody knows whether it'll fill, and the future
+        raises an OrderStateUnknownException."""
+        try:
+            self.num_requests += 1
+            resp = self.broker.get_stock_order_info(order.id)
+        except Exception as e:
+            print_with_lock("order tracker couldn't get the order for {}:".format(order.ticker), str(e))
+            resp = None
+        if isinstance(resp, dict) and resp.get('state', None) in TERMINAL_STATES:
+            order.resp = resp
+            self.resolve(order)
+        else:
+            order.future.set_exception(OrderStateUnknownException(order.ticker, order.resp))
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import tick_store
+from utilities import print_with_lock, LazyModule
+from traderbot_exception import APIException
+
+# only imported once there's something to fetch
+r = LazyModule("robin_stocks.robinhood")
+
+class PriceSnapshot:
+    """Fetches the latest price of every ticker from RH before the stream starts.
+
+    r.stocks.get_latest_price asks for every ticker in one request with no timeout,
+    so one slow response holds up the whole startup and the url grows with the
+    universe. Here the tickers are split into CHUNK_SIZE symbol requests, up to
+    max_workers of them at once, each with its own timeout and retried a few
+    times. Anything RH still doesn't give us a price for gets the last price
+    recorded for it under fallback_dir (see tick_store.py), if there is one."""
+    # symbols per quotes request, keeps every url short
+    CHUNK_SIZE = 100
+
+    # seconds to wait for a chunk's response, and for each retry after it fails
+    TIMEOUT = 2.0
+    RETRIES = 2
+    RETRY_DELAY = 0.25
+
+    def __init__(self, fallback_dir=None, max_workers=16, chunk_size=CHUNK_SIZE, timeout=TIMEOUT, retries=RETRIES, quotes_url=None):
+        """fallback_dir is a record-trades directory, quotes_url defaults to RH's."""
+        self.fallback_dir = fallback_dir
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = retries
+        self.quotes_url = quotes_url
+
+    def fetch_chunk(self, chunk):
+        """Returns { ticker: price } for the tickers in chunk RH has a price for.
+        Raises a requests.RequestException or ValueError if the request fails."""
+        # robin_stocks' session, so it's logged in and pooled, see session.py
+        resp = r.globals.SESSION.get(self.quotes_url, params={ 'symbols': ','.join(chunk) }, timeout=self.timeout)
+        resp.raise_for_status()
+        prices = {}
+        for quote in resp.json()['results']:
+            # unknown symbols come back as None
+            if quote is None:
+                continue
+            # same as get_latest_price with includeExtendedHours
+            price = quote['last_extended_hours_trade_price']
+            if price is None:
+                price = quote['last_trade_price']
+            if price is not None:
+                prices[quote['symbol']] = float(price)
+        return prices
+
+    def fetch_chunk_with_retries(self, chunk):
+        delay = self.RETRY_DELAY
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fetch_chunk(chunk)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print_with_lock("fetching prices for {}..{} failed (attempt {} of {}): {}".format(
+                    chunk[0], chunk[-1], attempt + 1, self.retries + 1, e))
+            if attempt != self.retries:
+                time.sleep(delay)
+                delay *= 2
+        return {}
+
+    def get_prices(self, tickers):
+        """Returns the latest price of each of tickers, in order. Raises an APIException
+        if RH and the recordings between them have no price for some of them."""
+        if self.quotes_url is None:
+            self.quotes_url = r.urls.quotes_url()
+        chunks = [tickers[i:i+self.chunk_size] for i in range(0, len(tickers), self.chunk_size)]
+        prices = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk_prices in executor.map(self.fetch_chunk_with_retries, chunks):
+                prices.update(chunk_prices)
+
+        missing = [ticker for ticker in tickers if ticker not in prices]
+        if len(missing) != 0 and self.fallback_dir is not None:
+            recorded = tick_store.find_last_prices(self.fallback_dir, missing)
+            print_with_lock("using the last recorded price for {} of {} tickers RH had no price for".format(len(recorded), len(missing)))
+            prices.update(recorded)
+            missing = [ticker for ticker in missing if ticker not in prices]
+        if len(missing) != 0:
+            raise APIException("could not get a price for {} tickers: {}".format(len(missing), ", ".join(missing[:10])))
+        print_with_lock("fetched the latest prices of {} tickers in {} requests".format(len(tickers), len(chunks)))
+        return [prices[ticker] for ticker in tickers]
@@ -0,0 +1,66 @@
+import numpy as np
+
+class QuoteBook:
+    """Latest bid and ask for every ticker, and nothing more. Quotes come in many times
+    faster than trades, so rather than keeping a history of them each new quote just
+    overwrites the last one for its ticker (conflation): two numpy writes, no
+    snapshot, no waking anyone.
+
+    Like TickerData there's one writer per ticker, and readers never block it:
+    each ticker has a sequence counter that's odd while its quote is being
+    written, and a read that overlaps a write is retried. Within one process the GIL
+    keeps that in order. Across processes (ShardedMarketData keeps the book in shared
+    memory) it relies on x86 ordering of stores and of loads: on ARM a reader could
+    see the new seq before the new quote, so check_config won't shard quotes there."""
+    # index of each side in a quote
+    BID = 0
+    ASK = 1
+
+    def __init__(self, num_tickers, buffer=None):
+        """Memory is 3 * 8 bytes per ticker. Pass buffer (at least get_size(num_tickers)
+        bytes, e.g. shared memory) to keep the book in it, in which case it's left
+        as is, call clear() if it's new."""
+        owned = buffer is None
+        if owned:
+            buffer = bytearray(self.get_size(num_tickers))
+        self.seqs = np.ndarray((num_tickers,), dtype=np.int64, buffer=buffer)
+        # (bid, ask) per ticker, NaN until the first quote
+        self.quotes = np.ndarray((num_tickers, 2), dtype=np.float64, buffer=buffer, offset=8*num_tickers)
+        if owned:
+            self.clear()
+
+    @staticmethod
+    def get_size(num_tickers):
+        return 3*8*num_tickers
+
+    def clear(self):
+        self.seqs[:] = 0
+        self.quotes[:] = np.nan
+
+    def on_quote(self, index, bid, ask):
+        """Records the latest quote for the ticker at index. Only ever call this
+        from one thread (or process) per ticker."""
+        seqs = self.seqs
+        seq = seqs.item(index) + 1
+        seqs[index] = seq
+        # two scalar writes beat assigning a tuple to the row
+        quotes = self.quotes
+        quotes[index, 0] = bid
+        quotes[index, 1] = ask
+        seqs[index] = seq + 1
+
+    def get_quote(self, index):
+        """Returns (bid, ask) from the latest quote for the ticker at index,
+        or None if there hasn't been one."""
+        seqs = self.seqs
+        quotes = self.quotes
+        while True:
+            seq = seqs.item(index)
+            if seq & 1 == 0:
+                bid = quotes.item(index, 0)
+                ask = quotes.item(index, 1)
+                if seqs.item(index) == seq:
+                    break
+        if seq == 0:
+            return None
+        return bid, ask
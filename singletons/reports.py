@@ -6,23 +6,29 @@ from utilities import print_with_lock
 class Reports:
     """Threadsafe class that handles the concurrent reading and writing of the individual
     thread reports. Should really be a singleton."""
-    lock = threading.Lock()
-    reports = []
     def __init__(self):
-        pass
+        self.lock = threading.Lock()
+        self.reports = []
 
     def add_eod_report(self, report):
         with self.lock:
             self.reports.append(report)
     
-    def print_eod_reports(self):
+    def get_summary(self):
+        """Returns the total number of trades made and net profit across all reports."""
         net = 0.0
         trades = 0
+        with self.lock:
+            for report in self.reports:
+                net += report['traderbot net performance']
+                trades += report['total trades made']
+        return trades, net
+
+    def print_eod_reports(self):
+        trades, net = self.get_summary()
         pp = pprint.PrettyPrinter(indent=4, sort_dicts=False)
         print_with_lock("=============================== EOD REPORTS ===============================")
         for report in self.reports:
-            net += report['traderbot net performance']
-            trades += report['total trades made']
-            pp.pprint(report)
+            print_with_lock(pp.pformat(report))
         print_with_lock("===========================================================================")
         print_with_lock("final summary: {} trades made for a net profit of {}".format(trades, net))
@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from singletons.market_data import MarketData, make_stream, _raw_timestamp_ns
+from singletons.quote_book import QuoteBook
+from utilities import print_with_lock
+
+class TradeRing:
+    """Fixed size queue of trades in shared memory, with exactly one process pushing
+    and one thread draining. Trades are (ticker index, timestamp ns, price, size) rows.
+
+    The pusher fills in a row, then publishes it by bumping the write count. The
+    drainer only reads rows below the write count, and gives rows back by bumping
+    the read count. If the drainer falls a whole ring behind, new trades are dropped
+    (and counted) rather than overwriting ones it hasn't read yet.
+
+    The counts and the WAKEUP_PENDING flag are only ever touched while holding
+    lock, a multiprocessing.Lock. Taking and releasing it are full memory barriers
+    on any CPU, so the drainer never sees a count before the rows under it, and a
+    push either lands before a drain clears the flag (and gets drained) or sees the
+    flag cleared (and asks for a wakeup). Rows themselves are read and written
+    outside it, so that's one lock round trip per push and two per drain."""
+    # slots in the header, each an int64
+    WRITE_COUNT = 0
+    READ_COUNT = 1
+    WAKEUP_PENDING = 2
+    DROPPED = 3
+    HEADER_LEN = 4
+
+    def __init__(self, capacity, name=None, lock=None):
+        """Creates a new ring if name is None, otherwise attaches to an existing one,
+        in which case pass the lock of the ring being attached to."""
+        self.capacity = capacity
+        size = 8*self.HEADER_LEN + capacity*(8+8+8+8)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.lock = multiprocessing.Lock()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.lock = lock
+        buf = self.shm.buf
+        self.header = np.ndarray((self.HEADER_LEN,), dtype=np.int64, buffer=buf)
+        offset = 8*self.HEADER_LEN
+        self.ticker_indices = np.ndarray((capacity,), dtype=np.int64, buffer=buf, offset=offset)
+        self.timestamps = np.ndarray((capacity,), dtype=np.int64, buffer=buf, offset=offset + 8*capacity)
+        self.prices = np.ndarray((capacity,), dtype=np.float64, buffer=buf, offset=offset + 16*capacity)
+        self.sizes = np.ndarray((capacity,), dtype=np.int64, buffer=buf, offset=offset + 24*capacity)
+        if name is None:
+            self.header[:] = 0
+        # the pusher's last look at the read count, it only ever goes up so an old one
+        # just means less room than there really is
+        self.known_read_count = 0
+
+    def push(self, ticker_index, timestamp, price, size):
+        """Returns True if the drainer should be woken up."""
+        header = self.header
+        # only the pusher writes the write count, so it can read it without the lock
+        write_count = header.item(self.WRITE_COUNT)
+        if write_count - self.known_read_count >= self.capacity:
+            with self.lock:
+                self.known_read_count = header.item(self.READ_COUNT)
+            if write_count - self.known_read_count >= self.capacity:
+                header[self.DROPPED] += 1
+                return False
+        slot = write_count % self.capacity
+        self.ticker_indices[slot] = ticker_index
+        self.timestamps[slot] = timestamp
+        self.prices[slot] = price
+        self.sizes[slot] = size
+        # publish the row, then ask for a wakeup if nobody asked already
+        with self.lock:
+            header[self.WRITE_COUNT] = write_count + 1
+            self.known_read_count = header.item(self.READ_COUNT)
+            if header.item(self.WAKEUP_PENDING) != 0:
+                return False
+            header[self.WAKEUP_PENDING] = 1
+        return True
+
+    def drain(self, on_trade):
+        """Calls on_trade(ticker index, timestamp, price, size) for every trade pushed
+        since the last drain, in order. Returns how many there were."""
+        header = self.header
+        # clear before reading, so a push that lands after this asks for another wakeup
+        with self.lock:
+            header[self.WAKEUP_PENDING] = 0
+            read_count = header.item(self.READ_COUNT)
+            write_count = header.item(self.WRITE_COUNT)
+        for count in range(read_count, write_count):
+            slot = count % self.capacity
+            on_trade(self.ticker_indices.item(slot), self.timestamps.item(slot), self.prices.item(slot), self.sizes.item(slot))
+        # only give the rows back once we're done reading them
+        with self.lock:
+            header[self.READ_COUNT] = write_count
+        return write_count - read_count
+
+    def get_num_dropped(self):
+        return self.header.item(self.DROPPED)
+
+    def close(self):
+        # drop our views first, shared memory can't be closed while they exist
+        self.header = self.ticker_indices = self.timestamps = self.prices = self.sizes = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def run_shard(tickers, first_index, ring_name, ring_lock, capacity, wakeup_conn, alpaca_key, alpaca_secret_key, data_stream_url, quote_book_name=None, num_tickers=0):
+    """Entry point of a shard's worker process. Streams trades for its tickers from
+    Alpaca and pushes them into the ring, where tickers[i] is ticker index first_index+i.
+    If quote_book_name is given, also streams their quotes straight into that shared
+    QuoteBook (of num_tickers tickers), they never go through the ring."""
+    ring = TradeRing(capacity, ring_name, ring_lock)
+    indices = { ticker: first_index + i for i, ticker in enumerate(tickers) }
+
+    # raw stream messages, see make_stream
+    async def trade_update_callback(msg):
+        if ring.push(indices[msg['S']], _raw_timestamp_ns(msg), float(msg['p']), int(msg.get('s', 1) or 1)):
+            wakeup_conn.send_bytes(b'\0')
+
+    stream = make_stream(alpaca_key, alpaca_secret_key, data_stream_url)
+    stream.subscribe_trades(trade_update_callback, *tickers)
+    if quote_book_name is not None:
+        quote_shm = shared_memory.SharedMemory(name=quote_book_name)
+        quote_book = QuoteBook(num_tickers, quote_shm.buf)
+
+        async def quote_update_callback(msg):
+            quote_book.on_quote(indices[msg['S']], float(msg['bp']), float(msg['ap']))
+        stream.subscribe_quotes(quote_update_callback, *tickers)
+    stream.run()
+
+
+class Shard:
+    """POD class for the main process' end of a shard."""
+    def __init__(self, tickers, first_index, ring):
+        self.tickers = tickers
+        self.first_index = first_index
+        self.ring = ring
+        # the worker sends on writer_conn when it wants the relay to wake up
+        self.wakeup_conn, self.writer_conn = multiprocessing.Pipe(duplex=False)
+        self.process = None
+        self.relay_thread = None
+
+
+class ShardedMarketData(MarketData):
+    """MarketData that splits its tickers across num_shards Alpaca stream connections,
+    each consumed by its own worker process, so one busy ticker or slow connection can
+    only hold up its own shard. Workers push each trade into a shared memory ring,
+    and the main process feeds them to the usual TickerData objects, so every getter
+    works exactly like it does for MarketData.
+
+    Each shard's trades are applied by one relay thread (or, for the asyncio engine,
+    a reader on the event loop), which keeps every ticker to one writer. Quotes, if
+    subscribed to, skip all that: workers write them straight into a QuoteBook in
+    shared memory."""
+    RING_CAPACITY = 1 << 16
+
+    # how long a relay thread waits for a wakeup before checking whether it's been
+    # stopped, in seconds
+    RELAY_TIMEOUT = 0.1
+
+    def __init__(self, tickers, alpaca_key, alpaca_secret_key, history_len, trend_len, num_shards, initial_data=None, data_stream_url=None, subscribe_quotes=False, price_snapshot=None):
+        # no stream of our own, the shards each have one
+        self.quote_shm = None
+        super().__init__(tickers, None, None, history_len, trend_len, initial_data, subscribe_quotes=subscribe_quotes, price_snapshot=price_snapshot)
+        self.alpaca_key = alpaca_key
+        self.alpaca_secret_key = alpaca_secret_key
+        self.data_stream_url = data_stream_url
+        self.stopped = threading.Event()
+
+        # contiguous runs of tickers, so a shard's ticker indices are just an offset
+        self.shards = []
+        shard_len = max(1, -(-len(tickers) // num_shards))
+        for first_index in range(0, len(tickers), shard_len):
+            self.shards.append(Shard(tickers[first_index:first_index+shard_len], first_index, TradeRing(self.RING_CAPACITY)))
+
+    def make_quote_book(self):
+        # in shared memory, so the workers can write quotes straight into it
+        self.quote_shm = shared_memory.SharedMemory(create=True, size=QuoteBook.get_size(len(self.tickers)))
+        quote_book = QuoteBook(len(self.tickers), self.quote_shm.buf)
+        quote_book.clear()
+        return quote_book
+
+    def start_workers(self):
+        for shard in self.shards:
+            shard.process = multiprocessing.Process(target=run_shard, daemon=True, args=(
+                shard.tickers, shard.first_index, shard.ring.shm.name, shard.ring.lock, self.RING_CAPACITY, shard.writer_conn,
+                self.alpaca_key, self.alpaca_secret_key, self.data_stream_url,
+                self.quote_shm.name if self.quote_shm is not None else None, len(self.tickers)))
+            shard.process.start()
+        print_with_lock("streaming {} tickers over {} shards".format(len(self.tickers), len(self.shards)))
+
+    def on_shard_trade(self, ticker_index, timestamp, price, size):
+        self.data[ticker_index].on_trade(price, timestamp, size)
+
+    def relay_once(self, shard):
+        """Applies every trade the shard has pushed so far."""
+        while shard.wakeup_conn.poll():
+            shard.wakeup_conn.recv_bytes()
+        shard.ring.drain(self.on_shard_trade)
+
+    def relay_until_stopped(self, shard):
+        while not self.stopped.is_set():
+            shard.wakeup_conn.poll(self.RELAY_TIMEOUT)
+            self.relay_once(shard)
+
+    def start_stream(self):
+        """Call this function when the market is open.
+
+        Starts a worker process per shard, and a daemon thread per shard
+        which applies its trades to this object."""
+        self.start_workers()
+        for shard in self.shards:
+            shard.relay_thread = threading.Thread(target=self.relay_until_stopped, args=(shard,), daemon=True)
+            shard.relay_thread.start()
+
+    async def run_stream_async(self):
+        """Alternative to start_stream for the asyncio engine: applies every shard's
+        trades on the caller's event loop until cancelled."""
+        self.start_workers()
+        loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            loop.add_reader(shard.wakeup_conn.fileno(), self.relay_once, shard)
+        try:
+            await loop.create_future()
+        finally:
+            for shard in self.shards:
+                loop.remove_reader(shard.wakeup_conn.fileno())
+
+    def stop_stream(self):
+        """Stops the worker processes and frees the shared memory."""
+        self.stopped.set()
+        for shard in self.shards:
+            if shard.relay_thread is not None:
+                shard.relay_thread.join()
+            if shard.process is not None:
+                shard.process.terminate()
+                shard.process.join()
+            dropped = shard.ring.get_num_dropped()
+            if dropped != 0:
+                print_with_lock("shard streaming {} dropped {} trades".format(shard.tickers, dropped))
+            shard.ring.unlink()
+        if self.quote_shm is not None:
+            # drop our views first, shared memory can't be closed while they exist
+            self.quote_book = None
+            self.quote_shm.close()
+            self.quote_shm.unlink()
+            self.quote_shm = None
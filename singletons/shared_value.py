@@ -0,0 +1,37 @@
+import multiprocessing
+
+from metrics import metrics
+
+class SharedValue:
+    """A number in shared memory that any number of threads and processes can update
+    atomically. Pass it to a multiprocessing.Process like any other argument.
+
+    Reads never lock, an aligned 8 byte load can't tear. Every update is a
+    compare_and_swap, retried if another update got in first. Python has no atomic
+    instructions, so the compare and swap itself is done under a cross process lock,
+    but that lock is only ever held for one comparison and one store."""
+    def __init__(self, initial, name):
+        """name is what waits on the lock are recorded under, see metrics.py."""
+        self.name = name
+        self.value = multiprocessing.RawValue('d', initial)
+        self.lock = multiprocessing.Lock()
+
+    def get(self):
+        return self.value.value
+
+    def compare_and_swap(self, expected, new):
+        """Sets the value to new if it's still expected. Returns whether it was set."""
+        with metrics.locked(self.lock, self.name):
+            if self.value.value != expected:
+                return False
+            self.value.value = new
+            return True
+
+    def update(self, function):
+        """Atomically sets the value to function(value). Returns (old value, new value).
+        function may be called more than once, so it mustn't have side effects."""
+        while True:
+            old = self.value.value
+            new = function(old)
+            if self.compare_and_swap(old, new):
+                return old, new
@@ -1,31 +1,30 @@
-from datetime import timedelta, datetime
-
-from readerwriterlock import rwlock
-
-from utilities import print_with_lock
+from singletons.shared_value import SharedValue
 
 class TradeCapper:
-    """Threadsafe class for concurrent reads and writes to the 
-    number of trades left in a market day. Should be a singleton."""
+    """Thread and process safe class for concurrent reads and writes to the 
+    number of trades left in a market day. Should be a singleton. The count lives
+    in shared memory (see SharedValue), so trading processes handed this object
+    can't go over the cap between them."""
     
     def __init__(self, max_trades_per_day):
-        self.lock = rwlock.RWLockWrite()
-
         if max_trades_per_day is None:
             # no cap on trading
-            self.num_trades_left_today = float('inf')
-            return
+            max_trades_per_day = float('inf')
 
         # decrement this value eagerly until zero
-        self.num_trades_left_today = max_trades_per_day
+        self.num_trades_left_today = SharedValue(max_trades_per_day, "trade_capper")
 
     def make_trade(self):
-        with self.lock.gen_wlock():
-            # eagerly reserve the trade it will take to sell this stock
-            # because we always sell before day end
-            self.num_trades_left_today -= 2
+        """Reserves a trade, returns False (reserving nothing) if there are none left."""
+        # eagerly reserve the trade it will take to sell this stock
+        # because we always sell before day end
+        old, _ = self.num_trades_left_today.update(lambda left: left - 2 if left >= 2 else left)
+        return old >= 2
 
-    def are_trades_left(self):
-        with self.lock.gen_rlock():
-            return self.num_trades_left_today >= 2
+    def cancel_trade(self):
+        """Gives back a trade reserved by make_trade that never happened."""
+        self.num_trades_left_today.update(lambda left: left + 2)
 
+    def are_trades_left(self):
+        # no lock needed, see SharedValue, and every trading thread calls this once per trade
+        return self.num_trades_left_today.get() >= 2
@@ -0,0 +1,75 @@
+"""Base class for strategies that decide whether to buy for a whole universe of tickers
+at once, with numpy operations over a (tickers x history) matrix of prices instead
+of one ticker at a time."""
+
+from collections import namedtuple
+
+import numpy as np
+
+# values of BatchStats.trend
+TREND_DOWN = -1
+TREND_NONE = 0
+TREND_UP = 1
+
+# the same numbers TickSnapshot has for one ticker, as one array per field
+BatchStats = namedtuple('BatchStats', ['price', 'mean', 'stddev', 'trend', 'num_trades'])
+
+def compute_batch_stats(windows, counts, num_trades, trend_len):
+    """Returns BatchStats for windows, counts and num_trades as returned by
+    MarketData.copy_price_windows. Matches TickerData's definitions: population
+    stddev, and a trend only when each of the last trend_len prices strictly rose
+    (or fell) from the one before."""
+    price = windows[:, -1]
+    if counts.min(initial=windows.shape[1]) < windows.shape[1]:
+        mean = np.nanmean(windows, axis=1)
+        stddev = np.nanstd(windows, axis=1)
+    else:
+        # no padding, skip the much slower nan-aware versions
+        mean = windows.mean(axis=1)
+        stddev = windows.std(axis=1)
+    # column at a time, trend_len is tiny so this beats diff() and all() over a temporary
+    rising = counts >= trend_len
+    falling = rising.copy()
+    for j in range(1, trend_len):
+        later = windows[:, -j]
+        earlier = windows[:, -j-1]
+        rising &= later > earlier
+        falling &= later < earlier
+    trend = rising.astype(np.int8) - falling.astype(np.int8)
+    return BatchStats(price, mean, stddev, trend, num_trades)
+
+
+class BatchStrategy:
+    """Base class for batch strategies. Subclasses implement should_buy_batch.
+
+    Call evaluate() as often as you like: each call gathers every ticker's window
+    in one pass, computes the stats for all of them at once, and returns a boolean
+    vector (in the order of tickers) saying which to buy. Like should_buy_on_tick,
+    a ticker is only considered once per new trade on it."""
+
+    def __init__(self, market_data, tickers):
+        self.market_data = market_data
+        self.tickers = list(tickers)
+        self.ticker_indices = np.array([market_data.tickers_to_indices[ticker] for ticker in self.tickers], dtype=np.int64)
+        self.last_num_trades = np.zeros(len(self.tickers), dtype=np.int64)
+
+    def get_stats(self):
+        windows, counts, num_trades = self.market_data.copy_price_windows(self.ticker_indices)
+        return compute_batch_stats(windows, counts, num_trades, self.market_data.trend_len)
+
+    def evaluate(self):
+        """Returns a boolean array, True for each ticker to buy on its latest trade."""
+        stats = self.get_stats()
+        new_trades = stats.num_trades != self.last_num_trades
+        self.last_num_trades = stats.num_trades
+        return new_trades & self.should_buy_batch(stats)
+
+    def get_tickers_to_buy(self):
+        return [self.tickers[i] for i in np.flatnonzero(self.evaluate())]
+
+    def should_buy_batch(self, stats):
+        """Returns a boolean array from BatchStats, True for each ticker worth buying."""
+        return np.zeros(len(self.tickers), dtype=bool)
+
+    def get_name(self):
+        return 'BatchStrategy'
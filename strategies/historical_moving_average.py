@@ -1,7 +1,6 @@
 from strategies.strategy import Strategy
-from singletons.market_data import MarketData
 from strategies.day_moving_average import DayMovingAverage
-from utilities import print_with_lock
+from logger import log
 
 class HistoricalMovingAverage(Strategy):
     """Buy when the short day moving average crosses up the long day 
@@ -11,8 +10,8 @@ class HistoricalMovingAverage(Strategy):
         super().__init__(market_data, ticker)
         self.long = long
         self.short = short
-        self.short_moving_avg = DayMovingAverage(market_data, ticker, short)
-        self.long_moving_avg = DayMovingAverage(market_data, ticker, long)
+        self.short_moving_avg = self.get_indicator(DayMovingAverage, short)
+        self.long_moving_avg = self.get_indicator(DayMovingAverage, long)
         self.relevant = True
 
         # if short already crossed up long, cancel this thread
@@ -23,10 +22,9 @@ class HistoricalMovingAverage(Strategy):
         return self.relevant
 
     def should_buy_on_tick(self):
-        # update both and buy if we have a higher short than long MA
-        self.short_moving_avg.update()
-        self.long_moving_avg.update()
-        print_with_lock("MA for {}: short={} long={}".format(self.ticker, self.short_moving_avg.get_moving_average(), self.long_moving_avg.get_moving_average()))
+        # both are kept up to date by the ticker's trades, buy if we have a higher short than long MA
+        if log.debug_enabled:
+            log.debug("moving averages", ticker=self.ticker, short=self.short_moving_avg.get_moving_average(), long=self.long_moving_avg.get_moving_average())
         return self.short_moving_avg.get_moving_average() > self.long_moving_avg.get_moving_average()
 
     def get_name(self):
@@ -0,0 +1,23 @@
+from collections import namedtuple
+
+from strategies.indicators.indicator import Indicator, RollingStats
+
+# published as one tuple so readers never see bands from two different trades
+BollingerBands = namedtuple('BollingerBands', ['lower', 'middle', 'upper'])
+
+class Bollinger(Indicator):
+    """Bollinger bands over the last n trades: their mean, and k (population)
+    standard deviations either side of it. Not ready until there's n trades."""
+    def __init__(self, n, k=2.0):
+        super().__init__()
+        self.n = n
+        self.k = k
+        self.stats = RollingStats(n)
+
+    def update(self, price, timestamp, size):
+        stats = self.stats
+        stats.push(price)
+        if not stats.is_full():
+            return
+        mean, stddev = stats.get_mean_and_stddev()
+        self.value = BollingerBands(mean - self.k*stddev, mean, mean + self.k*stddev)
@@ -0,0 +1,16 @@
+from strategies.indicators.indicator import Indicator
+
+class EMA(Indicator):
+    """Exponential moving average over roughly the last n trades,
+    weighting each new price by 2/(n+1). Starts at the first price seen."""
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+        self.alpha = 2.0/(n+1)
+
+    def update(self, price, timestamp, size):
+        value = self.value
+        if value is None:
+            self.value = price
+        else:
+            self.value = value + self.alpha*(price - value)
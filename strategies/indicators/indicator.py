@@ -0,0 +1,90 @@
+from collections import deque
+
+class Indicator:
+    """Base class for streaming indicators of one ticker's trades.
+
+    update is called once per trade by that ticker's writer (the stream callback,
+    see TickerData.on_trade) and must be O(1), amortised. It publishes the latest
+    result to self.value with one assignment, so get_value can be called from any
+    thread without a lock. value is None until there's been enough trades.
+
+    Don't construct these yourself, get them from registry.acquire_indicator so that
+    every strategy asking for the same one shares a single instance."""
+    def __init__(self):
+        self.value = None
+        # strategies holding this, only touched by the registry
+        self.num_users = 0
+
+    def seed(self, ticker, prices):
+        """Called once, before the first update, with the ticker this indicator is for
+        and the prices already in its window (oldest first). By default replays them as trades."""
+        for price in prices:
+            self.update(price, 0, 1)
+
+    def update(self, price, timestamp, size):
+        """price is a float, timestamp an int in ns since the epoch, and size the
+        number of shares traded (1 where that isn't known, e.g. in backtests)."""
+        pass
+
+    def get_value(self):
+        return self.value
+
+    def is_ready(self):
+        return self.value is not None
+
+
+class RollingStats:
+    """Mean and population stddev of the last n values pushed, in O(1) per push.
+
+    Keeps running sums like TickerData does, shifted by a reference value so
+    the sum of squares doesn't swamp the variance, and recomputed from scratch
+    every so often so rounding error can't build up."""
+    RENORMALIZE_INTERVAL = 4096
+
+    def __init__(self, n):
+        self.n = n
+        self.window = deque()
+        self.shift = 0.0
+        self.shifted_sum = 0.0
+        self.shifted_square_sum = 0.0
+        self.pushes_until_renormalize = max(self.RENORMALIZE_INTERVAL, n)
+
+    def push(self, x):
+        window = self.window
+        if len(window) == self.n:
+            old = window.popleft() - self.shift
+            self.shifted_sum -= old
+            self.shifted_square_sum -= old*old
+        elif len(window) == 0:
+            self.shift = x
+        window.append(x)
+        new = x - self.shift
+        self.shifted_sum += new
+        self.shifted_square_sum += new*new
+
+        self.pushes_until_renormalize -= 1
+        if self.pushes_until_renormalize == 0:
+            self.renormalize()
+
+    def renormalize(self):
+        self.shift = sum(self.window)/len(self.window)
+        self.shifted_sum = 0.0
+        self.shifted_square_sum = 0.0
+        for x in self.window:
+            diff = x - self.shift
+            self.shifted_sum += diff
+            self.shifted_square_sum += diff*diff
+        self.pushes_until_renormalize = max(self.RENORMALIZE_INTERVAL, self.n)
+
+    def get_mean(self):
+        return self.shift + self.shifted_sum/len(self.window)
+
+    def is_full(self):
+        return len(self.window) == self.n
+
+    def get_mean_and_stddev(self):
+        n = len(self.window)
+        shifted_mean = self.shifted_sum/n
+        # clamp, rounding can push a flat window's variance slightly negative
+        variance = max(0.0, self.shifted_square_sum/n - shifted_mean*shifted_mean)
+        return self.shift + shifted_mean, variance**0.5
@@ -0,0 +1,53 @@
+"""Hands out the indicators strategies read, one instance per (ticker, indicator, params).
+
+Each TickerData keeps the indicators on it by (indicator class, params) and calls
+every one of them once per trade, so ten strategies watching a 20 trade EMA of
+the same ticker cost one EMA update per trade, not ten. Instances are reference
+counted: every acquire_indicator needs a matching release_indicator, and the
+last release stops the indicator being fed."""
+
+import threading
+
+_lock = threading.Lock()
+
+def acquire_indicator(market_data, ticker, indicator_class, *params):
+    """Returns the indicator_class(*params) fed by ticker's trades, creating it (seeded
+    with the prices already in the ticker's window) the first time anyone asks.
+
+    Meant to be called from strategy constructors, before the stream starts. Called
+    later it still works, but the trades that land while the indicator is being
+    seeded can be missed."""
+    ticker_data = market_data.get_ticker_data_for_ticker(ticker)
+    key = (indicator_class, params)
+    with _lock:
+        indicator = ticker_data.indicators.get(key, None)
+        if indicator is not None:
+            indicator.num_users += 1
+            return indicator
+
+    # seeding can download things, don't hold everyone else up while it does
+    indicator = indicator_class(*params)
+    _, prices = ticker_data.copy_ordered_prices()
+    indicator.seed(ticker, prices.tolist())
+    with _lock:
+        existing = ticker_data.indicators.get(key, None)
+        if existing is not None:
+            # someone else built the same one meanwhile, use theirs
+            indicator = existing
+        else:
+            ticker_data.indicators[key] = indicator
+            # a new tuple rather than an append, the writer may be looping over the old one
+            ticker_data.indicator_updates = ticker_data.indicator_updates + (indicator.update,)
+        indicator.num_users += 1
+        return indicator
+
+def release_indicator(market_data, ticker, indicator):
+    """Gives back an indicator from acquire_indicator. Once nobody holds it,
+    it's no longer updated and the next acquire builds a fresh one."""
+    ticker_data = market_data.get_ticker_data_for_ticker(ticker)
+    with _lock:
+        indicator.num_users -= 1
+        if indicator.num_users > 0:
+            return
+        ticker_data.indicators = { key: other for key, other in ticker_data.indicators.items() if other is not indicator }
+        ticker_data.indicator_updates = tuple(other.update for other in ticker_data.indicators.values())
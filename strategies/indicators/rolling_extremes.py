@@ -0,0 +1,37 @@
+from collections import deque
+
+from strategies.indicators.indicator import Indicator
+
+class RollingMin(Indicator):
+    """Lowest price of the last n trades.
+
+    Keeps a deque of (trade number, price) that only ever increases in price from
+    front to back: a new price pops everything behind it that it's lower than or
+    equal to, since those can never be the minimum again. The front is the answer,
+    once anything too old to be in the window is dropped off it. Every trade is
+    pushed and popped at most once, so updates are O(1) amortised."""
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+        self.num_seen = 0
+        self.candidates = deque()
+
+    def beats(self, price, other):
+        """True if price makes other useless as a future answer."""
+        return price <= other
+
+    def update(self, price, timestamp, size):
+        self.num_seen += 1
+        candidates = self.candidates
+        while candidates and self.beats(price, candidates[-1][1]):
+            candidates.pop()
+        candidates.append((self.num_seen, price))
+        if candidates[0][0] <= self.num_seen - self.n:
+            candidates.popleft()
+        self.value = candidates[0][1]
+
+
+class RollingMax(RollingMin):
+    """Highest price of the last n trades, see RollingMin."""
+    def beats(self, price, other):
+        return price >= other
@@ -0,0 +1,39 @@
+from strategies.indicators.indicator import Indicator
+
+class RSI(Indicator):
+    """Relative strength index over the last n price moves, from 0 to 100, with
+    Wilder's smoothing: the first n moves are averaged, then every later move
+    counts for 1/n of the average gain or loss."""
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+        self.prev_price = None
+        self.num_moves = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, price, timestamp, size):
+        prev_price = self.prev_price
+        self.prev_price = price
+        if prev_price is None:
+            return
+        move = price - prev_price
+        gain = move if move > 0 else 0.0
+        loss = -move if move < 0 else 0.0
+
+        n = self.n
+        if self.num_moves < n:
+            # still filling the first window, plain average
+            self.num_moves += 1
+            self.avg_gain += (gain - self.avg_gain)/self.num_moves
+            self.avg_loss += (loss - self.avg_loss)/self.num_moves
+            if self.num_moves < n:
+                return
+        else:
+            self.avg_gain = (self.avg_gain*(n-1) + gain)/n
+            self.avg_loss = (self.avg_loss*(n-1) + loss)/n
+
+        if self.avg_loss == 0.0:
+            self.value = 100.0 if self.avg_gain > 0.0 else 50.0
+        else:
+            self.value = 100.0 - 100.0/(1.0 + self.avg_gain/self.avg_loss)
@@ -0,0 +1,22 @@
+import math
+
+from strategies.indicators.indicator import Indicator, RollingStats
+
+class Volatility(Indicator):
+    """Standard deviation of the log returns between the last n+1 trades, i.e. per
+    trade and not annualised. Not ready until there's n returns."""
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+        self.prev_price = None
+        self.stats = RollingStats(n)
+
+    def update(self, price, timestamp, size):
+        prev_price = self.prev_price
+        self.prev_price = price
+        if prev_price is None or prev_price <= 0.0 or price <= 0.0:
+            return
+        stats = self.stats
+        stats.push(math.log(price/prev_price))
+        if stats.is_full():
+            self.value = stats.get_mean_and_stddev()[1]
@@ -0,0 +1,20 @@
+from strategies.indicators.indicator import Indicator
+
+class VWAP(Indicator):
+    """Volume weighted average price of every trade since the stream started.
+
+    Where trade sizes aren't known (backtests, recordings) every trade counts as
+    one share, which makes this the plain average price of the day's trades."""
+    def __init__(self):
+        super().__init__()
+        self.notional = 0.0
+        self.volume = 0
+
+    def seed(self, ticker, prices):
+        # the window before the open is yesterday's close, not part of today's session
+        pass
+
+    def update(self, price, timestamp, size):
+        self.notional += price*size
+        self.volume += size
+        self.value = self.notional/self.volume
@@ -1,6 +1,7 @@
 """Strategy module which opens when the price is <percent>% below the mean and not trending down."""
 
 from strategies.strategy import Strategy
+from strategies.batch_strategy import BatchStrategy, TREND_DOWN
 
 class MeanReversion(Strategy):
     def __init__(self, market_data, ticker, percent):
@@ -19,4 +20,17 @@ class MeanReversion(Strategy):
         return curr_price < mean*(1-self.percent)
 
     def get_name(self):
-        return 'MeanReversion with percent={}'.format(self.percent)
\ No newline at end of file
+        return 'MeanReversion with percent={}'.format(self.percent)
+
+
+class BatchMeanReversion(BatchStrategy):
+    """MeanReversion for many tickers at once."""
+    def __init__(self, market_data, tickers, percent):
+        super().__init__(market_data, tickers)
+        self.percent = percent/100.0
+
+    def should_buy_batch(self, stats):
+        return (stats.trend != TREND_DOWN) & (stats.price < stats.mean*(1-self.percent))
+
+    def get_name(self):
+        return 'BatchMeanReversion with percent={}'.format(self.percent)
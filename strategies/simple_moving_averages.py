@@ -1,7 +1,6 @@
 from strategies.strategy import Strategy
-from singletons.market_data import MarketData
 from strategies.moving_average import MovingAverage
-from utilities import print_with_lock
+from logger import log
 
 class SimpleMovingAverages(Strategy):
     """Buy when the short <num_trades> moving average crosses up the long <num_trades>
@@ -11,15 +10,17 @@ class SimpleMovingAverages(Strategy):
         super().__init__(market_data, ticker)
         self.long = long
         self.short = short
-        self.short_moving_avg = MovingAverage(market_data, ticker, short)
-        self.long_moving_avg = MovingAverage(market_data, ticker, long)
+        self.short_moving_avg = self.get_indicator(MovingAverage, short)
+        self.long_moving_avg = self.get_indicator(MovingAverage, long)
         self.relevant = True
 
     def should_buy_on_tick(self):
-        # update both and buy if we have a higher short than long MA
-        self.short_moving_avg.update()
-        self.long_moving_avg.update()
-        print_with_lock("MA for {}: short={} long={}".format(self.ticker, self.short_moving_avg.get_moving_average(), self.long_moving_avg.get_moving_average()))
+        if not self.long_moving_avg.is_ready():
+            # the long average reads 0 until it's full, so any short average would look like it crossed up
+            return False
+        # both are kept up to date by the ticker's trades, buy if we have a higher short than long MA
+        if log.debug_enabled:
+            log.debug("moving averages", ticker=self.ticker, short=self.short_moving_avg.get_moving_average(), long=self.long_moving_avg.get_moving_average())
         return self.short_moving_avg.get_moving_average() > self.long_moving_avg.get_moving_average()
 
     def get_name(self):
@@ -1,5 +1,7 @@
 import threading
 
+from strategies.indicators.registry import acquire_indicator, release_indicator
+
 class Strategy:
     """Base class for trading strategies that the bot uses.
     
@@ -12,6 +14,22 @@ class Strategy:
         with self.ctor_lock:
             Strategy.market_data = market_data
         self.ticker = ticker
+        # everything from get_indicator, given back in release
+        self.indicators = []
+
+    def get_indicator(self, indicator_class, *params):
+        """Returns the shared indicator_class(*params) for this strategy's ticker,
+        see strategies/indicators/registry.py. Call this from the constructor."""
+        indicator = acquire_indicator(self.market_data, self.ticker, indicator_class, *params)
+        self.indicators.append(indicator)
+        return indicator
+
+    def release(self):
+        """Call this once the strategy won't be used again, so the indicators
+        nobody else reads stop being updated."""
+        for indicator in self.indicators:
+            release_indicator(self.market_data, self.ticker, indicator)
+        self.indicators = []
 
     def is_relevant(self):
         # strategies are by default relevant, but allow overriding of this method
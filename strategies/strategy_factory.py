@@ -1,11 +1,11 @@
 """Factory module that creates a strategy based on the dict passed from the config"""
 
 from traderbot_exception import ConfigException
-from strategies.strict_momentum import StrictMomentum
-from strategies.historical_moving_average import HistoricalMovingAverage
-from strategies.mean_reversion import MeanReversion
 from utilities import enforce_keys_in_dict
 
+# strategies are imported by the factories, only once one is made, so checking
+# a config doesn't import numpy and everything the strategies need
+
 # update this whenever you add a new strategy. used for error checking
 # as early as possible (before the long blocking calls)
 _strategy_required_fields = {
@@ -33,19 +33,41 @@ def strategy_factory(strategy, market_data, ticker):
     name = strategy['name']
 
     if name == "HistoricalMovingAverage":
+        from strategies.historical_moving_average import HistoricalMovingAverage
         return HistoricalMovingAverage(market_data, ticker, strategy['short'], strategy['long'])
     elif name == "StrictMomentum":
+        from strategies.strict_momentum import StrictMomentum
         return StrictMomentum(market_data, ticker, strategy['percent'])
     elif name == "MeanReversion":
+        from strategies.mean_reversion import MeanReversion
         return MeanReversion(market_data, ticker, strategy['percent'])
     else:
         raise ConfigException("{} does not name a strategy. see the readme"
             "for a list of valid strategy names".format(name))
 
+def batch_strategy_factory(strategy, market_data, tickers):
+    """Like strategy_factory, but returns a BatchStrategy for every ticker in tickers at once.
+    Only some strategies have a batch version."""
+    enforce_strategy_dict_legal(strategy)
+    name = strategy['name']
+
+    if name == "StrictMomentum":
+        from strategies.strict_momentum import BatchStrictMomentum
+        return BatchStrictMomentum(market_data, tickers, strategy['percent'])
+    elif name == "MeanReversion":
+        from strategies.mean_reversion import BatchMeanReversion
+        return BatchMeanReversion(market_data, tickers, strategy['percent'])
+    else:
+        raise ConfigException("{} has no batch version. see the readme"
+            "for a list of strategies that do".format(name))
+
 
 def enforce_strategy_dict_legal(strategy):
     """Enforces that a strategy dict is legal. Called before the big blocking calls prior to
     market open to error out as early as possible."""
     _enforce_name_defined(strategy)
+    if strategy['name'] not in _strategy_required_fields:
+        raise ConfigException("{} does not name a strategy. see the readme "
+            "for a list of valid strategy names".format(strategy['name']))
     enforce_keys_in_dict(_strategy_required_fields[strategy['name']], strategy)
     
\ No newline at end of file
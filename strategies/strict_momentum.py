@@ -4,6 +4,7 @@ which would mean that the price has moved significantly more violently than
 1% in the last N trades. If this is true, and the current trend is up, buy in."""
 
 from strategies.strategy import Strategy
+from strategies.batch_strategy import BatchStrategy, TREND_UP
 from utilities import print_with_lock
 
 class StrictMomentum(Strategy):
@@ -21,4 +22,18 @@ class StrictMomentum(Strategy):
         return stddev >= mean*self.percent
     
     def get_name(self):
-        return 'StrictMomentum with percent={}'.format(self.percent)
\ No newline at end of file
+        return 'StrictMomentum with percent={}'.format(self.percent)
+
+
+class BatchStrictMomentum(BatchStrategy):
+    """StrictMomentum for many tickers at once."""
+    def __init__(self, market_data, tickers, percent):
+        """Pass percent as a number in the range (0,100], for 5% pass 5, not .05"""
+        super().__init__(market_data, tickers)
+        self.percent = percent/100.0
+
+    def should_buy_batch(self, stats):
+        return (stats.trend == TREND_UP) & (stats.stddev >= stats.mean*self.percent)
+
+    def get_name(self):
+        return 'BatchStrictMomentum with percent={}'.format(self.percent)
@@ -0,0 +1,240 @@
+"""Parameter sweeps for the traderbot's strategies.
+
+Expands a grid of strategy dicts into every combination of their parameters and
+backtests each one against the same trades, one config per worker process. The
+trades are loaded once, copied into shared memory as three numpy columns (straight
+from the memmapped columns of a recording), and every worker replays straight out
+of that memory instead of getting its own pickled copy."""
+
+import os
+import sys
+import json
+import time
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import get_backtest_config, load_trades_csv, load_trades_recording, generate_synthetic_trades, run_backtest
+from strategies.strategy_factory import enforce_strategy_dict_legal
+from utilities import print_with_lock
+from logger import log
+from traderbot_exception import ConfigException
+from tick_store import TickReader, CHUNK_SIZE as COPY_CHUNK_SIZE
+
+# trades handed to the backtest at a time when unpacking the shared columns
+CHUNK_SIZE = 1 << 16
+
+def expand_grid(grid):
+    """Returns every strategy dict described by grid, a strategy dict where any
+    parameter may be a list of values to try instead of a single value."""
+    keys = list(grid.keys())
+    choices = [value if isinstance(value, list) else [value] for value in grid.values()]
+    strategies = []
+    for combination in itertools.product(*choices):
+        strategy = dict(zip(keys, combination))
+        enforce_strategy_dict_legal(strategy)
+        strategies.append(strategy)
+    return strategies
+
+def load_sweep(path):
+    """Returns (tickers, strategy dicts) from a sweep file with the keys "strategies",
+    a list of grids (see expand_grid), and optionally "tickers" to trade. With no
+    tickers, every ticker in the trades is used."""
+    try:
+        with open(path) as json_file:
+            sweep = json.load(json_file)
+    except FileNotFoundError:
+        raise ConfigException("error: sweep file {} not found".format(path))
+    if "strategies" not in sweep:
+        raise ConfigException("sweep file {} must define \"strategies\"".format(path))
+    strategies = []
+    for grid in sweep["strategies"]:
+        strategies.extend(expand_grid(grid))
+    return sweep.get("tickers", None), strategies
+
+
+class SharedTrades:
+    """A day of trades laid out as timestamp, ticker id and price columns in shared memory.
+
+    The process that creates it owns the memory and must call unlink() when done.
+    Workers get a SharedTrades by name with attach(), which maps the same memory
+    without copying it."""
+    COLUMNS = [('timestamps', np.int64), ('ticker_ids', np.uint16), ('prices', np.float64)]
+
+    def __init__(self, tickers, num_rows, names=None):
+        self.tickers = tickers
+        self.num_rows = num_rows
+        self.blocks = []
+        for i, (column, dtype) in enumerate(self.COLUMNS):
+            size = max(1, num_rows*np.dtype(dtype).itemsize)
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[i])
+            self.blocks.append(block)
+            setattr(self, column, np.ndarray((num_rows,), dtype=dtype, buffer=block.buf))
+
+    @classmethod
+    def from_trades(cls, trades):
+        """Copies a list of (timestamp_ns, ticker, price) into a new set of shared columns."""
+        tickers = sorted(set(ticker for _, ticker, _ in trades))
+        ticker_ids = { ticker: i for i, ticker in enumerate(tickers) }
+        shared = cls(tickers, len(trades))
+        shared.timestamps[:] = [trade[0] for trade in trades]
+        shared.ticker_ids[:] = [ticker_ids[trade[1]] for trade in trades]
+        shared.prices[:] = [trade[2] for trade in trades]
+        return shared
+
+    @classmethod
+    def from_reader(cls, reader):
+        """Copies a recorded day (a tick_store.TickReader) into a new set of shared columns,
+        a chunk at a time, in the order it was recorded. Ticker ids stay the same."""
+        shared = cls(list(reader.tickers), len(reader))
+        for start, columns in zip(range(0, len(reader), COPY_CHUNK_SIZE), reader.iter_chunks(COPY_CHUNK_SIZE)):
+            for (column, _), values in zip(cls.COLUMNS, columns):
+                getattr(shared, column)[start:start+len(values)] = values
+        return shared
+
+    @classmethod
+    def attach(cls, tickers, num_rows, names):
+        return cls(tickers, num_rows, names)
+
+    def get_names(self):
+        return [block.name for block in self.blocks]
+
+    def get_initial_prices(self):
+        """Returns the first price seen for every ticker, by ticker."""
+        first_rows = np.unique(self.ticker_ids, return_index=True)
+        return { self.tickers[ticker_id]: float(self.prices[row]) for ticker_id, row in zip(*first_rows) }
+
+    def get_time_range(self):
+        """Returns the (earliest, latest) timestamp, a recording isn't quite in time order."""
+        return int(self.timestamps.min()), int(self.timestamps.max())
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, i):
+        return int(self.timestamps[i]), self.tickers[self.ticker_ids[i]], float(self.prices[i])
+
+    def __iter__(self):
+        tickers = self.tickers
+        for start in range(0, self.num_rows, CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            for timestamp, ticker_id, price in zip(self.timestamps[start:end].tolist(), self.ticker_ids[start:end].tolist(), self.prices[start:end].tolist()):
+                yield timestamp, tickers[ticker_id], price
+
+    def close(self):
+        # drop our views first, shared memory can't be closed while they exist
+        for column, _ in self.COLUMNS:
+            setattr(self, column, None)
+        for block in self.blocks:
+            block.close()
+
+    def unlink(self):
+        self.close()
+        for block in self.blocks:
+            block.unlink()
+
+
+# set once per worker process by init_worker
+_worker_trades = None
+_worker_initial_prices = None
+_worker_time_range = None
+
+def init_worker(tickers, num_rows, names):
+    global _worker_trades, _worker_initial_prices, _worker_time_range
+    _worker_trades = SharedTrades.attach(tickers, num_rows, names)
+    _worker_initial_prices = _worker_trades.get_initial_prices()
+    _worker_time_range = _worker_trades.get_time_range()
+
+def run_one(config, strategy, tickers):
+    """Backtests a single strategy dict on the worker's shared trades, returning (trades, net)."""
+    config = dict(config)
+    config["strategies"] = [{ "strategy": strategy, "tickers": tickers }]
+    # the strategies and traders are chatty, keep the table readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        reports = run_backtest(config, _worker_trades, _worker_initial_prices, _worker_time_range)
+        # the log is written in the background, make sure it all goes to devnull too
+        log.flush()
+    return reports.get_summary()
+
+def run_sweep(config, strategies, trades, tickers=None, workers=None):
+    """Backtests every strategy dict against trades (a list of (timestamp_ns, ticker, price),
+    sorted by timestamp, or a recording's TickReader) in a pool of worker processes.
+    Returns a list of (net, trades made, strategy dict, error) sorted from best to worst net."""
+    if isinstance(trades, TickReader):
+        shared = SharedTrades.from_reader(trades)
+    else:
+        shared = SharedTrades.from_trades(trades)
+    if tickers is None:
+        tickers = shared.tickers
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                initargs=(shared.tickers, len(shared), shared.get_names())) as executor:
+            futures = { executor.submit(run_one, config, strategy, tickers): i for i, strategy in enumerate(strategies) }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    num_trades, net = future.result()
+                    results.append((i, net, num_trades, None))
+                except Exception as e:
+                    results.append((i, float('-inf'), 0, "{}: {}".format(type(e).__name__, e)))
+    finally:
+        shared.unlink()
+    # ties keep the order of the sweep file, so the table doesn't depend on which worker finished first
+    results.sort(key=lambda result: (-result[1], result[0]))
+    return [(net, num_trades, strategies[i], error) for i, net, num_trades, error in results]
+
+def print_results(results):
+    print_with_lock("{:>4}  {:>12}  {:>6}  {}".format("rank", "net", "trades", "strategy"))
+    for rank, (net, num_trades, strategy, error) in enumerate(results, 1):
+        if error is not None:
+            print_with_lock("{:>4}  {:>12}  {:>6}  {} ({})".format(rank, "failed", "-", strategy, error))
+        else:
+            print_with_lock("{:>4}  {:>12.4f}  {:>6}  {}".format(rank, net, num_trades, strategy))
+
+def usage():
+    print("usage: python3 sweep.py <sweep.json> <trades.csv | recording dir> [--workers N]")
+    print("       python3 sweep.py <sweep.json> --synthetic <trades per ticker> [seed] [--workers N]")
+    print("backtests every combination of strategy parameters in sweep.json, e.g.")
+    print('    {"tickers": ["AAPL"], "strategies": [{"name": "StrictMomentum", "percent": [0.1, 0.5, 1]}]}')
+    print("using the other settings in config.json, and prints them ranked by net performance")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 2 or "--help" in args or "-h" in args:
+        usage()
+    workers = None
+    if "--workers" in args:
+        i = args.index("--workers")
+        if i+1 >= len(args):
+            usage()
+        workers = int(args[i+1])
+        del args[i:i+2]
+
+    config = get_backtest_config()
+    tickers, strategies = load_sweep(args[0])
+    if args[1] == "--synthetic":
+        if len(args) < 3:
+            usage()
+        if tickers is None:
+            raise ConfigException("a synthetic sweep needs \"tickers\" in the sweep file")
+        seed = int(args[3]) if len(args) > 3 else 0
+        trades = generate_synthetic_trades(sorted(tickers), int(args[2]), seed)
+    elif os.path.isdir(args[1]):
+        trades = load_trades_recording(args[1])
+    else:
+        trades = load_trades_csv(args[1])
+    if len(trades) == 0:
+        raise ConfigException("no trades to replay")
+
+    start = time.perf_counter()
+    results = run_sweep(config, strategies, trades, tickers, workers)
+    print_results(results)
+    print_with_lock("swept {} configs over {} trades in {:0.2f}s".format(len(strategies), len(trades), time.perf_counter() - start))
@@ -0,0 +1,305 @@
+"""Compact on-disk storage for the trades the Alpaca stream gives us.
+
+Each trading day gets its own directory holding one flat little-endian file per
+column, appended to as trades come in:
+
+    <root>/<YYYY-MM-DD>/tickers.json     ticker symbols, position is the ticker id
+    <root>/<YYYY-MM-DD>/timestamps.i8    int64 ns since the epoch
+    <root>/<YYYY-MM-DD>/tickers.u2       uint16 ticker id
+    <root>/<YYYY-MM-DD>/prices.f8        float64
+
+Closing a recorder adds a per-ticker index (index.i8, offsets.i8): the row numbers
+of every ticker's trades grouped together, in time order, and where each ticker's
+group starts. Every file can be memory-mapped as a numpy array, so a reader never
+has to load a whole day into RAM."""
+
+import os
+import json
+import pathlib
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from utilities import print_with_lock
+
+TIMESTAMPS_FILENAME = "timestamps.i8"
+TICKER_IDS_FILENAME = "tickers.u2"
+PRICES_FILENAME = "prices.f8"
+TICKERS_FILENAME = "tickers.json"
+INDEX_FILENAME = "index.i8"
+OFFSETS_FILENAME = "offsets.i8"
+
+# every column file and its dtype, in the order flush writes them
+COLUMNS = [(TIMESTAMPS_FILENAME, '<i8'), (TICKER_IDS_FILENAME, '<u2'), (PRICES_FILENAME, '<f8')]
+
+# rows processed at once when building the index or streaming trades back
+CHUNK_SIZE = 1 << 20
+
+def get_day_directory(root, day=None):
+    """Returns the directory trades for the given date (default today) are recorded in."""
+    if day is None:
+        day = datetime.now().date()
+    return pathlib.Path(root) / day.isoformat()
+
+
+class TickRecorder:
+    """Appends every trade it's handed to the current day's files.
+
+    record() is called from the stream callback, so it only appends a tuple to a
+    deque. A background thread drains the deque every FLUSH_INTERVAL seconds
+    and does the numpy conversion and file writes."""
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, root, day=None):
+        self.directory = get_day_directory(root, day)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # pick up where we left off if we're restarted mid-day
+        self.tickers = []
+        tickers_path = self.directory / TICKERS_FILENAME
+        if tickers_path.exists():
+            with open(str(tickers_path)) as tickers_file:
+                self.tickers = json.load(tickers_file)
+        self.ticker_ids = { ticker: i for i, ticker in enumerate(self.tickers) }
+        self.truncate_to_complete_rows()
+
+        # appending to a deque is threadsafe without a lock
+        self.pending = deque()
+        self.num_recorded = 0
+        self.stopped = threading.Event()
+        self.writer_thread = threading.Thread(target=self.write_until_stopped, daemon=True)
+        self.writer_thread.start()
+
+    def truncate_to_complete_rows(self):
+        """A crash mid-flush leaves some columns longer than others, and appending after
+        that would pair every new row with the wrong values. Cut them all back to the
+        rows that made it into every column, and drop the index, which won't cover
+        what we append."""
+        # offsets go first, readers only trust the index once they exist
+        for filename in [OFFSETS_FILENAME, INDEX_FILENAME]:
+            (self.directory / filename).unlink(missing_ok=True)
+        num_rows = _count_complete_rows(self.directory)
+        for filename, dtype in COLUMNS:
+            path = self.directory / filename
+            size = num_rows*np.dtype(dtype).itemsize
+            if path.exists() and path.stat().st_size > size:
+                os.truncate(str(path), size)
+
+    def get_ticker_id(self, ticker):
+        """Returns the id trades for this ticker are recorded under, assigning one if needed.
+        Call this during setup, not from the stream callback."""
+        if ticker not in self.ticker_ids:
+            if len(self.tickers) > np.iinfo(np.uint16).max:
+                raise ValueError("can't record more than {} tickers".format(np.iinfo(np.uint16).max+1))
+            self.ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+            with open(str(self.directory / TICKERS_FILENAME), 'w') as tickers_file:
+                json.dump(self.tickers, tickers_file)
+        return self.ticker_ids[ticker]
+
+    def record(self, ticker_id, timestamp, price):
+        self.pending.append((ticker_id, timestamp, price))
+
+    def flush(self):
+        """Writes everything recorded so far to disk. Only the writer thread calls this
+        until close() has stopped it."""
+        count = len(self.pending)
+        if count == 0:
+            return
+        ticker_ids = np.empty(count, dtype='<u2')
+        timestamps = np.empty(count, dtype='<i8')
+        prices = np.empty(count, dtype='<f8')
+        for i in range(count):
+            ticker_ids[i], timestamps[i], prices[i] = self.pending.popleft()
+        # write the columns in the same order every time, so a crash leaves at
+        # worst a few trailing rows that the reader will ignore
+        for (filename, _), column in zip(COLUMNS, [timestamps, ticker_ids, prices]):
+            with open(str(self.directory / filename), 'ab') as column_file:
+                column.tofile(column_file)
+        self.num_recorded += count
+
+    def write_until_stopped(self):
+        while not self.stopped.wait(self.FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self):
+        """Stops the writer, flushes what's left and builds the per-ticker index."""
+        self.stopped.set()
+        self.writer_thread.join()
+        self.flush()
+        build_index(self.directory)
+        print_with_lock("recorded {} trades to {}".format(self.num_recorded, self.directory))
+
+
+def _open_column(directory, filename, dtype, num_rows=None):
+    path = pathlib.Path(directory) / filename
+    if not path.exists() or path.stat().st_size == 0:
+        return np.empty(0, dtype=dtype)
+    column = np.memmap(str(path), dtype=dtype, mode='r')
+    if num_rows is not None:
+        column = column[:num_rows]
+    return column
+
+def _count_complete_rows(directory):
+    """Rows present in all three columns. Anything past that was cut off mid-flush."""
+    sizes = []
+    for filename, dtype in COLUMNS:
+        path = pathlib.Path(directory) / filename
+        sizes.append(path.stat().st_size // np.dtype(dtype).itemsize if path.exists() else 0)
+    return min(sizes)
+
+def build_index(directory):
+    """Writes index.i8 and offsets.i8 for a day's recording with a counting sort,
+    one chunk at a time, so it works on files much larger than RAM."""
+    directory = pathlib.Path(directory)
+    with open(str(directory / TICKERS_FILENAME)) as tickers_file:
+        num_tickers = len(json.load(tickers_file))
+    num_rows = _count_complete_rows(directory)
+    ticker_ids = _open_column(directory, TICKER_IDS_FILENAME, '<u2', num_rows)
+
+    # first pass: how many trades each ticker has, and so where each group starts
+    counts = np.zeros(num_tickers, dtype=np.int64)
+    for start in range(0, num_rows, CHUNK_SIZE):
+        counts += np.bincount(ticker_ids[start:start+CHUNK_SIZE], minlength=num_tickers)[:num_tickers]
+    offsets = np.zeros(num_tickers+1, dtype='<i8')
+    np.cumsum(counts, out=offsets[1:])
+
+    # second pass: drop each row number into the next free slot of its ticker's group.
+    # a stable sort within each chunk keeps every group in time order
+    if num_rows == 0:
+        open(str(directory / INDEX_FILENAME), 'wb').close()
+        offsets.tofile(str(directory / OFFSETS_FILENAME))
+        return
+    index = np.memmap(str(directory / INDEX_FILENAME), dtype='<i8', mode='w+', shape=(num_rows,))
+    cursors = offsets[:-1].copy()
+    for start in range(0, num_rows, CHUNK_SIZE):
+        chunk = np.asarray(ticker_ids[start:start+CHUNK_SIZE])
+        order = np.argsort(chunk, kind='stable')
+        sorted_ids = chunk[order]
+        chunk_counts = np.bincount(sorted_ids, minlength=num_tickers)
+        chunk_starts = np.zeros(num_tickers, dtype=np.int64)
+        np.cumsum(chunk_counts[:-1], out=chunk_starts[1:])
+        rank_in_group = np.arange(len(chunk)) - chunk_starts[sorted_ids]
+        index[cursors[sorted_ids] + rank_in_group] = order + start
+        cursors += chunk_counts
+    index.flush()
+
+    # offsets go last, readers only trust the index once they exist
+    offsets.tofile(str(directory / OFFSETS_FILENAME))
+
+
+class TickReader:
+    """Reads a day of trades written by TickRecorder, without loading it all into RAM."""
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        with open(str(self.directory / TICKERS_FILENAME)) as tickers_file:
+            self.tickers = json.load(tickers_file)
+        self.ticker_ids = { ticker: i for i, ticker in enumerate(self.tickers) }
+        self.num_rows = _count_complete_rows(self.directory)
+        self.timestamps = _open_column(self.directory, TIMESTAMPS_FILENAME, '<i8', self.num_rows)
+        self.ticker_id_column = _open_column(self.directory, TICKER_IDS_FILENAME, '<u2', self.num_rows)
+        self.prices = _open_column(self.directory, PRICES_FILENAME, '<f8', self.num_rows)
+
+        # the index is only there if the recorder was closed cleanly
+        self.index = None
+        self.offsets = None
+        if (self.directory / OFFSETS_FILENAME).exists():
+            self.index = _open_column(self.directory, INDEX_FILENAME, '<i8')
+            self.offsets = _open_column(self.directory, OFFSETS_FILENAME, '<i8')
+            if len(self.index) != self.num_rows:
+                self.index = None
+                self.offsets = None
+
+    def __len__(self):
+        return self.num_rows
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Yields (timestamps, ticker_ids, prices) memmapped array slices in recorded order."""
+        for start in range(0, self.num_rows, chunk_size):
+            end = start + chunk_size
+            yield self.timestamps[start:end], self.ticker_id_column[start:end], self.prices[start:end]
+
+    def __iter__(self):
+        return self.iter_trades()
+
+    def iter_trades(self, chunk_size=CHUNK_SIZE):
+        """Yields (timestamp_ns, ticker, price) for every trade in recorded order."""
+        tickers = self.tickers
+        for timestamps, ticker_ids, prices in self.iter_chunks(chunk_size):
+            for timestamp, ticker_id, price in zip(timestamps.tolist(), ticker_ids.tolist(), prices.tolist()):
+                yield timestamp, tickers[ticker_id], price
+
+    def get_trades_for_ticker(self, ticker):
+        """Returns (timestamps, prices) arrays holding every trade of one ticker, in time order."""
+        ticker_id = self.ticker_ids[ticker]
+        if self.index is None:
+            # no index, fall back to a scan
+            rows = np.concatenate([np.flatnonzero(ticker_ids == ticker_id) + start
+                for start, (_, ticker_ids, _) in zip(range(0, self.num_rows, CHUNK_SIZE), self.iter_chunks())] or [np.empty(0, dtype=np.int64)])
+        else:
+            rows = self.index[self.offsets[ticker_id]:self.offsets[ticker_id+1]]
+        return self.timestamps[rows], self.prices[rows]
+
+    def get_first_price_for_ticker(self, ticker):
+        _, prices = self.get_trades_for_ticker(ticker)
+        return float(prices[0]) if len(prices) else None
+
+    def get_first_prices(self):
+        """Returns { ticker: price } of every ticker's first recorded trade."""
+        first_rows = np.full(len(self.tickers), -1, dtype=np.int64)
+        if self.index is not None:
+            has_trades = self.offsets[1:] > self.offsets[:-1]
+            first_rows[has_trades] = self.index[self.offsets[:-1][has_trades]]
+        else:
+            # no index, stop scanning once every ticker has turned up
+            for start, (_, ticker_ids, _) in zip(range(0, self.num_rows, CHUNK_SIZE), self.iter_chunks()):
+                ids, rows = np.unique(np.asarray(ticker_ids), return_index=True)
+                new = first_rows[ids] < 0
+                first_rows[ids[new]] = start + rows[new]
+                if first_rows.min(initial=0) >= 0:
+                    break
+        return { self.tickers[i]: float(self.prices[first_rows[i]]) for i in np.flatnonzero(first_rows >= 0).tolist() }
+
+    def get_time_range(self):
+        """Returns the (earliest, latest) timestamp recorded. Trades are in the order they
+        came off the stream, which isn't quite time order across tickers, so these
+        aren't necessarily the first and last rows."""
+        return int(self.timestamps.min()), int(self.timestamps.max())
+
+    def get_last_prices(self):
+        """Returns { ticker: price } of every ticker's last recorded trade."""
+        last_rows = np.full(len(self.tickers), -1, dtype=np.int64)
+        if self.index is not None:
+            # each ticker's group is in time order, so its last row is the group's last
+            has_trades = self.offsets[1:] > self.offsets[:-1]
+            last_rows[has_trades] = self.index[self.offsets[1:][has_trades] - 1]
+        else:
+            # no index, the first of each ticker id in a reversed chunk is its last in the chunk
+            for start, (_, ticker_ids, _) in zip(range(0, self.num_rows, CHUNK_SIZE), self.iter_chunks()):
+                ids, reversed_rows = np.unique(np.asarray(ticker_ids)[::-1], return_index=True)
+                last_rows[ids] = start + len(ticker_ids) - 1 - reversed_rows
+        return { self.tickers[i]: float(self.prices[last_rows[i]]) for i in np.flatnonzero(last_rows >= 0).tolist() }
+
+
+def find_last_prices(root, tickers):
+    """Returns { ticker: price } of the last trade recorded under root for each of
+    tickers that has one, going back a day at a time for any the latest day lacks."""
+    root = pathlib.Path(root)
+    if not root.is_dir():
+        return {}
+    missing = set(tickers)
+    prices = {}
+    # iso dates sort chronologically
+    for directory in sorted(root.iterdir(), reverse=True):
+        if len(missing) == 0:
+            break
+        if not (directory / TICKERS_FILENAME).exists():
+            continue
+        for ticker, price in TickReader(directory).get_last_prices().items():
+            if ticker in missing:
+                prices[ticker] = price
+                missing.discard(ticker)
+    return prices
@@ -0,0 +1,285 @@
+"""Class module for the per-ticker trading state shared by every trading engine."""
+
+from datetime import timedelta
+import time
+import threading
+
+from position import OpenPaperPosition, OpenStockPosition
+from metrics import metrics
+from utilities import print_with_lock
+from traderbot_exception import TraderbotException, PartialCloseException, OrderStateUnknownException
+
+class Trader:
+    """Manages the trading of exactly one ticker with one strategy.
+
+    Holds all of the buy/sell state and reporting, but no scheduling of its own:
+    subclasses decide how to wait for new trades (an OS thread, a coroutine...)."""
+    # lock to keep everything in order during construction
+    ctor_lock = threading.Lock()
+
+    # true constants -- don't buy with less than 1 dollar
+    BUDGET_THRESHHOLD = 1.00
+
+    # max seconds to sleep waiting for a trade before rechecking the time left
+    TICK_TIMEOUT = 1.0
+
+    # these must be reader locked. they are updated by the outer thread
+    market_data = {}
+    market_time = {}
+    buying_power = {}
+    trade_capper = {}
+    reports = {}
+
+    # classwide constants (after initialization)
+    take_profit_percent = 0.01
+    max_loss_percent = 0.01
+    paper_trading = True
+
+    def __init__(self, ticker, market_data, market_time, buying_power, trade_capper, strategy, reports, take_profit_percent, max_loss_percent, paper_trading=True):
+        # safety first when setting class variables
+        with self.ctor_lock:
+            # set shared concurrent data
+            Trader.market_data = market_data
+            Trader.market_time = market_time
+            Trader.buying_power = buying_power
+            Trader.trade_capper = trade_capper
+            Trader.take_profit_percent = take_profit_percent
+            Trader.max_loss_percent = max_loss_percent
+            Trader.paper_trading = paper_trading
+            Trader.reports = reports
+
+        self.ticker = ticker
+        self.position = None
+        self.strategy = strategy
+
+        # number of trades on our ticker we've already acted on
+        self.last_trade_seen = 0
+
+        # will be overridden on run()
+        self.init_time = market_time.now()
+
+        # tracks the following information:
+        # {
+        #     "open_time": <timestamp>,
+        #     "close_time": <timestamp>,
+        #     "quantity": <quantity>,
+        #     "open_price": <price>,
+        #     "close_price": <price>
+        # }
+        self.statistics = []
+
+        # net profit/loss
+        self.net = 0.0
+        
+    def make_position(self, budget):
+        """Opens and returns a position worth budget dollars of our ticker. Blocks until filled."""
+        if self.paper_trading:
+            return OpenPaperPosition(self.ticker, budget, self.market_data)
+        return OpenStockPosition(self.ticker, budget)
+
+    def open_position(self):
+        # reserve the trades first, so however many threads (or processes) get here
+        # at once, only as many as the cap allows go on to spend anything
+        if not self.trade_capper.make_trade():
+            return
+        # do not buy if we're out of funds!
+        budget = self.buying_power.spend_and_get_amount()
+        if budget < self.BUDGET_THRESHHOLD:
+            # don't make trades for under a certain threshhold
+            self.buying_power.refund(budget)
+            self.trade_capper.cancel_trade()
+            return
+        # if the order timed out or was rejected for some other reason
+        # then try again when next relevant
+        try:
+            self.position = self.make_position(budget)
+        except OrderStateUnknownException as ouse:
+            # the order may still fill, so the budget and the trades stay spent
+            print_with_lock("open position exception:", str(ouse))
+            self.position = None
+            return
+        except TraderbotException as te:
+            print_with_lock("open position exception:", str(te))
+            self.position = None
+            # nothing was bought, so the budget and the trades are still ours to spend
+            self.buying_power.refund(budget)
+            self.trade_capper.cancel_trade()
+            return
+        # a partial fill leaves some of the budget unspent
+        if self.position.unspent > 0.0:
+            self.buying_power.refund(self.position.unspent)
+
+        # update statistics
+        self.statistics.append({
+            "open_time": self.market_time.now(),
+            "quantity": self.position.get_quantity(),
+            "open_price": self.position.get_open_price(),
+            "close_time": -1,
+            "close_price": -1
+        })
+
+    def close_position(self):
+        close_price = 0.0
+        try:
+            close_price = self.position.close()
+        except PartialCloseException as pce:
+            print_with_lock("close position exception:", str(pce))
+            # what did sell is ours to spend again, the rest is still our position
+            self.buying_power.add_funds(pce.proceeds)
+            self.net += pce.proceeds - pce.sold_quantity*self.position.get_open_price()
+            # the part that sold is a closed trade of its own, the rest stays open
+            opened = self.statistics[-1]
+            opened["quantity"] = pce.sold_quantity
+            opened["close_time"] = self.market_time.now()
+            opened["close_price"] = pce.proceeds/pce.sold_quantity
+            self.statistics.append({
+                "open_time": opened["open_time"],
+                "quantity": self.position.get_quantity(),
+                "open_price": opened["open_price"],
+                "close_time": -1,
+                "close_price": -1
+            })
+            return
+        except TraderbotException as te:
+            print_with_lock("close position exception:", str(te))
+            return
+        ts = self.market_time.now()
+        qty = self.position.get_quantity()
+        self.buying_power.add_funds(close_price*qty)
+
+        # update statistics
+        self.statistics[-1]["close_time"] = ts
+        self.statistics[-1]["close_price"] = close_price
+        self.net += ((close_price - self.position.get_open_price()) * self.position.get_quantity())
+        self.position = None
+
+    def wants_to_buy(self):
+        """True while there is time left, trades left and no open position."""
+        return self.market_time.is_time_left_to_trade() and self.trade_capper.are_trades_left() and self.position is None
+
+    def wants_to_sell(self):
+        """True while there is time left and an open position."""
+        return self.market_time.is_time_left_to_trade() and self.position is not None
+
+    def should_close_position(self):
+        """Returns whether the current price has hit our take-profit or max-loss threshholds."""
+        open_price = self.position.get_open_price()
+        current_price = self.market_data.get_data_for_ticker(self.ticker)
+        # closing for profit or closing for loss
+        return current_price >= open_price * (1+self.take_profit_percent) or current_price <= open_price * (1-self.max_loss_percent)
+
+    def should_buy_on_tick(self):
+        """Asks our strategy whether to buy on the newest trade, timing it if metrics are on."""
+        if not metrics.enabled:
+            return self.strategy.should_buy_on_tick()
+        # only the trades the trade callback sampled are timed, see TickerData.last_trade_ns
+        last_trade_ns = self.market_data.get_ticker_data_for_ticker(self.ticker).last_trade_ns
+        if last_trade_ns == 0:
+            return self.strategy.should_buy_on_tick()
+        start = time.perf_counter_ns()
+        decision = self.strategy.should_buy_on_tick()
+        end = time.perf_counter_ns()
+        metrics.record("decision", self.ticker, end - start)
+        metrics.record("tick_to_decision", self.ticker, end - last_trade_ns)
+        return decision
+
+    def record_trade_seen(self, trades_seen):
+        """Returns True and remembers the trade count if it is newer than the last one we acted on."""
+        if trades_seen == self.last_trade_seen:
+            return False
+        self.last_trade_seen = trades_seen
+        return True
+
+    def generate_report(self):
+        """Generates a report regarding this thread's success throughout the day.
+        Adds that report to the shared reports object."""
+        # ticker
+        # strategy
+        # net
+        # first and last price seen
+        # how long traded for
+        # how long held for
+        # total trades (1 open plus 1 close = 1 trade)
+        # total unprofitable trades
+        # total profitable trades
+        # total neutral trades
+        # profit percent
+        # best trade
+        # worst trade
+        last = self.market_data.get_data_for_ticker(self.ticker)
+        eod_time = self.market_time.now()
+        first = self.market_data.get_first_price_of_day_for_ticker(self.ticker)
+        num_profitable = 0
+        num_unprofitable = 0
+        num_neutral = 0
+        for stat in self.statistics:
+            if stat['close_price'] > stat['open_price']:
+                num_profitable += 1
+            elif stat['close_price'] < stat['open_price']:
+                num_unprofitable += 1
+            else:
+                num_neutral += 1
+        
+
+        report = {
+            "ticker": self.ticker,
+            "strategy": self.strategy.get_name(),
+            "traderbot net performance": self.net,
+            "total thread lifetime": str(eod_time - self.init_time),
+            "total trades made": len(self.statistics),
+            "total profitable trades": num_profitable,
+            "total unprofitable trades": num_unprofitable,
+            "total neutral trades": num_neutral,
+            "first price seen": first,
+            "last price seen": last,
+            "stock net performance": last-first,
+        }
+
+        if len(self.statistics) != 0:
+
+            report["first position opened at"] = str(self.statistics[0]['open_time'].time())
+            report["last position closed at"] = str(self.statistics[-1]['close_time'].time())
+
+            def add_times(s1, mic1, s2, mic2):
+                secs = s1 + s2
+                micros = mic1 + mic2
+                secs += micros / 1000000
+                micros = micros % 1000000
+                return secs, micros
+
+            time_held_secs = 0.0
+            time_held_micros = 0.0
+            best_stat = self.statistics[0]
+            worst_stat = best_stat
+            best = self.statistics[0]['close_price'] - self.statistics[0]['open_price']
+            worst = best
+            for stat in self.statistics:
+                # timedelta sucks, write our own time adder
+                td = stat['close_time'] - stat['open_time']
+                time_held_secs, time_held_micros = add_times(time_held_secs, time_held_micros, td.seconds, td.microseconds)
+
+                # also of course find best and worst trade
+                margin = stat['close_price'] - stat['open_price']
+                if margin > best:
+                    best = margin
+                    best_stat = stat
+                if margin < worst:
+                    worst = margin
+                    worst_stat = stat
+
+            time_held = timedelta(seconds=time_held_secs, microseconds=time_held_micros)
+            report["time held for"] = str(time_held)
+
+            # avoid the strange bug where best and worst trade are same
+            # so we call .time() on a string in report["worst trade"]["open_time"].time()
+            if abs(best - worst) > .001:
+                report["best trade"] = best_stat
+                report["best trade"]["open_time"] = str(report["best trade"]["open_time"].time())
+                report["best trade"]["close_time"] = str(report["best trade"]["close_time"].time())
+                report["best trade"]["net_profit"] = best
+                report["worst trade"] = worst_stat
+                report["worst trade"]["open_time"] = str(report["worst trade"]["open_time"].time())
+                report["worst trade"]["close_time"] = str(report["worst trade"]["close_time"].time())
+                report["worst trade"]["net_profit"] = worst
+        
+        self.reports.add_eod_report(report)
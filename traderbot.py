@@ -1,29 +1,17 @@
 import time
-import json
-import pathlib
 import sys
-from datetime import datetime, date, timedelta
+import platform
+from datetime import datetime, timedelta
 from random import randrange
 import threading
-import re
-import pprint
-
-import requests
-import robin_stocks.robinhood as r
-import pandas as pd
-import pandas_market_calendars as mcal
-import pyotp
-from alpaca_trade_api.stream import Stream
-import yfinance as yf
-
-from trading_thread import TradingThread
-from singletons.market_data import MarketData, TickerData
-from singletons.market_time import MarketTime
-from singletons.buying_power import BuyingPower
-from singletons.trade_capper import TradeCapper
-from singletons.reports import Reports
-from strategies.strategy_factory import strategy_factory, enforce_strategy_dict_legal
-from utilities import print_with_lock, enforce_keys_in_dict
+from concurrent.futures import ThreadPoolExecutor
+
+# only what --check-config needs is imported up here. the trading stack (numpy,
+# robin_stocks, alpaca, pandas...) is imported by run_traderbot, and each heavy
+# dependency by the part of the stack that uses it
+from strategies.strategy_factory import enforce_strategy_dict_legal
+from logger import log, LEVELS
+from utilities import print_with_lock, enforce_keys_in_dict, read_config
 from traderbot_exception import ConfigException
 
 # all filescope constants will be configured in the config.json
@@ -92,45 +80,29 @@ def generate_humanlike_parameters():
 
     return todays_start_time, todays_end_time, todays_trade_cap
 
-def get_next_market_open_time():
-    """Based on the current time, gets the next time the market will be open.
-    
-    If the market is open today, returns today's market open time. Returns a pandas.Timestamp object.
-    Time returned is in UTC."""
-    # assume NYSE, we aren't doing crazy shit here
-    nyse = mcal.get_calendar('NYSE')
-    
-    # market never closes for a week, get first time open in the next week
-    today = date.today()
-    in_one_week = today + timedelta(days=7)
-
-    # format as YYYY-MM-DD for mcal
-    # fmt = "%Y-%m-%d" # unnecessary, at least with EST
-    sched = nyse.schedule(start_date=today, end_date=in_one_week)
-    next_market_open = sched['market_open'][0] # keep it as UTC for most calculations
-    return next_market_open.to_pydatetime().replace(tzinfo=None)
-
-def get_time_until_market_open():
-    """Return the amount of time until the market reopens."""
-    next_open = get_next_market_open_time()
-    # returns time in utc, so use utc as well
-    now = datetime.utcnow()
-    time_until_open = next_open - now
-    return time_until_open
-    
-def block_until_market_open():
-    """Block until market open.
+def get_next_market_open_time(calendar):
+    """Based on the current time, gets the next time the market will be open, from
+    calendar (a MarketCalendar). If the market is open today, returns today's market
+    open time. Time returned is a naive datetime in UTC."""
+    return datetime.utcfromtimestamp(calendar.get_next_open())
+
+
+def sleep_until(deadline, now, print_every, message):
+    """Sleeps until the datetime deadline, according to now() (a callable returning a
+    datetime comparable to deadline). Prints message and the time remaining every print_every.
     
-    Does pre-market work as soon as the loop is entered, exactly once."""
-    time_until_open = get_time_until_market_open()
+    Waking up every so often also catches the system clock being changed underneath us."""
     zero_time = timedelta()
-    last_print = time_until_open
-    while time_until_open > zero_time:
-        if last_print - time_until_open > timedelta(hours=1):
-            print_with_lock("still waiting until market open. time remaining:", time_until_open)
-            last_print = time_until_open
-        # update timedelta
-        time_until_open = get_time_until_market_open()
+    time_left = deadline - now()
+    while time_left > zero_time:
+        print_with_lock(message, time_left)
+        time.sleep(min(time_left, print_every).total_seconds())
+        time_left = deadline - now()
+
+def block_until_market_open(next_open):
+    """Block until market open, next_open being the result of get_next_market_open_time(calendar)."""
+    # next open is in utc, so use utc as well
+    sleep_until(next_open, datetime.utcnow, timedelta(hours=1), "still waiting until market open. time remaining:")
     print_with_lock("market is open")
 
 def block_until_start_trading():
@@ -140,62 +112,116 @@ def block_until_start_trading():
     updated in this loop."""
     now = datetime.now()
     start_of_day_datetime = datetime(now.year, now.month, now.day, START_OF_DAY.hour, START_OF_DAY.minute, START_OF_DAY.second, START_OF_DAY.microsecond)
-    time_until_start_trading = start_of_day_datetime - now
-    zero_time = timedelta()
-    last_print = time_until_start_trading
-    while time_until_start_trading > zero_time:
-        if last_print - time_until_start_trading > timedelta(minutes=5):
-            print_with_lock("market is open. will start trading in: ", time_until_start_trading)
-            last_print = time_until_start_trading
-        time_until_start_trading = start_of_day_datetime - datetime.now()
+    sleep_until(start_of_day_datetime, datetime.now, timedelta(minutes=5), "market is open. will start trading in: ")
     print_with_lock("beginning trading")
 
 def log_in_to_robinhood():
-    # only use mfa login if it is enabled
-    mfa_code=None
-    if "mfa-setup-code" in CONFIG.keys():
-        # gets current mfa code
-        totp = pyotp.TOTP(CONFIG["mfa-setup-code"]).now()
-        print_with_lock("DEBUG: current mfa code:", totp)
-    login = r.login(USERNAME, PASSWORD, mfa_code=mfa_code)
-    print_with_lock("logged in as user {}".format(USERNAME))
-    return login
+    """Returns the logged in RobinhoodSession, see session.py."""
+    from session import RobinhoodSession
+    session = RobinhoodSession.from_config(CONFIG)
+    session.log_in()
+    return session
 
 def get_json_dict():
     """Return the json dictionary found in config.json, throwing otherwise.
     """
+    data = read_config(CONFIG_FILENAME)
+    necessary_config_fields = [
+        "username",
+        "password",
+        "paper-trading",
+        "max-loss-percent",
+        "take-profit-percent",
+        "spend-percent",
+        "alpaca-api-key",
+        "alpaca-secret-key",
+        "strategies"
+    ]
+    enforce_keys_in_dict(necessary_config_fields, data)
+
+    # TODO enforce that all tickers are all real & tradeable
+    return data
+
+def check_config(config):
+    """Raises ConfigException if anything in config (the parsed config.json) is illegal.
+    Imports nothing heavy, so it's quick to run on its own, see --check-config."""
+    for key in ["start-of-day", "end-of-day"]:
+        try:
+            datetime.strptime(config.get(key, "09:30"), "%H:%M")
+        except (TypeError, ValueError):
+            raise ConfigException("{} must be a time like \"09:30\", {} was entered".format(key, config[key]))
+    history_len = config.get("history-len", 16)
+    trend_len = config.get("trend-len", 3)
+    if trend_len < 2:
+        raise ConfigException("trend-len must be at least 2, {} was entered".format(trend_len))
+    if trend_len > history_len:
+        raise ConfigException("trend-len must be less than or equal to history-len")
+    engine = config.get("engine", "threads")
+    if engine not in ["threads", "asyncio"]:
+        raise ConfigException("engine must be one of \"threads\" or \"asyncio\", {} was entered".format(engine))
+    stream_shards = config.get("stream-shards", 1)
+    if stream_shards < 1:
+        raise ConfigException("stream-shards must be at least 1, {} was entered".format(stream_shards))
+    # the shards write quotes into one shared QuoteBook, whose seqlock needs x86 memory ordering
+    if stream_shards > 1 and config.get("subscribe-quotes", False) and platform.machine().lower() not in ["x86_64", "amd64", "i386", "i686", "x86"]:
+        raise ConfigException("stream-shards above 1 with subscribe-quotes needs an x86 machine, this is {}".format(platform.machine()))
+    startup_workers = config.get("startup-workers", 16)
+    if startup_workers < 1:
+        raise ConfigException("startup-workers must be at least 1, {} was entered".format(startup_workers))
+    log_level = config.get("log-level", "info")
+    if log_level not in LEVELS:
+        raise ConfigException("log-level must be one of {}, {} was entered".format(list(LEVELS.keys()), log_level))
+    log_format = config.get("log-format", "text")
+    if log_format not in ["text", "json"]:
+        raise ConfigException("log-format must be one of \"text\" or \"json\", {} was entered".format(log_format))
+    metrics_port = config.get("metrics-port", None)
+    if metrics_port is not None and (not isinstance(metrics_port, int) or not 0 <= metrics_port <= 65535):
+        raise ConfigException("metrics-port must be a port number, {} was entered".format(metrics_port))
+    if not isinstance(config["strategies"], list) or len(config["strategies"]) == 0:
+        raise ConfigException("strategies must be a list of at least one strategy, see the readme")
+    for st in config["strategies"]:
+        enforce_keys_in_dict(['strategy', 'tickers'], st)
+        enforce_strategy_dict_legal(st['strategy'])
+
+def check_config_and_exit():
+    """--check-config: checks config.json without logging in or importing the trading stack."""
     try:
-        path_to_conf = pathlib.Path(CONFIG_FILENAME)
-        with open(str(path_to_conf)) as json_file:
-            data = json.load(json_file)
-        
-        necessary_config_fields = [
-            "username",
-            "password",
-            "paper-trading",
-            "max-loss-percent",
-            "take-profit-percent",
-            "spend-percent",
-            "alpaca-api-key",
-            "alpaca-secret-key",
-            "strategies"
-        ]
-        enforce_keys_in_dict(necessary_config_fields, data)
-
-        # TODO enforce that all tickers are all real & tradeable
-        return data
-    except FileNotFoundError:
-        raise ConfigException("error: config.json file not found in current directory")
+        config = get_json_dict()
+        check_config(config)
+    except ConfigException as ce:
+        print("config.json is invalid:", ce.message)
+        sys.exit(1)
+    num_tickers = len(set(ticker for st in config["strategies"] for ticker in st['tickers']))
+    print("config.json is valid: {} strategies across {} tickers".format(len(config["strategies"]), num_tickers))
+    sys.exit(0)
 
 def run_traderbot():
     """Main function for this module.
     
-    Spawns a thread for each ticker that trades on that symbol
-    for the duration of the day."""
+    Spawns a thread (or, with "engine": "asyncio", a coroutine) for each 
+    ticker that trades on that symbol for the duration of the day."""
+    from trading_thread import TradingThread
+    from async_trading_engine import AsyncTrader, AsyncTradingEngine
+    from singletons.market_data import MarketData
+    from singletons.sharded_market_data import ShardedMarketData
+    from singletons.price_snapshot import PriceSnapshot
+    from tick_store import TickRecorder
+    from singletons.market_time import MarketTime
+    from singletons.market_calendar import MarketCalendar
+    from singletons.buying_power import BuyingPower
+    from singletons.trade_capper import TradeCapper
+    from singletons.reports import Reports
+    from singletons.historical_data import HistoricalData
+    from strategies.day_moving_average import DayMovingAverage
+    from strategies.strategy_factory import strategy_factory
+    from metrics import metrics
+    from utilities import Timeline
+
     # get info from config file and log in
     global USERNAME, PASSWORD, PAPER_TRADING, TIME_ZONE
     global START_OF_DAY, END_OF_DAY, TRADE_LIMIT, CONFIG
     CONFIG = get_json_dict()
+    check_config(CONFIG)
     USERNAME = CONFIG["username"]
     PASSWORD = CONFIG["password"]
     MAX_LOSS_PERCENT = CONFIG["max-loss-percent"]/100.0
@@ -215,25 +241,47 @@ def run_traderbot():
     ALPACA_SECRET_KEY = CONFIG["alpaca-secret-key"]
     STRATEGIES_DICT = CONFIG["strategies"]
     HISTORY_SIZE = CONFIG.get("history-len", 16)
-    if not ((HISTORY_SIZE & (HISTORY_SIZE-1) == 0) and HISTORY_SIZE != 0): 
-        raise ConfigException("history-len must be a power of two, {} was entered".format(HISTORY_SIZE))
     TREND_SIZE = CONFIG.get("trend-len", 3)
-    if TREND_SIZE > HISTORY_SIZE:
-        raise ConfigException("trend-len must be less than or equal to history-len")
     IS_INSTANT_ACCT = CONFIG.get("instant", False)
-
-    zero_time = timedelta()
-
-    login = log_in_to_robinhood()
-
-    # get list of unique tickers and enforce legality of strategies kv in the config
+    ENGINE = CONFIG.get("engine", "threads")
+    RECORD_TRADES_DIR = CONFIG.get("record-trades", None)
+    HISTORICAL_DATA_CACHE_DIR = CONFIG.get("historical-data-cache", DayMovingAverage.DEFAULT_CACHE_DIR)
+    STARTUP_WORKERS = CONFIG.get("startup-workers", 16)
+    STREAM_SHARDS = CONFIG.get("stream-shards", 1)
+    SUBSCRIBE_QUOTES = CONFIG.get("subscribe-quotes", False)
+    log.configure(LEVELS[CONFIG.get("log-level", "info")], CONFIG.get("log-format", "text") == "json", CONFIG.get("log-file", None))
+    METRICS_PORT = CONFIG.get("metrics-port", None)
+    if METRICS_PORT is not None:
+        metrics.enable()
+        metrics.serve(METRICS_PORT)
+
+    # where the time before trading goes, printed once we're ready to trade
+    timeline = Timeline()
+
+    with timeline.step("log in to RH"):
+        session = log_in_to_robinhood()
+
+    # get list of unique tickers, check_config already enforced the strategies are legal
     ALL_TICKERS = []
     for st in STRATEGIES_DICT:
-        enforce_keys_in_dict(['strategy', 'tickers'], st)
-        enforce_strategy_dict_legal(st['strategy'])
         ALL_TICKERS.extend(st['tickers'])
     ALL_TICKERS = list(set(ALL_TICKERS))
 
+    # download every ticker's historical bars up front, in a handful of batched requests
+    HISTORICAL_TICKERS = [ticker for st in STRATEGIES_DICT if st['strategy']['name'] == "HistoricalMovingAverage" for ticker in st['tickers']]
+    if len(HISTORICAL_TICKERS) != 0:
+        with timeline.step("download historical data"):
+            historical_data = HistoricalData(HISTORICAL_DATA_CACHE_DIR)
+            historical_data.prefetch(HISTORICAL_TICKERS)
+            DayMovingAverage.use_historical_data(historical_data)
+
+    # stop at today's actual close, early or not, unless end-of-day says to stop sooner
+    with timeline.step("load the NYSE calendar"):
+        calendar = MarketCalendar(HISTORICAL_DATA_CACHE_DIR)
+    todays_close = datetime.fromtimestamp(calendar.get_close()).time()
+    if "end-of-day" not in CONFIG or todays_close < END_OF_DAY:
+        END_OF_DAY = todays_close
+
     # generate parameters so we don't get flagged
     START_OF_DAY, END_OF_DAY, TRADE_LIMIT = generate_humanlike_parameters()
     datetime_fmt_str = '%H:%M:%S'
@@ -246,62 +294,92 @@ def run_traderbot():
     print_with_lock("param: will stop trading today at:", END_OF_DAY)
     print_with_lock("param: will make a maximum of {} trades today".format(TRADE_LIMIT))
 
-    # busy-spin until market open
-    block_until_market_open()
+    # sleep until market open
+    with timeline.step("wait for market open"):
+        block_until_market_open(get_next_market_open_time(calendar))
 
     # these variables are shared by each trading thread. they are written by this
     # main traderbot thread, and read by each trading thread individually
-    market_data = MarketData(ALL_TICKERS, ALPACA_KEY, ALPACA_SECRET_KEY, HISTORY_SIZE, TREND_SIZE)
-    buying_power = BuyingPower(SPEND_PERCENT, IS_INSTANT_ACCT, BUDGET)
+    with timeline.step("initialize market data"):
+        # tickers RH has no price for start from the last one we recorded, if we record
+        price_snapshot = PriceSnapshot(RECORD_TRADES_DIR, max_workers=STARTUP_WORKERS)
+        if STREAM_SHARDS == 1:
+            market_data = MarketData(ALL_TICKERS, ALPACA_KEY, ALPACA_SECRET_KEY, HISTORY_SIZE, TREND_SIZE, subscribe_quotes=SUBSCRIBE_QUOTES, price_snapshot=price_snapshot)
+        else:
+            market_data = ShardedMarketData(ALL_TICKERS, ALPACA_KEY, ALPACA_SECRET_KEY, HISTORY_SIZE, TREND_SIZE, STREAM_SHARDS, subscribe_quotes=SUBSCRIBE_QUOTES, price_snapshot=price_snapshot)
+    recorder = None
+    if RECORD_TRADES_DIR is not None:
+        recorder = TickRecorder(RECORD_TRADES_DIR)
+        market_data.attach_recorder(recorder)
+        print_with_lock("param: recording trades to {}".format(recorder.directory))
+    if metrics.enabled:
+        market_data.enable_metrics(metrics)
+    with timeline.step("load buying power"):
+        buying_power = BuyingPower(SPEND_PERCENT, IS_INSTANT_ACCT, BUDGET)
     trade_capper = TradeCapper(TRADE_LIMIT)
 
     # now that market open is today, update EOD for time checking
-    now = datetime.now()
-    END_OF_DAY = datetime(now.year, now.month, now.day, END_OF_DAY.hour, END_OF_DAY.minute, END_OF_DAY.second, END_OF_DAY.microsecond)
-    market_time = MarketTime(END_OF_DAY)
+    market_time = MarketTime.from_calendar(calendar, END_OF_DAY)
+    market_time.add_close_callback(market_data.stop_waiting)
     reports = Reports()
 
-    # spawn thread for each ticker
-    threads = []
-    for st in STRATEGIES_DICT:
-        strategy_dict = st['strategy']
-        tickers = st['tickers']
-        for ticker in tickers:
+    # spawn thread (or coroutine) for each ticker. strategies can do I/O when
+    # constructed, so build them in a pool instead of one at a time
+    trader_class = AsyncTrader if ENGINE == "asyncio" else TradingThread
+    def make_trader(strategy_dict, ticker):
+        with timeline.step(ticker, group="construct strategies"):
             print_with_lock("initializing thread {} with strategy configuration {}".format(ticker, strategy_dict))
             strategy = strategy_factory(strategy_dict, market_data, ticker)
             if not strategy.is_relevant():
                 # don't add irrelevant tickers to the threadpool.
                 # long term could figure out how to remove this
                 # from the market data object too
-                continue
-            threads.append(TradingThread(ticker, market_data, market_time, buying_power, trade_capper, strategy, reports, TAKE_PROFIT_PERCENT, MAX_LOSS_PERCENT, PAPER_TRADING))
-
-    # busy spin until we decided to start trading
+                strategy.release()
+                return None
+            return trader_class(ticker, market_data, market_time, buying_power, trade_capper, strategy, reports, TAKE_PROFIT_PERCENT, MAX_LOSS_PERCENT, PAPER_TRADING)
+    strategy_tickers = [(st['strategy'], ticker) for st in STRATEGIES_DICT for ticker in st['tickers']]
+    with ThreadPoolExecutor(max_workers=STARTUP_WORKERS) as executor:
+        traders = executor.map(lambda args: make_trader(*args), strategy_tickers)
+        threads = [trader for trader in traders if trader is not None]
+    timeline.print_report("STARTUP TIMELINE")
+
+    # sleep until we decided to start trading
     block_until_start_trading()
 
-    # update before we start threads to avoid mass panic
-    market_data.start_stream()
-    market_time.update()
+    if ENGINE == "asyncio":
+        # stream and every trader share the main thread's event loop
+        market_time.update()
+        AsyncTradingEngine(market_data, market_time, threads).run()
+    else:
+        # update before we start threads to avoid mass panic
+        market_data.start_stream()
+        market_time.update()
 
-    # start all threads
-    for t in threads:
-        t.start()
+        # start all threads
+        for t in threads:
+            t.start()
 
-    # update the timer in the main thread
-    while market_time.is_time_left_to_trade():
-        market_time.update()
+        # sleep until the close, which wakes any threads still waiting on a trade
+        market_time.wait_until_close()
 
-    # wait for all threads to finish
-    for t in threads:
-        t.join()
+        # wait for all threads to finish
+        for t in threads:
+            t.join()
     
+    market_data.stop_stream()
+
+    # flush the last trades and build the per-ticker index for tomorrow's backtests
+    if recorder is not None:
+        recorder.close()
+
     # now pretty print reports
     reports.print_eod_reports()
 
-    # tidy up after ourselves
-    r.logout()
+    # tidy up after ourselves, the token stays cached for tomorrow
+    session.close()
     print_with_lock("logged out user {}".format(USERNAME))
 
-# TODO figure out how to backtest this all on historical data
 if __name__ == "__main__":
+    if "--check-config" in sys.argv:
+        check_config_and_exit()
     run_traderbot()
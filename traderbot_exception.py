@@ -13,4 +13,30 @@ class ConfigException(TraderbotException):
 
 class APIException(TraderbotException):
     def __init__(self, message='your API usage was incorrect'):
-        super().__init__(message=message)
\ No newline at end of file
+        super().__init__(message=message)
+
+class PartialFillException(TraderbotException):
+    """Thrown when an order stopped (timed out or was cancelled) after only part of it
+    filled. filled_quantity and average_price describe the part that did."""
+    def __init__(self, ticker, resp):
+        self.resp = resp
+        self.filled_quantity = float(resp['cumulative_quantity'])
+        self.average_price = float(resp['average_price'])
+        super().__init__(message="order for {} was {} after filling only {} shares at {}".format(
+            ticker, resp['state'], self.filled_quantity, self.average_price))
+
+class OrderStateUnknownException(TraderbotException):
+    """Thrown when we stop waiting on an order without knowing how it ended: the
+    cancel never confirmed and RH still says it's open. It may yet fill, so
+    nothing it reserved should be handed back."""
+    def __init__(self, ticker, resp):
+        self.resp = resp
+        super().__init__(message="gave up on the order for {} without knowing whether it filled: {}".format(ticker, resp))
+
+class PartialCloseException(TraderbotException):
+    """Thrown when closing a position only sold part of it. sold_quantity shares
+    were sold for proceeds dollars in total, the rest are still held."""
+    def __init__(self, message, sold_quantity, proceeds):
+        self.sold_quantity = sold_quantity
+        self.proceeds = proceeds
+        super().__init__(message=message)
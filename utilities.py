@@ -1,16 +1,17 @@
+import json
 import threading
-import requests
-import re
+import importlib
+import time
+from contextlib import contextmanager
 
 from traderbot_exception import APIException, ConfigException
-
-_print_lock = threading.Lock()
+from logger import log
 
 def print_with_lock(*args):
-    with _print_lock:
-        for arg in args:
-            print(arg, end=' ')
-        print()
+    """Logs the args, space separated, at INFO. Despite the name there's no lock
+    any more, see logger.py, so this is fine to call from any thread. For anything
+    per tick use log.debug instead, so it can be turned off."""
+    log.info(" ".join(str(arg) for arg in args))
 
 def get_mean_stddev(arr):
     """Return mean and stddev of the given array."""
@@ -21,8 +22,78 @@ def get_mean_stddev(arr):
     stddev = (sum(square_diffs)/len(square_diffs))**0.5
     return mean, stddev
 
+def read_config(filename="config.json"):
+    """Returns the parsed config file, raising ConfigException if it's missing or malformed.
+    Relative to the current directory, so run everything from the traderbot/ dir."""
+    try:
+        with open(filename) as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        raise ConfigException("{} file not found in current directory. make sure you're running from the traderbot/ dir".format(filename))
+    except json.JSONDecodeError as jde:
+        raise ConfigException("{} file malformed: {}".format(filename, jde))
+
 def enforce_keys_in_dict(keys, dic):
     """Raises ConfigException if all keys are not in the provided dict."""
     for key in keys:
         if key not in dic.keys():
-            raise ConfigException("key {} was not found in the config. see the readme for more details")
\ No newline at end of file
+            raise ConfigException("key {} was not found in the config. see the readme for more details".format(key))
+
+class LazyModule:
+    """Stands in for a module, importing it the first time anything is looked up on it.
+    r = LazyModule("robin_stocks.robinhood") at the top of a file means the import is
+    only paid for by runs that actually call r, not by everything that imports the file."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # only called for what isn't set on us, so never for _name or _module
+        module = self._module
+        if module is None:
+            # threadsafe, import_module holds the import lock
+            module = importlib.import_module(self._name)
+            self._module = module
+        return getattr(module, attr)
+
+
+class Timeline:
+    """Threadsafe record of how long each step of a process took.
+
+    Steps given the same group (e.g. one per strategy constructed in a thread pool)
+    are summarised together in the report, since they overlap."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        # (name, group, start offset, duration), in the order they finished
+        self.steps = []
+
+    @contextmanager
+    def step(self, name, group=None):
+        """with timeline.step("login"): ... records how long the body took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.steps.append((name, group, start - self.start, end - start))
+
+    def print_report(self, title):
+        with self.lock:
+            steps = list(self.steps)
+        print_with_lock("=============================== {} ===============================".format(title))
+        groups_printed = set()
+        for name, group, offset, duration in steps:
+            if group is None:
+                print_with_lock("{:>9.3f}s  {:>9.3f}s  {}".format(offset, duration, name))
+                continue
+            if group in groups_printed:
+                continue
+            groups_printed.add(group)
+            members = [step for step in steps if step[1] == group]
+            slowest = max(members, key=lambda step: step[3])
+            print_with_lock("{:>9.3f}s  {:>9.3f}s  {} ({} steps, {:0.3f}s total, slowest was {} at {:0.3f}s)".format(
+                min(step[2] for step in members), max(step[2]+step[3] for step in members) - min(step[2] for step in members),
+                group, len(members), sum(step[3] for step in members), slowest[0], slowest[3]))
+        print_with_lock("total: {:0.3f}s".format(time.perf_counter() - self.start))